@@ -1,11 +1,29 @@
-from flask import Flask, redirect, render_template_string, request
-from bitcoin.rpc import RawProxy
+from flask import Flask, Response, jsonify, redirect, render_template_string, request, stream_template_string
+from bitcoin.rpc import JSONRPCError
+from requests.exceptions import RequestException
+from rpc import RPCClient
+from cache import CachedRPCClient, PageCache
+import notify
+import mempool
+import database
+import events
+import headers
+import rawblocks
+import search as search_module
+import functools
+import hmac
+import json
 import sqlite3
 import threading
 import time
-from requests.exceptions import ConnectionError
-import socket
+from pathlib import Path
 from datetime import datetime, timezone
+from decimal import Decimal
+
+try:
+    import orjson  # Optional, makes the JSON API faster
+except ImportError:
+    orjson = None
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -24,33 +42,283 @@ addressPrefixes = ["N"] # Include every address prefix, e.g. ["1", "3", "bc1"]
 # Database settings
 databaseLocation = "" # Leave empty to use the current directory
 
-# Function to create the RPC connection
-def create_rpc_connection():
-    return RawProxy(service_port=rpc_port, btc_conf_file=None, service_url=f'http://{rpc_user}:{rpc_password}@{rpc_host}:{rpc_port}')
-
-rpc_connection = create_rpc_connection()
-
-# Function to initialize the database
+# Indexer settings
+indexerThreads = 4  # Threads fetching blocks from the node in parallel
+indexerPrefetch = 32  # How many blocks ahead of the database writer to fetch
+indexerCommitBlocks = 100  # Blocks written per database transaction
+indexerMode = "json"  # "json" asks the node for every transaction, "raw" fetches raw blocks and decodes them locally
+
+# Address version bytes, used to work out addresses in the "raw" indexer mode
+# (see base58Prefixes in your coin's chainparams.cpp)
+pubkeyAddressVersion = 53
+scriptAddressVersion = 5
+bech32Prefix = None  # e.g. "bc" for Bitcoin, None if the coin has no segwit addresses
+
+# Bulk import settings. When blocksDirectory is set, the indexer first reads blocks straight from
+# the node's blk*.dat files, then carries on over RPC as usual.
+blocksDirectory = ""  # e.g. "/home/user/.nyancoin/blocks", leave empty to index over RPC only
+blockFileMagic = "f9beb4d9"  # Network magic that starts each block record (pchMessageStart in your coin's source)
+
+# RPC cache settings (blocks and transactions fetched from the node)
+rpcCacheEntries = 50000
+rpcCacheBytes = 256 * 1024 * 1024
+rpcCacheConfirmations = 10  # Results with fewer confirmations are dropped whenever the tip changes
+
+# New block notification settings. The node is always polled as a fallback, backing off from
+# pollMinSeconds to pollMaxSeconds while no new block turns up.
+zmqAddress = ""  # e.g. "tcp://127.0.0.1:28332" for a node started with -zmqpubhashblock (needs pyzmq)
+notifySocket = ""  # Unix socket for -blocknotify to write block hashes to, e.g. "/tmp/explorer.sock"
+notifySecret = ""  # Shared secret the /notify/block hook requires in an X-Notify-Secret header; empty turns the hook off
+pollMinSeconds = 1
+pollMaxSeconds = 30
+
+# RPC connection pool settings
+rpcPoolSize = 8  # Connections each web worker keeps open to the node
+rpcTimeout = 10  # Seconds a page waits for the node
+indexerRpcTimeout = 120  # Seconds the indexer waits for the node
+
+# Mempool settings
+mempoolSeconds = 5  # How often the mempool is refreshed between new blocks
+mempoolPageSize = 50  # Transactions per page on /mempool
+
+# Block page settings
+blockPageSize = 100  # Transactions per page on /block
+
+# Page cache settings. Rendered pages are reused until a new block is indexed or they are older
+# than pageCacheSeconds; the homepage is served stale while a fresh copy renders in the background.
+pageCacheEntries = 2000
+pageCacheBytes = 64 * 1024 * 1024
+pageCacheSeconds = 10
+
+# Live update settings. The homepage keeps itself up to date through /events; each web worker
+# checks the database for newly indexed blocks every eventsPollSeconds, however many pages are open.
+eventsPollSeconds = 1
+eventsQueueSize = 100  # Events a client may fall behind by before it's disconnected
+eventsKeepaliveSeconds = 15  # Idle connections get a comment this often so proxies keep them open
+
+# JSON API settings. Blocks and transactions with at least apiImmutableConfirmations confirmations
+# are sent with a strong ETag and may be cached for apiImmutableSeconds by browsers, proxies and
+# CDNs; everything else for apiRecentSeconds.
+apiImmutableConfirmations = 10
+apiImmutableSeconds = 365 * 24 * 60 * 60
+apiRecentSeconds = 10
+
+# Pool of connections to the node for this web worker. Nothing connects until a page needs the
+# node; page requests go through the cache and give up after rpcTimeout seconds.
+node_client = RPCClient(f'http://{rpc_user}:{rpc_password}@{rpc_host}:{rpc_port}', rpcTimeout, rpcPoolSize)
+rpc_connection = CachedRPCClient(node_client, rpcCacheEntries, rpcCacheBytes, rpcCacheConfirmations)
+
+# Fetch several blocks by height using one batch for the hashes and one for the blocks
+def get_blocks_by_height(heights, rpc=None):
+    rpc = rpc or rpc_connection
+    block_hashes = rpc.batch_call('getblockhash', [(height,) for height in heights])
+    blocks = rpc.batch_call('getblock', [(block_hash,) for block_hash in block_hashes])
+    return dict(zip(heights, blocks))
+
+# Fetch several verbose transactions in one batch
+def get_transactions(txids, rpc=None):
+    return (rpc or rpc_connection).batch_call('getrawtransaction', [(txid, True) for txid in txids])
+
+# Amounts in the outputs table are stored as integer satoshis
+COIN = 100000000
+
+def to_satoshis(value):
+    return int(round(value * COIN))
+
+def from_satoshis(satoshis):
+    return Decimal(satoshis).scaleb(-8)
+
+def database_path():
+    return f'{databaseLocation}{coinName.lower()}_explorer.db'
+
+# Function to open the explorer database for writing (only the indexer does this)
+def connect_database():
+    return sqlite3.connect(database_path(), timeout=30)
+
+# Function to initialize the database, creating or upgrading the schema as needed. WAL mode lets
+# the web workers keep reading while the indexer writes.
 def initialize_database():
-    conn = sqlite3.connect(f'{databaseLocation}{coinName.lower()}_explorer.db')
-    cursor = conn.cursor()
-
-    # Create the table if it doesn't already exist
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS address_transactions (
-        address TEXT,
-        txid TEXT,
-        value REAL,
-        type TEXT,  -- 'received' or 'sent'
-        block_height INTEGER
-    )
-    ''')
-
-    conn.commit()
+    conn = connect_database()
+    conn.execute('PRAGMA journal_mode = WAL')
+    database.migrate(conn)
     conn.close()
 
-# ensure the DB is ready
-initialize_database()
+# Each web thread keeps its own read-only connection open for as long as it lives
+read_connections = threading.local()
+
+def get_database():
+    conn = getattr(read_connections, 'conn', None)
+    if conn is None:
+        uri = Path(database_path()).resolve().as_uri() + '?mode=ro'
+        conn = sqlite3.connect(uri, uri=True, timeout=30)
+        read_connections.conn = conn
+    return conn
+
+# Hashes and times of the indexed blocks, loaded on the first request and extended as the indexer
+# adds blocks, so pages don't need to ask the node or the database for them
+header_index = headers.HeaderIndex()
+
+# Pages count confirmations from the indexed tip, so the node cache follows it: its near-tip
+# entries are dropped and cached confirmation counts move on whenever the indexer adds a block.
+# This is also how new blocks reach the web workers, however the indexer heard of them, so the
+# mempool is refreshed straight away too.
+def get_header_index():
+    header_index.refresh(get_database().cursor())
+    height = header_index.tip_height
+    if height >= 0 and rpc_connection.note_tip(height, header_index.block_hash(height)):
+        mempool_tracker.wake()
+    return header_index
+
+# Rendered pages of this web worker, keyed by route and arguments and tied to the indexed tip
+page_cache = PageCache(pageCacheEntries, pageCacheBytes, pageCacheSeconds)
+
+# Serve a route from page_cache. The decorated function renders the page from the arguments that
+# request_arguments() reads from the request, and doesn't look at the request itself, so a stale page
+# can be rendered again after the request that served it has finished. Only successful responses are
+# kept, and concurrent requests for a page that isn't cached wait for one of them to render it. The
+# X-Cache header says which it was.
+def cached_page(request_arguments, stale_while_revalidate=False):
+    def decorator(render_page):
+        @functools.wraps(render_page)
+        def wrapper():
+            arguments = request_arguments()
+            try:
+                tip = get_header_index().tip_hash()
+            except sqlite3.Error:
+                return render_page(*arguments)  # Nothing indexed yet
+            key = (render_page.__name__, arguments)
+
+            def render():
+                response = app.make_response(render_page(*arguments))
+                body = response.get_data()
+                page = (body, response.status_code, list(response.headers.items()))
+                return page, len(body) + 200, response.status_code == 200
+
+            # Revalidation runs on another thread, outside this request
+            def render_in_background():
+                with app.app_context():
+                    return render()
+
+            (body, status, headers), how = page_cache.get(key, tip, render, stale_while_revalidate,
+                                                          render_in_background)
+            response = Response(body, status=status, headers=headers)
+            response.headers['X-Cache'] = how.upper()
+            return response
+        return wrapper
+    return decorator
+
+# Look up indexed outputs, keyed by (txid, vout)
+def lookup_outputs(outpoints, cursor):
+    outputs = {}
+    for start in range(0, len(outpoints), 400):
+        chunk = outpoints[start:start + 400]
+        placeholders = ', '.join(['(?, ?)'] * len(chunk))
+        cursor.execute(f'''
+            SELECT outputs.txid, outputs.vout, outputs.value, addresses.address
+            FROM outputs LEFT JOIN addresses ON addresses.id = outputs.address_id
+            WHERE (outputs.txid, outputs.vout) IN (VALUES {placeholders})
+        ''', [item for txid, vout in chunk for item in (bytes.fromhex(txid), vout)])
+        for txid, vout, value, address in cursor.fetchall():
+            output = outputs.setdefault((txid.hex(), vout), {'value': from_satoshis(value), 'addresses': []})
+            if address is not None:
+                output['addresses'].append(address)
+    return outputs
+
+# Fetch the previous outputs spent by the inputs of the given transactions, keyed by (txid, vout).
+# The local outputs table is checked first; only outputs it doesn't know about are fetched from the node.
+def get_prevouts(txs, cursor=None, rpc=None):
+    outpoints = list(dict.fromkeys((vin['txid'], vin['vout']) for tx in txs for vin in tx['vin'] if 'txid' in vin))
+    prevouts = lookup_outputs(outpoints, cursor or get_database().cursor())
+
+    missing = [outpoint for outpoint in outpoints if outpoint not in prevouts]
+    prev_txids = list(dict.fromkeys(txid for txid, _ in missing))
+    prev_txs = dict(zip(prev_txids, get_transactions(prev_txids, rpc)))
+    for txid, n in missing:
+        prev_vout = prev_txs[txid]['vout'][n]
+        prevouts[(txid, n)] = {'value': prev_vout['value'],
+                               'addresses': prev_vout['scriptPubKey'].get('addresses', [])}
+    return prevouts
+
+# Work out the summary of a block and of each of its transactions from verbose RPC data.
+# prevouts must cover every non-coinbase input; prev_time is the previous block's time.
+def summarize_block(height, block, block_txs, prevouts, prev_time):
+    tx_summaries = []
+    for position, tx in enumerate(block_txs):
+        total_out = sum(to_satoshis(vout['value']) for vout in tx['vout'])
+        if 'coinbase' in tx['vin'][0]:
+            fee = 0  # No fee for coinbase transaction
+        else:
+            total_in = sum(to_satoshis(prevouts[(vin['txid'], vin['vout'])]['value']) for vin in tx['vin'])
+            fee = total_in - total_out
+        tx_summaries.append({
+            'txid': bytes.fromhex(tx['txid']),
+            'block_height': height,
+            'position': position,
+            'size': tx['size'],
+            'total_out': total_out,
+            'fee': fee,
+            'inputs': len(tx['vin']),
+            'outputs': len(tx['vout']),
+        })
+
+    block_summary = {
+        'height': height,
+        'hash': bytes.fromhex(block['hash']),
+        'merkle_root': bytes.fromhex(block['merkleroot']),
+        'time': block['time'],
+        'difficulty': float(block['difficulty']),
+        'size': block['size'],
+        'tx_count': len(block_txs),
+        'total_out': sum(tx_summary['total_out'] for tx_summary in tx_summaries),
+        'total_fees': sum(tx_summary['fee'] for tx_summary in tx_summaries),
+        'time_to_mine': block['time'] - prev_time if prev_time is not None else 0,
+    }
+    return block_summary, tx_summaries
+
+# Get block summaries (keyed by height) and transaction summaries (keyed by block height) for the
+# given heights. Indexed blocks come straight from the database; blocks the indexer hasn't
+# reached yet are summarized from the node.
+def get_block_summaries(heights):
+    cursor = get_database().cursor()
+    heights = list(heights)
+    previous_heights = [height - 1 for height in heights if height > 0]
+    block_summaries = database.get_block_summaries(cursor, set(heights + previous_heights))
+    tx_summaries = {}
+    for tx_summary in database.get_tx_summaries(cursor, [h for h in heights if h in block_summaries]):
+        tx_summaries.setdefault(tx_summary['block_height'], []).append(tx_summary)
+
+    missing = [height for height in heights if height not in block_summaries]
+    if missing:
+        # Fetch the missing blocks, the blocks before them (unless their time is already known),
+        # their transactions and prevouts in batches
+        header_index = get_header_index()
+        fetch_heights = sorted(set(missing) | {h - 1 for h in missing
+                                               if h > 0 and h - 1 not in block_summaries and h - 1 not in header_index})
+        blocks = get_blocks_by_height(fetch_heights)
+        txids = [txid for height in missing for txid in blocks[height]['tx']]
+        txs_by_id = dict(zip(txids, get_transactions(txids)))
+        prevouts = get_prevouts((tx for tx in txs_by_id.values() if 'coinbase' not in tx['vin'][0]), cursor)
+
+        for height in missing:
+            block = blocks[height]
+            if height == 0:
+                prev_time = None
+            elif height - 1 in block_summaries:
+                prev_time = block_summaries[height - 1]['time']
+            elif height - 1 in header_index:
+                prev_time = header_index.block_time(height - 1)
+            else:
+                prev_time = blocks[height - 1]['time']
+            block_summary, block_tx_summaries = summarize_block(
+                height, block, [txs_by_id[txid] for txid in block['tx']], prevouts, prev_time)
+            # Fields only known from the node, used by the block page
+            block_summary['confirmations'] = block['confirmations']
+            block_summary['previousblockhash'] = block.get('previousblockhash')
+            block_summary['nextblockhash'] = block.get('nextblockhash')
+            block_summaries[height] = block_summary
+            tx_summaries[height] = block_tx_summaries
+
+    return {height: block_summaries[height] for height in heights}, tx_summaries
 
 index_html = '''
 <!doctype html>
@@ -154,9 +422,9 @@ index_html = '''
     <h2>Latest Blocks</h2>
     
     <!-- Block Cards -->
-    <div class="block-list">
+    <div class="block-list" id="block-list">
       {% for block in blocks %}
-        <div class="block-card">
+        <div class="block-card" data-height="{{ block['height'] }}">
           <h3>Block Height: {{ block['height'] }}</h3>
           <div class="block-info">
             <div>
@@ -205,9 +473,9 @@ index_html = '''
     </div>
 
     <h2>Recent Transactions</h2>
-<div class="transaction-list">
+<div class="transaction-list" id="recent-transactions">
   {% for tx in recent_transactions %}
-    <div class="block-card">
+    <div class="block-card" data-height="{{ tx.block_height }}">
       <h3>Transaction ID: <a href="/transaction?txid={{ tx.txid }}">{{ tx.txid }}</a></h3>
       <div class="block-info">
         <div>
@@ -228,7 +496,7 @@ index_html = '''
         </div>
         <div>
           <strong>Confirmations:</strong>
-          <p>{{ tx.confirmations }}</p>
+          <p class="confirmations">{{ tx.confirmations }}</p>
         </div>
         <div>
           <strong>Inputs / Outputs:</strong>
@@ -241,7 +509,8 @@ index_html = '''
 
 
 <h2>Mempool Transactions</h2>
-<div class="transaction-list">
+<p><span id="mempool-count">{{ mempool_count }}</span> transactions, highest fee rate first. <a href="/mempool">View all</a></p>
+<div class="transaction-list" id="mempool-transactions">
   {% for tx in mempool_transactions %}
     <div class="block-card">
       <h3>Transaction ID: {{ tx.txid }}</h3>
@@ -268,6 +537,104 @@ index_html = '''
   <footer>
     <p>{{ coinName }} Blockchain Explorer</p>
   </footer>
+  {% if not prev_page %}
+  <script>
+    // Add new blocks and show mempool changes as they happen, instead of reloading the page
+    (function () {
+      if (!window.EventSource) return;
+      var ticker = {{ coinTicker | tojson }};
+
+      function formatTime(timestamp) {
+        return new Date(timestamp * 1000).toISOString().replace('T', ' ').slice(0, 19) + ' UTC';
+      }
+
+      function link(href, text) {
+        var a = document.createElement('a');
+        a.href = href;
+        a.textContent = text;
+        return a;
+      }
+
+      // A card like the ones rendered above: a title and rows of [label, value] fields
+      function card(title, rows, height) {
+        var div = document.createElement('div');
+        div.className = 'block-card';
+        if (height !== undefined) div.dataset.height = height;
+        var h3 = document.createElement('h3');
+        title.forEach(function (part) { h3.append(part); });
+        div.appendChild(h3);
+        rows.forEach(function (fields) {
+          var info = document.createElement('div');
+          info.className = 'block-info';
+          fields.forEach(function (field) {
+            var item = document.createElement('div');
+            var label = document.createElement('strong');
+            label.textContent = field[0] + ':';
+            var value = document.createElement('p');
+            value.append(field[1]);
+            if (field[2]) value.className = field[2];
+            item.appendChild(label);
+            item.appendChild(value);
+            info.appendChild(item);
+          });
+          div.appendChild(info);
+        });
+        return div;
+      }
+
+      var source = new EventSource('/events');
+      var failed = false;
+      source.onerror = function () { failed = true; };
+      // Events may have been missed while disconnected, so start again from a fresh page
+      source.onopen = function () { if (failed) location.reload(); };
+      source.addEventListener('reorg', function () { location.reload(); });
+
+      source.addEventListener('block', function (e) {
+        var block = JSON.parse(e.data);
+        var blocks = document.getElementById('block-list');
+        if (blocks.querySelector('[data-height="' + block.height + '"]')) return;
+        blocks.insertBefore(card(['Block Height: ' + block.height], [
+          [['Hash', link('/block?height=' + block.height, block.hash)], ['Time', formatTime(block.time)],
+           ['Time to Mine', block.time_to_mine + ' seconds'], ['Difficulty', String(block.difficulty)]],
+          [['Number of Transactions', String(block.tx_count)], ['Size', block.size + ' bytes'],
+           ['Total Value Transacted', block.total_out + ' ' + ticker]]
+        ], block.height), blocks.firstChild);
+        while (blocks.children.length > 10) blocks.removeChild(blocks.lastChild);
+
+        var transactions = document.getElementById('recent-transactions');
+        block.transactions.slice().reverse().forEach(function (tx) {
+          transactions.insertBefore(card(['Transaction ID: ', link('/transaction?txid=' + tx.txid, tx.txid)], [
+            [['Time', formatTime(block.time)], ['Value', tx.value + ' ' + ticker], ['Size', tx.size + ' bytes'],
+             ['Fee per Byte', tx.fee_per_byte + ' ' + ticker + '/byte'], ['Confirmations', '1', 'confirmations'],
+             ['Inputs / Outputs', tx.inputs + ' / ' + tx.outputs]]
+          ], block.height), transactions.firstChild);
+        });
+        // Keep the transactions of the latest 5 blocks, with their confirmations counted from this one
+        Array.prototype.slice.call(transactions.children).forEach(function (tx) {
+          var confirmations = block.height - Number(tx.dataset.height) + 1;
+          if (confirmations > 5) {
+            transactions.removeChild(tx);
+          } else {
+            tx.querySelector('.confirmations').textContent = confirmations;
+          }
+        });
+      });
+
+      source.addEventListener('mempool', function (e) {
+        var mempool = JSON.parse(e.data);
+        document.getElementById('mempool-count').textContent = mempool.count;
+        var list = document.getElementById('mempool-transactions');
+        list.textContent = '';
+        mempool.transactions.forEach(function (tx) {
+          list.appendChild(card(['Transaction ID: ' + tx.txid], [
+            [['Size', tx.size + ' bytes'], ['Fee per Byte', tx.fee_per_byte + ' ' + ticker + '/byte'],
+             ['Value', tx.value + ' ' + ticker]]
+          ]));
+        });
+      });
+    })();
+  </script>
+  {% endif %}
 </body>
 </html>
 '''
@@ -355,6 +722,26 @@ block_html = '''
     .overview strong {
       font-weight: bold;
     }
+    .pagination {
+      text-align: center;
+      margin-top: 20px;
+    }
+    .button {
+      background-color: #bb86fc;
+      color: #121212;
+      padding: 10px 20px;
+      margin: 0 5px;
+      border-radius: 5px;
+      text-decoration: none;
+      font-size: 16px;
+      font-weight: bold;
+      transition: background-color 0.3s;
+      display: inline-block;
+    }
+    .button:hover {
+      background-color: #3700b3;
+      color: #ffffff;
+    }
     .two-column {
       display: grid;
       grid-template-columns: 1fr 1fr;
@@ -380,6 +767,8 @@ block_html = '''
           <p><strong>Time:</strong> {{ block.time | timestamp_to_date }}</p>
           <p><strong>Time to Mine:</strong> {{ time_to_mine }} seconds</p>
           <p><strong>Total Value Transacted:</strong> {{ total_value_transacted }} {{ coinTicker }}</p>
+          <p><strong>Transactions:</strong> {{ num_transactions }}</p>
+          <p><strong>Total Fees:</strong> {{ total_fees | amount }} {{ coinTicker }}</p>
         </div>
       </div>
 
@@ -401,6 +790,9 @@ block_html = '''
 
     <div class="section">
   <h2>Transactions in Block</h2>
+  {% if num_transactions > page_size %}
+    <p>Showing {{ first_position + 1 }} to {{ [first_position + page_size, num_transactions] | min }} of {{ num_transactions }}</p>
+  {% endif %}
   <table>
     <thead>
       <tr>
@@ -431,6 +823,14 @@ block_html = '''
       {% endfor %}
     </tbody>
   </table>
+  <div class="pagination">
+    {% if prev_page %}
+      <a href="/block?height={{ block_height }}&page={{ prev_page }}" class="button">Previous</a>
+    {% endif %}
+    {% if next_page %}
+      <a href="/block?height={{ block_height }}&page={{ next_page }}" class="button">Next</a>
+    {% endif %}
+  </div>
 </div>
 
 
@@ -610,6 +1010,7 @@ transaction_html = '''
             <th>Value</th>
             <th>Address</th>
             <th>ScriptPubKey (ASM)</th>
+            <th>Spent By</th>
           </tr>
         </thead>
         <tbody>
@@ -624,6 +1025,13 @@ transaction_html = '''
                 {% endif %}
               </td>
               <td>{{ vout.scriptPubKey.asm }}</td>
+              <td>
+                {% if vout.spent_by %}
+                  <a href="/transaction?txid={{ vout.spent_by }}">{{ vout.spent_by }}</a>
+                {% else %}
+                  Unspent
+                {% endif %}
+              </td>
             </tr>
           {% endfor %}
         </tbody>
@@ -735,9 +1143,9 @@ address_html = '''
   <div class="container">
     <div class="section">
       <h2>Balance Information</h2>
-      <p><strong>Received:</strong> {{ received_amount }} {{ coinTicker }}</p>
-      <p><strong>Sent:</strong> {{ sent_amount }} {{ coinTicker }}</p>
-      <p><strong>Balance:</strong> {{ balance }} {{ coinTicker }}</p>
+      <p><strong>Received:</strong> {{ received_amount | amount }} {{ coinTicker }}</p>
+      <p><strong>Sent:</strong> {{ sent_amount | amount }} {{ coinTicker }}</p>
+      <p><strong>Balance:</strong> {{ balance | amount }} {{ coinTicker }}</p>
     </div>
     
     <div class="section">
@@ -756,7 +1164,7 @@ address_html = '''
             <tr>
               <td><a href="/transaction?txid={{ tx[0] }}">{{ tx[0] }}</a></td>
               <td>{{ tx[1] }}</td>
-              <td>{{ tx[2] }} {{ coinTicker }}</td>
+              <td>{{ tx[2] | amount }} {{ coinTicker }}</td>
               <td>{{ tx[3] }}</td>
             </tr>
           {% else %}
@@ -765,11 +1173,11 @@ address_html = '''
         </tbody>
       </table>
       <div class="pagination">
-  {% if prev_page %}
-    <a href="/address?address={{ address }}&page={{ prev_page }}" class="button">Previous</a>
+  {% if prev_cursor %}
+    <a href="/address?address={{ address }}&after={{ prev_cursor }}" class="button">Previous</a>
   {% endif %}
-  {% if next_page %}
-    <a href="/address?address={{ address }}&page={{ next_page }}" class="button">Next</a>
+  {% if next_cursor %}
+    <a href="/address?address={{ address }}&before={{ next_cursor }}" class="button">Next</a>
   {% endif %}
 </div>
 
@@ -784,6 +1192,194 @@ address_html = '''
 </html>
 '''
 
+mempool_html = '''
+<!doctype html>
+<html lang="en">
+<head>
+  <meta charset="UTF-8">
+  <meta name="viewport" content="width=device-width, initial-scale=1.0">
+  <title>Mempool</title>
+  <style>
+    body {
+      background-color: #121212;
+      color: #e0e0e0;
+      font-family: Arial, sans-serif;
+      margin: 0;
+      padding: 0;
+    }
+    header, footer {
+      background-color: #1f1f1f;
+      padding: 10px;
+      text-align: center;
+    }
+    a {
+      color: #bb86fc;
+      text-decoration: none;
+    }
+    a:hover {
+      text-decoration: underline;
+    }
+    .container {
+      padding: 20px;
+    }
+    .section {
+      margin-bottom: 20px;
+    }
+    .section h2 {
+      border-bottom: 1px solid #444;
+      padding-bottom: 10px;
+      margin-bottom: 10px;
+    }
+    table {
+      width: 100%;
+      border-collapse: collapse;
+    }
+    th, td {
+      padding: 10px;
+      text-align: left;
+    }
+    th {
+      background-color: #1f1f1f;
+    }
+    td {
+      background-color: #2a2a2a;
+    }
+    .two-column {
+      display: grid;
+      grid-template-columns: 1fr 1fr;
+      gap: 20px;
+    }
+    .back-button {
+      display: inline-block;
+      margin-top: 20px;
+      padding: 10px 20px;
+      background-color: #bb86fc;
+      color: #121212;
+      text-decoration: none;
+      border-radius: 5px;
+    }
+    .back-button:hover {
+      background-color: #3700b3;
+    }
+    .pagination {
+      text-align: center;
+      margin-top: 20px;
+    }
+    .button {
+      background-color: #bb86fc;
+      color: #121212;
+      padding: 10px 20px;
+      margin: 0 5px;
+      border-radius: 5px;
+      text-decoration: none;
+      font-size: 16px;
+      font-weight: bold;
+      transition: background-color 0.3s;
+      display: inline-block;
+    }
+    .button:hover {
+      background-color: #3700b3;
+      color: #ffffff;
+    }
+  </style>
+</head>
+<body>
+  <header>
+    <h1>Mempool</h1>
+  </header>
+  <div class="container">
+    <div class="section">
+      <h2>Overview</h2>
+      <p><strong>Transactions:</strong> {{ count }}</p>
+      <p><strong>Total Size:</strong> {{ total_size }} bytes</p>
+      <p><strong>Total Fees:</strong> {{ total_fees | amount }} {{ coinTicker }}</p>
+      {% if updated %}
+        <p><strong>Updated:</strong> {{ updated | timestamp_to_date }}</p>
+      {% endif %}
+    </div>
+
+    <div class="two-column">
+      <div class="section">
+        <h2>Fee Rates</h2>
+        <table>
+          <thead>
+            <tr><th>Fee Rate (sat/byte)</th><th>Transactions</th><th>Size</th></tr>
+          </thead>
+          <tbody>
+            {% for bucket in fee_histogram %}
+              <tr>
+                <td>{{ bucket.min }}{% if bucket.max %} - {{ bucket.max }}{% else %}+{% endif %}</td>
+                <td>{{ bucket.count }}</td>
+                <td>{{ bucket.size }} bytes</td>
+              </tr>
+            {% endfor %}
+          </tbody>
+        </table>
+      </div>
+      <div class="section">
+        <h2>Transaction Sizes</h2>
+        <table>
+          <thead>
+            <tr><th>Size (bytes)</th><th>Transactions</th><th>Size</th></tr>
+          </thead>
+          <tbody>
+            {% for bucket in size_histogram %}
+              <tr>
+                <td>{{ bucket.min }}{% if bucket.max %} - {{ bucket.max }}{% else %}+{% endif %}</td>
+                <td>{{ bucket.count }}</td>
+                <td>{{ bucket.size }} bytes</td>
+              </tr>
+            {% endfor %}
+          </tbody>
+        </table>
+      </div>
+    </div>
+
+    <div class="section">
+      <h2>Transactions by Fee Rate</h2>
+      <table>
+        <thead>
+          <tr>
+            <th>Transaction ID</th>
+            <th>Size</th>
+            <th>Value</th>
+            <th>Fee</th>
+            <th>Fee per Byte</th>
+          </tr>
+        </thead>
+        <tbody>
+          {% for tx in transactions %}
+            <tr>
+              <td><a href="/transaction?txid={{ tx.txid }}">{{ tx.txid }}</a></td>
+              <td>{{ tx.size }} bytes</td>
+              <td>{{ tx.value | amount }} {{ coinTicker }}</td>
+              <td>{{ tx.fee | amount }} {{ coinTicker }}</td>
+              <td>{{ tx.fee_per_byte }} {{ coinTicker }}/byte</td>
+            </tr>
+          {% else %}
+            <tr><td colspan="5">The mempool is empty.</td></tr>
+          {% endfor %}
+        </tbody>
+      </table>
+      <div class="pagination">
+        {% if prev_page %}
+          <a href="/mempool?page={{ prev_page }}" class="button">Previous</a>
+        {% endif %}
+        {% if next_page %}
+          <a href="/mempool?page={{ next_page }}" class="button">Next</a>
+        {% endif %}
+      </div>
+    </div>
+
+    <a class="back-button" href="/">Back to Home</a>
+  </div>
+  <footer>
+    <p>{{ coinName }} Blockchain Explorer</p>
+  </footer>
+</body>
+</html>
+'''
+
 not_found_html = '''
 <!doctype html>
 <html lang="en">
@@ -838,14 +1434,16 @@ not_found_html = '''
 </html>
 '''
 
+# The current page number comes from the query parameters (for block pagination)
 @app.route('/')
-def index():
-    # Get the current page number from the query parameters (for block pagination)
-    page = int(request.args.get('page', 1))
+@cached_page(lambda: (get_page_number(),), stale_while_revalidate=True)
+def index(page):
     blocks_per_page = 10
 
-    # Get the latest block height
-    latest_block_height = rpc_connection.getblockcount()
+    # Get the latest indexed block height, or the node's if nothing has been indexed yet
+    latest_block_height = get_header_index().tip_height
+    if latest_block_height < 0:
+        latest_block_height = rpc_connection.getblockcount()
 
     # Calculate the block range for pagination
     start_height = latest_block_height - (page - 1) * blocks_per_page
@@ -854,108 +1452,56 @@ def index():
     blocks = []
     recent_transactions = []
 
-    # Fetch block data for the current page (pagination)
-    for height in range(start_height, end_height, -1):
-        block_hash = rpc_connection.getblockhash(height)
-        block = rpc_connection.getblock(block_hash)
-
-        # Calculate time to mine the block (difference from the previous block)
-        if height > 0:
-            prev_block_hash = rpc_connection.getblockhash(height - 1)
-            prev_block = rpc_connection.getblock(prev_block_hash)
-            time_to_mine = block['time'] - prev_block['time']  # In seconds
-        else:
-            time_to_mine = 0  # No previous block for block 0
+    # Read the blocks for this page and the latest 5 blocks (for recent transactions) from the
+    # summaries kept by the indexer
+    page_heights = list(range(start_height, end_height, -1))
+    recent_heights = list(range(latest_block_height, max(-1, latest_block_height - 5), -1))
+    block_summaries, tx_summaries = get_block_summaries(dict.fromkeys(page_heights + recent_heights))
 
-        # Calculate total value transacted in the block
-        total_value_transacted = 0
-        for txid in block['tx']:
-            tx = rpc_connection.getrawtransaction(txid, True)
-            for vout in tx['vout']:
-                total_value_transacted += vout['value']
+    # Fetch block data for the current page (pagination)
+    for height in page_heights:
+        block = block_summaries[height]
 
         # Append block data for rendering
         blocks.append({
             'height': height,
-            'hash': block['hash'],
+            'hash': block['hash'].hex(),
             'difficulty': block['difficulty'],
             'time': block['time'],
-            'time_to_mine': time_to_mine,
-            'num_tx': len(block['tx']),
+            'time_to_mine': block['time_to_mine'],
+            'num_tx': block['tx_count'],
             'size': block['size'],
-            'total_value_transacted': total_value_transacted
+            'total_value_transacted': from_satoshis(block['total_out'])
         })
 
     # Set up pagination (for blocks)
     prev_page = page - 1 if start_height < latest_block_height else None
     next_page = page + 1 if end_height > 0 else None
 
-    # Fetch recent transactions from the latest 5 blocks
-    for height in range(latest_block_height, latest_block_height - 5, -1):
-        block_hash = rpc_connection.getblockhash(height)
-        block = rpc_connection.getblock(block_hash)
-
-        # Collect transactions from the block
-        for txid in block['tx']:
-            tx = rpc_connection.getrawtransaction(txid, True)
-            total_value = sum(vout['value'] for vout in tx['vout'])
-            confirmations = tx['confirmations']
+    # Recent transactions from the latest 5 blocks
+    for height in recent_heights:
+        block_time = datetime.fromtimestamp(block_summaries[height]['time'], timezone.utc)
+        for tx in tx_summaries[height]:
             size = tx['size']
-            num_inputs = len(tx['vin'])
-            num_outputs = len(tx['vout'])
-
-            # Check if it's a coinbase transaction
-            is_coinbase = 'coinbase' in tx['vin'][0]
-            fee = 0
             fee_per_byte = 0
-
-            if not is_coinbase:
-                # Calculate fee and fee per byte
-                total_input_value = 0
-                for vin in tx['vin']:
-                    if 'txid' in vin:  # Skip coinbase transactions
-                        prev_tx = rpc_connection.getrawtransaction(vin['txid'], True)
-                        prev_vout = prev_tx['vout'][vin['vout']]
-                        total_input_value += prev_vout['value']
-                fee = total_input_value - total_value
-                fee_per_byte = fee / size if size > 0 else 0
+            if tx['position'] > 0 and size > 0:  # Coinbase transactions pay no fee
+                fee_per_byte = from_satoshis(tx['fee']) / size
 
             recent_transactions.append({
-                'txid': txid,
-                'time': datetime.fromtimestamp(tx['time'], timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC'),
-                'value': total_value,
+                'txid': tx['txid'].hex(),
+                'time': block_time.strftime('%Y-%m-%d %H:%M:%S UTC'),
+                'value': from_satoshis(tx['total_out']),
                 'size': size,
-                'confirmations': confirmations,
-                'inputs': num_inputs,
-                'outputs': num_outputs,
+                'confirmations': latest_block_height - height + 1,
+                'block_height': height,
+                'inputs': tx['inputs'],
+                'outputs': tx['outputs'],
                 'fee_per_byte': round(fee_per_byte, 8)
             })
 
-    # Get mempool transactions (limit to first 10 for performance reasons)
-    mempool_txids = rpc_connection.getrawmempool()
-    mempool_transactions = []
-
-    # Fetch more detailed information for each mempool transaction
-    for txid in mempool_txids[:10]:  # Limit to the first 10
-        tx = rpc_connection.getrawtransaction(txid, True)
-        total_value = sum(vout['value'] for vout in tx['vout'])
-        size = tx['size']
-        
-        # Calculate fee and fee per byte for mempool transactions
-        total_input_value = 0
-        for vin in tx['vin']:
-            prev_tx = rpc_connection.getrawtransaction(vin['txid'], True)
-            prev_vout = prev_tx['vout'][vin['vout']]
-            total_input_value += prev_vout['value']
-        fee = total_input_value - total_value
-        fee_per_byte = fee / size if size > 0 else 0
-
-        mempool_transactions.append({
-            'txid': txid,
-            'size': tx['size'],  # Transaction size
-            'value': total_value,  # Total value of the transaction
-            'fee_per_byte': round(fee_per_byte, 8)  # Fee per byte
-        })
+    # The 10 mempool transactions paying the highest fee rate, from the tracker's snapshot
+    mempool_snapshot = mempool_tracker.get_snapshot()
+    mempool_transactions = [mempool_entry_to_dict(entry) for entry in mempool_snapshot.page(0, 10)]
 
     # Render the main page with blocks, recent transactions, and mempool transactions
     return render_template_string(index_html, 
@@ -964,108 +1510,175 @@ def index():
                                   next_page=next_page, 
                                   recent_transactions=recent_transactions, 
                                   mempool_transactions=mempool_transactions,
+                                  mempool_count=len(mempool_snapshot),
                                   coinName=coinName,
                                   coinTicker=coinTicker)
 
+# Join the small pieces a streamed template yields into chunks of about `size` characters, so a
+# page isn't sent a few bytes per write
+def buffered(chunks, size=16384):
+    buffer = []
+    length = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer = []
+            length = 0
+    if buffer:
+        yield ''.join(buffer)
+
+# Once a streamed page has started the status can't be changed any more, so a failure part way
+# through ends the page with a note instead of cutting it off
+def end_on_error(chunks):
+    try:
+        yield from chunks
+    except Exception as e:
+        print(f"Error streaming page: {e}")
+        yield '<p>Error: the rest of this page could not be loaded.</p></body></html>'
+
+# Row of the block page's transaction table for a transaction summary
+def block_transaction_row(tx, total_fees):
+    is_coinbase = tx['position'] == 0
+    return {
+        'txid': tx['txid'].hex(),
+        'total_output': from_satoshis(tx['total_out']),
+        # The coinbase is shown with all of the block's fees, which it collects
+        'tx_fee': total_fees if is_coinbase else from_satoshis(tx['fee']),
+        'reward': from_satoshis(tx['total_out']) if is_coinbase else 0,
+        'is_coinbase': is_coinbase,
+    }
+
+# The block page shows blockPageSize transactions at a time and is streamed: the overview goes out
+# as soon as the block summary has been read, and the rows are read from the index while the
+# table is being sent. It isn't kept in the page cache, which would have to wait for the whole page.
 @app.route('/block')
 def block():
     try:
-        height = int(request.args.get('height'))
-        block_hash = rpc_connection.getblockhash(height)
-        block = rpc_connection.getblock(block_hash)
-        
-        # Get previous block for time to mine calculation
-        if height > 0:
-            prev_block_hash = rpc_connection.getblockhash(height - 1)
-            prev_block = rpc_connection.getblock(prev_block_hash)
-            time_to_mine = block['time'] - prev_block['time']  # In seconds
-        else:
-            time_to_mine = 0  # No previous block for block 0
-        
-        total_value_transacted = 0
-        transactions = []
-        total_fees = 0  # To accumulate all non-coinbase fees
-
-        for txid in block['tx']:
-            tx = rpc_connection.getrawtransaction(txid, True)
-
-            total_output_value = sum(vout['value'] for vout in tx['vout'])
-            if 'coinbase' in tx['vin'][0]:  # Check if it's a coinbase transaction
-                is_coinbase = True
-                tx_fee = 0  # No fee for coinbase transaction
-                reward = total_output_value  # Reward equals the output value
-            else:
-                is_coinbase = False
-                # Calculate the total input value for non-coinbase transactions
-                total_input_value = 0
-                for vin in tx['vin']:
-                    prev_tx = rpc_connection.getrawtransaction(vin['txid'], True)
-                    total_input_value += prev_tx['vout'][vin['vout']]['value']
-                
-                tx_fee = total_input_value - total_output_value  # Transaction fee
-                total_fees += tx_fee  # Add to total fees for the block
-                reward = 0  # No reward for non-coinbase transactions
-            
-            transactions.append({
-                'txid': txid,
-                'total_output': total_output_value,
-                'tx_fee': tx_fee,
-                'reward': reward,
-                'is_coinbase': is_coinbase,
-            })
-            
-            total_value_transacted += total_output_value
-
-        # Add total_fees to the coinbase transaction's reward
-        for tx in transactions:
-            if tx['is_coinbase']:
-                tx['tx_fee'] = total_fees  # Assign all fees to the coinbase transaction
-
-        num_transactions = len(block['tx'])
-
-        return render_template_string(block_html, 
-                                      block=block, 
-                                      block_height=height, 
-                                      num_transactions=num_transactions,
-                                      time_to_mine=time_to_mine,
-                                      total_value_transacted=total_value_transacted,
-                                      transactions=transactions,
-                                      coinName=coinName,
-                                      coinTicker=coinTicker)
-    except (ValueError, Exception) as e:
-        return f"Error: {e}", 400
+        height = int(request.args.get('height', ''))
+    except ValueError:
+        return "Error: invalid block height", 400
+    page = get_page_number()
+    first_position = (page - 1) * blockPageSize
 
-@app.route('/transaction')
-def transaction():
+    # Read the block from the summaries kept by the indexer
     try:
-        txid = request.args.get('txid')
-        tx = rpc_connection.getrawtransaction(txid, True)
-
-        # Fetch the block height using the block hash
-        block = rpc_connection.getblock(tx['blockhash'])
-        block_height = block['height']
-
-        # Fetch the value for each input (vin), handling coinbase transactions
-        total_input_value = 0
-        for vin in tx['vin']:
-            if 'coinbase' in vin:
-                vin['type'] = 'coinbase'
-                vin['value'] = tx['vout'][0]['value']  # Reward value
-                vin['address'] = 'N/A'  # Coinbase doesn't have an address
-            else:
-                # Fetch the previous transaction to get the vout value and address
-                prev_tx = rpc_connection.getrawtransaction(vin['txid'], True)
-                prev_vout = prev_tx['vout'][vin['vout']]
-                vin['value'] = prev_vout['value']
-                vin['address'] = prev_vout['scriptPubKey']['addresses'][0] if 'addresses' in prev_vout['scriptPubKey'] else 'N/A'
-                total_input_value += vin['value']  # Calculate total input value
+        cursor = get_database().cursor()
+        summary = database.get_block_summaries(cursor, [height]).get(height)
+        if summary is None:
+            # Summarized from the node because the indexer hasn't reached this block yet
+            block_summaries, tx_summaries = get_block_summaries([height])
+            summary = block_summaries[height]
+            page_tx_summaries = iter(tx_summaries[height][first_position:first_position + blockPageSize])
+            confirmations = summary['confirmations']
+            neighbour_hashes = {height - 1: summary['previousblockhash'], height + 1: summary['nextblockhash']}
+        else:
+            page_tx_summaries = database.iter_tx_summaries(get_database().cursor(), height, first_position,
+                                                           blockPageSize)
+            header_index = get_header_index()
+            confirmations = header_index.tip_height - height + 1
+            neighbour_hashes = {height - 1: header_index.block_hash(height - 1),
+                                height + 1: header_index.block_hash(height + 1)}
+    except (JSONRPCError, KeyError):
+        return "Error: block not found", 404
+    except RequestException:
+        return "Error: node unavailable", 503
+    block = {
+        'hash': summary['hash'].hex(),
+        'merkleroot': summary['merkle_root'].hex(),
+        'time': summary['time'],
+        'difficulty': summary['difficulty'],
+        'size': summary['size'],
+        'confirmations': confirmations,
+    }
+    if neighbour_hashes.get(height - 1):
+        block['previousblockhash'] = neighbour_hashes[height - 1]
+    if neighbour_hashes.get(height + 1):
+        block['nextblockhash'] = neighbour_hashes[height + 1]
+
+    # The fee total is worked out by the indexer, so it doesn't depend on which page is shown
+    total_fees = from_satoshis(summary['total_fees'])
+    transactions = (block_transaction_row(tx, total_fees) for tx in page_tx_summaries)
+    num_transactions = summary['tx_count']
+    prev_page = page - 1 if page > 1 else None
+    next_page = page + 1 if first_position + blockPageSize < num_transactions else None
+
+    return Response(buffered(end_on_error(stream_template_string(block_html,
+                                                                 block=block,
+                                                                 block_height=height,
+                                                                 num_transactions=num_transactions,
+                                                                 time_to_mine=summary['time_to_mine'],
+                                                                 total_value_transacted=from_satoshis(summary['total_out']),
+                                                                 total_fees=total_fees,
+                                                                 transactions=transactions,
+                                                                 first_position=first_position,
+                                                                 page_size=blockPageSize,
+                                                                 prev_page=prev_page,
+                                                                 next_page=next_page,
+                                                                 coinName=coinName,
+                                                                 coinTicker=coinTicker))),
+                    mimetype='text/html')
+
+# Look up a transaction with the value and address of each input, the transaction that spent each
+# output and its fee. Raises JSONRPCError if the node doesn't know the txid.
+def load_transaction(txid):
+    tx = rpc_connection.getrawtransaction(txid, True)
+
+    # Look up the block height and which transactions spent each output in the local index
+    cursor = get_database().cursor()
+    cursor.execute('SELECT vout, block_height, spent_by, spent_height FROM outputs WHERE txid = ?',
+                   (bytes.fromhex(txid),))
+    indexed_outputs = cursor.fetchall()
+    prevouts = get_prevouts([tx], cursor)
+
+    if indexed_outputs:
+        block_height = indexed_outputs[0][1]
+    elif 'blockhash' in tx:
+        block_height = rpc_connection.getblock(tx['blockhash'])['height']
+    else:
+        block_height = None  # Still in the mempool
+    spent_by = {vout: (spending_txid.hex(), spent_height)
+                for vout, _, spending_txid, spent_height in indexed_outputs if spending_txid}
+    for vout in tx['vout']:
+        vout['spent_by'], vout['spent_height'] = spent_by.get(vout['n'], (None, None))
+
+    # Fetch the value for each input (vin), handling coinbase transactions
+    total_input_value = 0
+    for vin in tx['vin']:
+        if 'coinbase' in vin:
+            vin['type'] = 'coinbase'
+            vin['value'] = tx['vout'][0]['value']  # Reward value
+            vin['address'] = 'N/A'  # Coinbase doesn't have an address
+        else:
+            # Look up the previous output to get its value and address
+            prev_vout = prevouts[(vin['txid'], vin['vout'])]
+            vin['value'] = prev_vout['value']
+            vin['address'] = prev_vout['addresses'][0] if prev_vout['addresses'] else 'N/A'
+            total_input_value += vin['value']  # Calculate total input value
 
-        # Calculate total output value
-        total_output_value = sum(vout['value'] for vout in tx['vout'])
+    # Calculate total output value
+    total_output_value = sum(vout['value'] for vout in tx['vout'])
 
-        # Calculate the total fee
-        total_fee = total_input_value - total_output_value if total_input_value else 0
-        fee_per_byte = total_fee / tx['size'] if tx['size'] > 0 else 0
+    # Calculate the total fee
+    total_fee = total_input_value - total_output_value if total_input_value else 0
+    fee_per_byte = total_fee / tx['size'] if tx['size'] > 0 else 0
+
+    return {
+        'tx': tx,
+        'block_height': block_height,
+        'total_input_value': total_input_value,
+        'total_output_value': total_output_value,
+        'total_fee': total_fee,
+        'fee_per_byte': fee_per_byte,
+    }
+
+@app.route('/transaction')
+@cached_page(lambda: (request.args.get('txid'),))
+def transaction(txid):
+    try:
+        details = load_transaction(txid)
+        tx = details['tx']
 
         # Format time in human-readable format
         time_formatted = datetime.fromtimestamp(tx['time'], timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')
@@ -1073,187 +1686,536 @@ def transaction():
         return render_template_string(transaction_html, 
                                       tx=tx, 
                                       txid=txid, 
-                                      block_height=block_height,
-                                      total_fee=total_fee, 
-                                      fee_per_byte=fee_per_byte, 
+                                      block_height=details['block_height'],
+                                      total_fee=details['total_fee'], 
+                                      fee_per_byte=details['fee_per_byte'], 
                                       time_formatted=time_formatted,
                                       coinName=coinName,
                                       coinTicker=coinTicker)
     except Exception as e:
         return f"Error: {e}", 400
     
+# Address history cursors are "height:txid:type" of a row on the page; rows are ordered by
+# (block_height, txid, type) so a page can start right after any row using the covering index
+def encode_address_cursor(row):
+    return f"{row[3]}:{row[0]}:{row[1]}"
+
+def decode_address_cursor(cursor):
+    height, txid, tx_type = cursor.split(':')
+    return int(height), bytes.fromhex(txid), int(tx_type)
+
+# Fetch one page of an address's history older than `before` or newer than `after`
+def get_address_transactions(cursor, address_id, limit, before=None, after=None):
+    if after:
+        condition, order = '(block_height, txid, type) > (?, ?, ?)', 'ASC'
+        params = decode_address_cursor(after)
+    else:
+        condition, order = '(block_height, txid, type) < (?, ?, ?)', 'DESC'
+        params = decode_address_cursor(before) if before else (2 ** 63 - 1, b'', 0)
+
+    # Fetch one extra row to find out whether there is another page in this direction
+    cursor.execute(f'''
+        SELECT txid, type, SUM(value), block_height
+        FROM address_transactions
+        WHERE address_id = ? AND {condition}
+        GROUP BY block_height, txid, type
+        ORDER BY block_height {order}, txid {order}, type {order}
+        LIMIT ?
+    ''', (address_id, *params, limit + 1))
+    rows = cursor.fetchall()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if after:
+        rows.reverse()
+
+    transactions = [(txid.hex(), tx_type, from_satoshis(value), block_height)
+                    for txid, tx_type, value, block_height in rows]
+
+    # Newer rows exist if we came from an older page or if the ascending query found more;
+    # older rows exist if we came from a newer page or the descending query found more
+    has_newer = more if after else bool(before)
+    has_older = bool(after) if after else more
+    prev_cursor = encode_address_cursor(transactions[0]) if transactions and has_newer else None
+    next_cursor = encode_address_cursor(transactions[-1]) if transactions and has_older else None
+    return transactions, prev_cursor, next_cursor
+
+# Totals and one page of history for an address, as returned by ?format=json and the API
+def load_address(address, before=None, after=None, transactions_per_page=20):
+    cursor = get_database().cursor()
+
+    # Addresses are stored by id; an unknown address simply has no rows
+    address_id = database.lookup_address_id(cursor, address)
+
+    # Read the received and sent amounts and the transaction count kept by the indexer
+    cursor.execute('''
+        SELECT received, sent, balance, tx_count FROM address_summary WHERE address_id = ?
+    ''', (address_id,))
+    received, sent, balance, tx_count = cursor.fetchone() or (0, 0, 0, 0)
+
+    # Query one page of transactions, starting from the cursor rather than an offset
+    transactions, prev_cursor, next_cursor = get_address_transactions(
+        cursor, address_id, transactions_per_page, before=before, after=after)
+
+    return {
+        'address': address,
+        'received': from_satoshis(received),
+        'sent': from_satoshis(sent),
+        'balance': from_satoshis(balance),
+        'tx_count': tx_count,
+        'transactions': [{'txid': txid, 'type': database.TYPE_NAMES[tx_type], 'value': value,
+                          'block_height': block_height}
+                         for txid, tx_type, value, block_height in transactions],
+        'prev_cursor': prev_cursor,
+        'next_cursor': next_cursor,
+    }
+
+# before shows the rows older than that cursor, after the rows newer than it
 @app.route('/address')
-def address():
+@cached_page(lambda: (request.args.get('address'), request.args.get('before'), request.args.get('after'),
+                      request.args.get('format')))
+def address(address, before, after, output_format):
     try:
-        address = request.args.get('address')
-        page = int(request.args.get('page', 1))  # Get the page number from the query parameters
-        transactions_per_page = 20  # Set the number of transactions per page
-
-        # Connect to SQLite database
-        conn = sqlite3.connect(f'{databaseLocation}{coinName.lower()}_explorer.db')
-        cursor = conn.cursor()
-
-        # Query received and sent amounts
-        cursor.execute('''
-            SELECT SUM(value) FROM address_transactions WHERE address = ? AND type = 'received'
-        ''', (address,))
-        received_amount = cursor.fetchone()[0] or 0
-
-        cursor.execute('''
-            SELECT SUM(value) FROM address_transactions WHERE address = ? AND type = 'sent'
-        ''', (address,))
-        sent_amount = cursor.fetchone()[0] or 0
-
-        balance = received_amount - sent_amount
-
-        # Calculate the offset for pagination
-        offset = (page - 1) * transactions_per_page
-
-        # Query transactions with pagination
-        cursor.execute('''
-            SELECT txid, type, SUM(value), block_height
-            FROM address_transactions
-            WHERE address = ?
-            GROUP BY txid, type, block_height
-            ORDER BY block_height DESC
-            LIMIT ? OFFSET ?
-        ''', (address, transactions_per_page, offset))
-
-        transactions = cursor.fetchall()
-
-        # Query the total number of transactions for pagination controls
-        cursor.execute('''
-            SELECT COUNT(DISTINCT txid) FROM address_transactions WHERE address = ?
-        ''', (address,))
-        total_transactions = cursor.fetchone()[0]
-
-        # Calculate total number of pages
-        total_pages = (total_transactions + transactions_per_page - 1) // transactions_per_page
-
-        # Determine if "Previous" and "Next" buttons should be shown
-        prev_page = page - 1 if page > 1 else None
-        next_page = page + 1 if page < total_pages else None
+        details = load_address(address, before, after)
+
+        if output_format == 'json':
+            return jsonify(details)
+
+        transactions = [(tx['txid'], tx['type'], tx['value'], tx['block_height'])
+                        for tx in details['transactions']]
 
         return render_template_string(address_html,
                                       address=address,
                                       transactions=transactions,
-                                      received_amount=received_amount,
-                                      sent_amount=sent_amount,
-                                      balance=balance,
-                                      prev_page=prev_page,
-                                      next_page=next_page,
+                                      received_amount=details['received'],
+                                      sent_amount=details['sent'],
+                                      balance=details['balance'],
+                                      prev_cursor=details['prev_cursor'],
+                                      next_cursor=details['next_cursor'],
                                       coinName=coinName,
                                       coinTicker=coinTicker)
     except Exception as e:
         return f"Error: {e}", 400
     
-@app.route('/search')
-def search():
-    query = request.args.get('query', '').strip()
-
-    # 1. Check if query matches a block hash
+# Amounts and fee rate of a mempool entry, in coins
+def mempool_entry_to_dict(entry):
+    fee = from_satoshis(entry.fee)
+    return {
+        'txid': entry.txid,
+        'size': entry.size,
+        'value': from_satoshis(entry.value),
+        'fee': fee,
+        'fee_per_byte': (fee / entry.size).quantize(Decimal('1E-8')) if entry.size else 0,
+    }
+
+# One page of the mempool by fee rate, with the totals and histograms of the whole mempool. Everything
+# comes from the tracker's latest snapshot, so only this page's entries are touched.
+def load_mempool_page(page):
+    snapshot = mempool_tracker.get_snapshot()
+    offset = (page - 1) * mempoolPageSize
+    return {
+        'count': len(snapshot),
+        'total_size': snapshot.total_size,
+        'total_fees': from_satoshis(snapshot.total_fees),
+        'updated': snapshot.updated,
+        'fee_histogram': snapshot.fee_histogram,
+        'size_histogram': snapshot.size_histogram,
+        'transactions': [mempool_entry_to_dict(entry) for entry in snapshot.page(offset, mempoolPageSize)],
+        'prev_page': page - 1 if page > 1 else None,
+        'next_page': page + 1 if offset + mempoolPageSize < len(snapshot) else None,
+    }
+
+# Page number from the query string; anything that isn't a positive number is the first page
+def get_page_number():
     try:
-        block = rpc_connection.getblock(query)
-        return redirect(f'/block?height={block["height"]}')
-    except Exception:
-        pass
+        return max(1, int(request.args.get('page', 1)))
+    except ValueError:
+        return 1
 
-    # 2. Check if query matches a transaction hash
-    try:
-        tx = rpc_connection.getrawtransaction(query, True)
-        return redirect(f'/transaction?txid={query}')
-    except Exception:
-        pass
+@app.route('/mempool')
+def mempool_page():
+    details = load_mempool_page(get_page_number())
 
-    # 3. Check if query matches an address (We'll just redirect to the address page)
-    try:
-        # You could add more sophisticated validation for address format here
-        if len(query) > 0:
-          if any(query.startswith(prefix) for prefix in addressPrefixes):
-            return redirect(f'/address?address={query}')
-    except Exception:
-        pass
+    if request.args.get('format') == 'json':
+        return jsonify(details)
+
+    return render_template_string(mempool_html, coinName=coinName, coinTicker=coinTicker, **details)
+
+# Address versions used to check the checksum of searched addresses
+address_params = rawblocks.AddressParams(pubkeyAddressVersion, scriptAddressVersion, bech32Prefix)
+
+# Work out what a search query refers to: ('block', height), ('transaction', txid),
+# ('address', address) or (None, None)
+def classify_query(query):
+    return search_module.classify(query, get_database().cursor(), rpc_connection, address_params, addressPrefixes)
+
+@app.route('/search')
+def search():
+    query = request.args.get('query', '').strip()
+    kind, value = classify_query(query)
+    if kind == 'block':
+        return redirect(f'/block?height={value}')
+    if kind == 'transaction':
+        return redirect(f'/transaction?txid={value}')
+    if kind == 'address':
+        return redirect(f'/address?address={value}')
 
     # If none of the checks worked, show a Not Found page
     return render_template_string(not_found_html, query=query)
 
-# Function to parse blocks and update the database
-def parse_blocks():
-    retries = 3  # Number of retries before failing
-    delay = 5    # Delay between retries in seconds
-    global rpc_connection  # Ensure we use the latest connection object
+# Work out (size, fee, value) in satoshis for new mempool transactions
+def describe_mempool_transactions(txids):
+    rpc = node_client
+    txs = get_transactions(txids, rpc)
+    prevouts = get_prevouts(txs, rpc=rpc)
+    described = {}
+    for txid, tx in zip(txids, txs):
+        value = sum(to_satoshis(vout['value']) for vout in tx['vout'])
+        total_in = sum(to_satoshis(prevouts[(vin['txid'], vin['vout'])]['value']) for vin in tx['vin'])
+        described[txid] = (tx['size'], total_in - value, value)
+    return described
+
+# Each web worker tracks the mempool in the background, starting with the first page that shows it
+mempool_tracker = mempool.MempoolTracker(node_client.getrawmempool, describe_mempool_transactions, mempoolSeconds)
+
+# HTTP hook for -blocknotify, e.g.
+#   -blocknotify="curl -s -X POST -H 'X-Notify-Secret: <notifySecret>' http://127.0.0.1:5000/notify/block/%s"
+# Behind a reverse proxy every request seems to come from this machine, so the caller has to know
+# notifySecret instead. Refreshes this worker straight away and passes the block on to the indexer
+# through notifySocket, if it's set.
+@app.route('/notify/block/<block_hash>', methods=['POST'])
+def notify_block(block_hash):
+    if not notifySecret:
+        return jsonify({'error': 'notify hook disabled, set notifySecret to use it'}), 403
+    if not hmac.compare_digest(request.headers.get('X-Notify-Secret', '').encode(), notifySecret.encode()):
+        return jsonify({'error': 'forbidden'}), 403
+    if len(block_hash) != 64 or not all(c in '0123456789abcdefABCDEF' for c in block_hash):
+        return jsonify({'error': 'invalid block hash'}), 400
+    block_hash = block_hash.lower()
+    rpc_connection.note_block(block_hash)
+    mempool_tracker.wake()
+    if notifySocket:
+        try:
+            notify.send_to_socket(notifySocket, f'hashblock {block_hash}')
+        except OSError as e:
+            return jsonify({'error': f'indexer not reachable: {e}'}), 503
+    return '', 204
+
+# Expose RPC batch counts and latency so slow node round-trips can be spotted
+@app.route('/metrics')
+def metrics():
+    return jsonify({'rpc': rpc_connection.get_stats(),
+                    'indexer': database.get_indexer_state(get_database().cursor()),
+                    'mempool': mempool_tracker.get_stats(),
+                    'pages': page_cache.get_stats(),
+                    'headers': get_header_index().get_stats(),
+                    'events': event_broadcaster.get_stats()})
+
+# Bumped whenever the JSON of a block or transaction changes, so cached copies aren't reused
+API_VERSION = 'v1'
+
+EIGHT_PLACES = Decimal('1E-8')
+
+# Decimals are written as exact strings with at least 8 decimal places ("0.00000000"), never
+# through float; bytes as hex
+def json_default(value):
+    if isinstance(value, Decimal):
+        if value.as_tuple().exponent > -8:
+            value = value.quantize(EIGHT_PLACES)
+        return format(value, 'f')
+    if isinstance(value, bytes):
+        return value.hex()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+def dumps_json(data):
+    if orjson is not None:
+        return orjson.dumps(data, default=json_default)
+    return json.dumps(data, default=json_default, separators=(',', ':')).encode()
+
+# Send data built by build(). etag is only given for chain data that can no longer change: the
+# response is then cacheable for apiImmutableSeconds, and a matching If-None-Match gets a 304
+# without build() being called.
+def api_response(build, etag=None, max_age=None):
+    if etag is not None:
+        headers = {'ETag': f'"{etag}"', 'Cache-Control': f'public, max-age={apiImmutableSeconds}, immutable'}
+        if request.if_none_match.contains(etag):
+            return Response(status=304, headers=headers)
+    else:
+        headers = {'Cache-Control': f'public, max-age={apiRecentSeconds if max_age is None else max_age}'}
     try:
-        conn = sqlite3.connect(f'{databaseLocation}{coinName.lower()}_explorer.db')
-        cursor = conn.cursor()
-
-        latest_block_height = rpc_connection.getblockcount()
-
-        # Get the last block height we parsed
-        cursor.execute('SELECT MAX(block_height) FROM address_transactions')
-        last_parsed_height = cursor.fetchone()[0] or 0
-        print("last process height: " + str(last_parsed_height))
-
-        # Parse new blocks since the last parsed height
-        for height in range(last_parsed_height + 1, latest_block_height + 1):
-            block_hash = rpc_connection.getblockhash(height)
-            block = rpc_connection.getblock(block_hash)
-
-            for txid in block['tx']:
-                tx = rpc_connection.getrawtransaction(txid, True)
-
-                # Store received values in the database
-                for vout in tx['vout']:
-                    if 'addresses' in vout['scriptPubKey']:
-                        for address in vout['scriptPubKey']['addresses']:
-                            value_float = float(vout['value'])  # Convert Decimal to float
-                            cursor.execute('''
-                                INSERT INTO address_transactions (address, txid, value, type, block_height)
-                                VALUES (?, ?, ?, ?, ?)
-                            ''', (address, txid, value_float, 'received', height))
-
-                # Store sent values in the database (inputs)
-                for vin in tx['vin']:
-                    if 'txid' in vin:
-                        prev_tx = rpc_connection.getrawtransaction(vin['txid'], True)
-                        prev_vout = prev_tx['vout'][vin['vout']]
-                        if 'addresses' in prev_vout['scriptPubKey']:
-                            for address in prev_vout['scriptPubKey']['addresses']:
-                                value_float = float(prev_vout['value'])  # Convert Decimal to float
-                                cursor.execute('''
-                                    INSERT INTO address_transactions (address, txid, value, type, block_height)
-                                    VALUES (?, ?, ?, ?, ?)
-                                ''', (address, txid, value_float, 'sent', height))
-            print("processed block: " + block_hash)
-            conn.commit()
-
-        conn.close()
-
-    except (ConnectionError, socket.error, socket.timeout) as e:
-        retries -= 1
-        print(f"Error parsing blocks: {e}. Retrying in {delay} seconds...")
-        time.sleep(delay)
-        if retries > 0:
-            parse_blocks()  # Retry parsing blocks
+        body = dumps_json(build())
+    except JSONRPCError as e:
+        return api_error(e.error.get('message', 'not found'), 404)
+    except RequestException:
+        return api_error('node unavailable', 503)
+    return Response(body, headers=headers, mimetype='application/json')
+
+def api_error(message, status):
+    return Response(dumps_json({'error': message}), status=status, mimetype='application/json',
+                    headers={'Cache-Control': 'no-store'})
+
+def is_hex_hash(value):
+    return len(value) == 64 and all(c in '0123456789abcdefABCDEF' for c in value)
+
+# Whether a block at this height is buried deep enough to be served as immutable
+def is_immutable(height):
+    return height is not None and get_header_index().tip_height - height + 1 >= apiImmutableConfirmations
+
+# Height and hash of the last indexed block; the API leaves confirmations out of blocks and
+# transactions so they can be cached, and clients work them out from this
+@app.route('/api/v1/tip')
+def api_tip():
+    header_index = get_header_index()
+    height, block_hash = header_index.tip_height, header_index.tip_hash()
+    return api_response(lambda: {'height': height, 'hash': block_hash})
+
+# A block by height or hash, with a summary of each of its transactions
+@app.route('/api/v1/block/<block_id>')
+def api_block(block_id):
+    requested_hash = None
+    if search_module.is_height(block_id):
+        height = int(block_id)
+    elif is_hex_hash(block_id):
+        requested_hash = block_id.lower()
+        try:
+            height = database.find_block_height(get_database().cursor(), requested_hash)
+            if height is None:
+                block = rpc_connection.getblock(requested_hash)
+                # The node still knows blocks that were reorganized away, with -1 confirmations;
+                # the block at their height is a different one
+                if block['confirmations'] < 0:
+                    return api_error('block not found', 404)
+                height = block['height']
+        except JSONRPCError:
+            return api_error('block not found', 404)
+        except RequestException:
+            return api_error('node unavailable', 503)
+    else:
+        return api_error('invalid block height or hash', 400)
+
+    header_index = get_header_index()
+    # A block asked for by hash must still be the one at its height, or its ETag would be another's
+    if requested_hash is not None and header_index.block_hash(height) not in (None, requested_hash):
+        return api_error('block not found', 404)
+    etag = f'block-{API_VERSION}-{header_index.block_hash(height)}' if is_immutable(height) else None
+
+    def build():
+        block_summaries, tx_summaries = get_block_summaries([height])
+        summary = block_summaries[height]
+        if requested_hash is not None and summary['hash'].hex() != requested_hash:
+            raise KeyError(requested_hash)  # Reorganized away since it was looked up
+        if 'confirmations' in summary:
+            # Summarized from the node because the indexer hasn't reached this block yet
+            previous_hash, next_hash = summary['previousblockhash'], summary['nextblockhash']
         else:
-            print("Max retries reached. Could not connect.")
-            # Reconnect the RPC connection
-            rpc_connection = create_rpc_connection()
+            previous_hash = header_index.block_hash(height - 1)
+            next_hash = header_index.block_hash(height + 1)
+        return {
+            'height': height,
+            'hash': summary['hash'],
+            'previousblockhash': previous_hash,
+            'nextblockhash': next_hash,
+            'merkleroot': summary['merkle_root'],
+            'time': summary['time'],
+            'difficulty': summary['difficulty'],
+            'size': summary['size'],
+            'tx_count': summary['tx_count'],
+            'total_out': from_satoshis(summary['total_out']),
+            'total_fees': from_satoshis(summary['total_fees']),
+            'time_to_mine': summary['time_to_mine'],
+            'transactions': [{'txid': tx['txid'], 'size': tx['size'], 'inputs': tx['inputs'],
+                              'outputs': tx['outputs'], 'total_out': from_satoshis(tx['total_out']),
+                              'fee': from_satoshis(tx['fee'])}
+                             for tx in tx_summaries.get(height, [])],
+        }
 
-    except Exception as e:
-        print(f"Error parsing blocks: {e}")
+    try:
+        return api_response(build, etag)
+    except KeyError:
+        return api_error('block not found', 404)
+
+# A transaction with the value and address of each input. Whether its outputs have been spent
+# changes over time, so that is served separately by api_transaction_spends.
+@app.route('/api/v1/transaction/<txid>')
+def api_transaction(txid):
+    if not is_hex_hash(txid):
+        return api_error('invalid txid', 400)
+    txid = txid.lower()
+    cursor = get_database().cursor()
+    cursor.execute('SELECT block_height FROM tx_summary WHERE txid = ?', (bytes.fromhex(txid),))
+    row = cursor.fetchone()
+    etag = f'tx-{API_VERSION}-{txid}' if row and is_immutable(row[0]) else None
+
+    def build():
+        details = load_transaction(txid)
+        tx = details['tx']
+        return {
+            'txid': txid,
+            'block_height': details['block_height'],
+            'blockhash': tx.get('blockhash'),
+            'time': tx.get('time'),
+            'size': tx['size'],
+            'version': tx.get('version'),
+            'locktime': tx.get('locktime'),
+            'vin': [{'coinbase': vin['coinbase']} if 'coinbase' in vin else
+                    {'txid': vin['txid'], 'vout': vin['vout'], 'value': vin['value'], 'address': vin['address']}
+                    for vin in tx['vin']],
+            'vout': [{'n': vout['n'], 'value': vout['value'],
+                      'addresses': vout['scriptPubKey'].get('addresses', []),
+                      'type': vout['scriptPubKey'].get('type')}
+                     for vout in tx['vout']],
+            'total_in': details['total_input_value'],
+            'total_out': details['total_output_value'],
+            'fee': details['total_fee'],
+            'fee_per_byte': Decimal(details['fee_per_byte']).quantize(EIGHT_PLACES),
+        }
+
+    return api_response(build, etag)
+
+# Which transaction, if any, spent each output of a transaction
+@app.route('/api/v1/transaction/<txid>/spends')
+def api_transaction_spends(txid):
+    if not is_hex_hash(txid):
+        return api_error('invalid txid', 400)
+    cursor = get_database().cursor()
+    cursor.execute('SELECT vout, spent_by, spent_height FROM outputs WHERE txid = ? ORDER BY vout',
+                   (bytes.fromhex(txid),))
+    rows = cursor.fetchall()
+    if not rows:
+        return api_error('transaction not indexed', 404)
+    return api_response(lambda: [{'vout': vout, 'spent_by': spent_by, 'spent_height': spent_height}
+                                 for vout, spent_by, spent_height in rows])
+
+@app.route('/api/v1/address/<address>')
+def api_address(address):
+    before = request.args.get('before')
+    after = request.args.get('after')
+    try:
+        return api_response(lambda: load_address(address, before, after))
+    except ValueError:
+        return api_error('invalid cursor', 400)
 
-# Function to run parse_blocks periodically
-def run_periodic_block_parsing():
+@app.route('/api/v1/search')
+def api_search():
+    query = request.args.get('query', '').strip()
+    kind, value = classify_query(query)
+    urls = {'block': '/api/v1/block/{}', 'transaction': '/api/v1/transaction/{}', 'address': '/api/v1/address/{}'}
+    return api_response(lambda: {'query': query, 'type': kind, 'id': value,
+                                 'url': urls[kind].format(value) if kind else None})
+
+# Up to 10 blocks, transactions and addresses starting with ?prefix=, for search-as-you-type
+@app.route('/api/v1/autocomplete')
+def api_autocomplete():
+    prefix = request.args.get('prefix', '').strip()
+    suggestions = search_module.autocomplete(prefix, get_database().cursor(), addressPrefixes)
+    return api_response(lambda: {'prefix': prefix, 'suggestions': suggestions})
+
+@app.route('/api/v1/mempool')
+def api_mempool():
+    page = get_page_number()
+    return api_response(lambda: load_mempool_page(page), max_age=mempoolSeconds)
+
+# Largest number of a new block's transactions sent with its /events message
+EVENT_BLOCK_TRANSACTIONS = 50
+
+# A newly indexed block as sent to /events: what the homepage shows for it and for its first transactions
+def block_event(height):
+    cursor = get_database().cursor()
+    summary = database.get_block_summaries(cursor, [height])[height]
+    transactions = []
+    for tx in database.iter_tx_summaries(cursor, height, 0, EVENT_BLOCK_TRANSACTIONS):
+        fee_per_byte = from_satoshis(tx['fee']) / tx['size'] if tx['position'] > 0 and tx['size'] > 0 else 0
+        transactions.append({
+            'txid': tx['txid'],
+            'value': from_satoshis(tx['total_out']),
+            'size': tx['size'],
+            'fee_per_byte': round(Decimal(fee_per_byte), 8),
+            'inputs': tx['inputs'],
+            'outputs': tx['outputs'],
+        })
+    return {
+        'height': height,
+        'hash': summary['hash'],
+        'time': summary['time'],
+        'time_to_mine': summary['time_to_mine'],
+        'difficulty': summary['difficulty'],
+        'tx_count': summary['tx_count'],
+        'size': summary['size'],
+        'total_out': from_satoshis(summary['total_out']),
+        'transactions': transactions,
+    }
+
+def mempool_event(snapshot):
+    return {
+        'count': len(snapshot),
+        'total_size': snapshot.total_size,
+        'transactions': [mempool_entry_to_dict(entry) for entry in snapshot.page(0, 10)],
+    }
+
+# The one producer of this web worker's events. Blocks are found by polling the database, which
+# costs the node nothing; mempool changes come from the tracker, which polls the node the same
+# whether one page is open or thousands.
+def produce_events():
+    mempool_tracker.subscribe(lambda snapshot, new_entries, removed: event_broadcaster.publish(
+        'mempool', lambda: dumps_json(mempool_event(snapshot))))
+    mempool_tracker.get_snapshot()
+
+    header_index = get_header_index()
+    last_height, last_hash = header_index.tip_height, header_index.tip_hash()
     while True:
-        parse_blocks()
-        time.sleep(10)  # Run every 10 seconds
-
-# Start the background thread for periodic block parsing
-threading.Thread(target=run_periodic_block_parsing, daemon=True).start()
+        time.sleep(eventsPollSeconds)
+        try:
+            header_index = get_header_index()
+            if last_hash is not None and header_index.block_hash(last_height) != last_hash:
+                # Blocks we announced were replaced; pages reload rather than patch themselves
+                event_broadcaster.publish('reorg', lambda: dumps_json({'height': header_index.tip_height}))
+            else:
+                # After a long pause only the latest few blocks are worth sending
+                for height in range(max(last_height + 1, header_index.tip_height - 9), header_index.tip_height + 1):
+                    event_broadcaster.publish('block', functools.partial(lambda h: dumps_json(block_event(h)), height))
+            last_height, last_hash = header_index.tip_height, header_index.tip_hash()
+        except Exception as e:
+            print(f"Error producing events: {e}")
+
+event_broadcaster = events.EventBroadcaster(produce_events, eventsQueueSize)
+
+# Server-Sent Events stream of newly indexed blocks ('block'), mempool changes ('mempool') and
+# reorganizations ('reorg'). Clients that fall eventsQueueSize events behind are disconnected, and
+# reconnect on their own.
+@app.route('/events')
+def events_stream():
+    subscriber = event_broadcaster.subscribe()
+
+    def stream():
+        try:
+            yield b'retry: 5000\n\n'
+            while True:
+                event = subscriber.next(eventsKeepaliveSeconds)
+                if event is not None:
+                    yield event
+                elif subscriber.dropped:
+                    break
+                else:
+                    yield b': keepalive\n\n'
+        finally:
+            event_broadcaster.unsubscribe(subscriber)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# WSGI entry point for the web workers, e.g. gunicorn -w 8 'app:create_app()'. Pages only read the
+# database; indexer.py keeps it up to date in its own process. Creating the app doesn't touch the
+# node or the database, so workers start straight away.
+def create_app():
+    return app
 
 @app.template_filter('timestamp_to_date')
 def timestamp_to_date_filter(timestamp):
     return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')
 
+# Format an amount with all 8 decimal places, without going through float
+@app.template_filter('amount')
+def amount_filter(value):
+    return f'{Decimal(value):.8f}'
+
 if __name__ == '__main__':
     app.run(debug=True)
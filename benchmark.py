@@ -0,0 +1,422 @@
+import argparse
+import json
+import os
+import platform
+import random
+import signal
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import requests
+
+import app
+
+# Measures the indexer and the busiest pages against a fake node (fakenode.py), so a change to a
+# hot path can be checked before it's deployed. `run` writes the results as JSON and `compare`
+# sets them against a saved baseline, exiting with status 1 if anything got worse.
+#
+# Usage: python benchmark.py run --output baseline.json
+#        python benchmark.py run --output new.json --baseline baseline.json
+#        python benchmark.py compare baseline.json new.json --tolerance 25
+#
+# The fake node listens on rpc_host:rpc_port from app.py, so stop the real node first, and
+# databaseLocation must be empty so the database is created in a scratch directory. Pages are
+# requested one at a time from a single-threaded server, each URL only once, so every request
+# renders the page instead of coming from the page cache.
+
+repo_directory = os.path.dirname(os.path.abspath(__file__))
+
+# Rows the indexer writes, counted for rows/sec
+indexed_tables = ['block_summary', 'tx_summary', 'outputs', 'address_transactions', 'addresses', 'address_summary']
+
+# Transactions per page on /address (load_address's default)
+address_page_size = 20
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def log_tail(path, lines=20):
+    with open(path) as f:
+        return ''.join(f.readlines()[-lines:])
+
+
+# Wait until check() stops raising, or fail if the process exits first
+def wait_until_ready(check, process, log_path, what, timeout=600):
+    deadline = time.monotonic() + timeout
+    while True:
+        if process.poll() is not None:
+            raise RuntimeError(f"{what} exited:\n{log_tail(log_path)}")
+        try:
+            return check()
+        except requests.exceptions.RequestException:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{what} didn't start within {timeout} seconds")
+            time.sleep(0.2)
+
+
+# Wait for a child to exit and return (exit code, peak RSS in MB, CPU seconds)
+def reap(process):
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak_rss = usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    return process.returncode, peak_rss, usage.ru_utime + usage.ru_stime
+
+
+def start_fake_node(args, log_path):
+    with socket.socket() as sock:
+        if sock.connect_ex((app.rpc_host, app.rpc_port)) == 0:
+            sys.exit(f"Something is already listening on {app.rpc_host}:{app.rpc_port}, where the fake node "
+                     f"needs to run. Stop the node first.")
+    command = [sys.executable, os.path.join(repo_directory, 'fakenode.py'), '--port', str(app.rpc_port),
+               '--blocks', str(args.blocks), '--txs-per-block', str(args.txs_per_block),
+               '--inputs', str(args.inputs), '--outputs', str(args.outputs), '--seed', str(args.seed),
+               '--latency', str(args.latency)]
+    with open(log_path, 'w') as log:
+        process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT)
+    url = f'http://{app.rpc_user}:{app.rpc_password}@{app.rpc_host}:{app.rpc_port}'
+
+    def check():
+        requests.post(url, json={'method': 'getblockcount', 'params': [], 'id': 0}, timeout=5).raise_for_status()
+    wait_until_ready(check, process, log_path, 'The fake node')
+    return process
+
+
+# Index the whole fake chain with parse_blocks() in a child process, so its memory is measured
+# on its own
+def run_indexer(args, directory):
+    log_path = os.path.join(directory, 'indexer.log')
+    code = ('import time, indexer; indexer.initialize_database(); started = time.monotonic(); '
+            f'indexer.parse_blocks(to_height={args.blocks}); '
+            'print(f"parse_blocks seconds: {time.monotonic() - started}")')
+    environment = dict(os.environ, PYTHONPATH=repo_directory)
+    with open(log_path, 'w') as log:
+        process = subprocess.Popen([sys.executable, '-c', code], cwd=directory, env=environment,
+                                   stdout=log, stderr=subprocess.STDOUT)
+    exit_code, peak_rss, cpu_seconds = reap(process)
+
+    with open(log_path) as f:
+        seconds = [float(line.split(':')[1]) for line in f if line.startswith('parse_blocks seconds:')]
+    db = sqlite3.connect(os.path.join(directory, app.database_path()))
+    indexed_height = db.execute('SELECT height FROM indexer_state').fetchone()[0]
+    if exit_code != 0 or not seconds or indexed_height != args.blocks:
+        raise RuntimeError(f"Indexing stopped at block {indexed_height} of {args.blocks}:\n{log_tail(log_path)}")
+    rows = {table: db.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] for table in indexed_tables}
+    db.close()
+
+    return {
+        'blocks': args.blocks,
+        'seconds': seconds[0],
+        'cpu_seconds': cpu_seconds,
+        'blocks_per_sec': args.blocks / seconds[0],
+        'rows': rows,
+        'rows_per_sec': sum(rows.values()) / seconds[0],
+        'peak_rss_mb': peak_rss,
+        'database_mb': os.path.getsize(os.path.join(directory, app.database_path())) / (1024 * 1024),
+    }
+
+
+# URLs to request for each route, picked from what was indexed. Each list starts with one extra
+# URL, requested first and not measured, so the route's first-use costs aren't counted. On a small
+# chain a list can be shorter than two, e.g. when the busiest address has a single page of history.
+def pick_urls(directory, count, rng):
+    db = sqlite3.connect(os.path.join(directory, app.database_path()))
+
+    def sample(items):
+        return rng.sample(items, min(len(items), count + 1))
+
+    tip = db.execute('SELECT MAX(height) FROM block_summary').fetchone()[0]
+    heights = sample(range(1, tip + 1))
+    block_hashes = [row[0].hex() for row in db.execute('SELECT hash FROM block_summary')]
+    txids = sample([row[0].hex() for row in db.execute('SELECT txid FROM tx_summary')])
+    addresses = sample([row[0] for row in db.execute('''
+        SELECT address FROM address_summary JOIN addresses ON addresses.id = address_summary.address_id
+    ''')])
+
+    # Pages from the older half of the busiest address's history, reached by their cursors
+    address_id, busiest = db.execute('''
+        SELECT address_id, address FROM address_summary JOIN addresses ON addresses.id = address_summary.address_id
+        ORDER BY tx_count DESC LIMIT 1
+    ''').fetchone()
+    history = db.execute('''
+        SELECT block_height, txid, type FROM address_transactions WHERE address_id = ?
+        GROUP BY block_height, txid, type ORDER BY block_height DESC, txid DESC, type DESC
+    ''', (address_id,)).fetchall()
+    pages = len(history) // address_page_size
+    cursors = sample([app.encode_address_cursor((txid.hex(), tx_type, None, height))
+                      for height, txid, tx_type in (history[page * address_page_size - 1]
+                                                    for page in range(max(1, pages // 2), pages))])
+    db.close()
+
+    searches = []
+    for n in range(count + 1):
+        kind = n % 4
+        if kind == 0:
+            searches.append(str(rng.randrange(1, tip + 1)))
+        elif kind == 1:
+            searches.append(rng.choice(block_hashes))
+        elif kind == 2:
+            searches.append(rng.choice(txids))
+        else:
+            searches.append(rng.choice(addresses))
+
+    return {
+        'home': [f'/?page={page}' for page in sample(range(1, tip // 10 + 1))],
+        'block': [f'/block?height={height}' for height in heights],
+        'transaction': [f'/transaction?txid={txid}' for txid in txids],
+        'address': [f'/address?address={address}' for address in addresses],
+        'address_deep': [f'/address?address={busiest}&before={cursor}' for cursor in cursors],
+        'search': [f'/search?query={query}' for query in searches],
+    }
+
+
+# Calls and requests the web worker made to the node. The mempool tracker polls the node in the
+# background, one getrawmempool call per tick while the fake mempool is empty, so those are left out.
+def node_usage(metrics):
+    ticks = metrics['mempool'].get('ticks', 0)
+    return metrics['rpc']['calls'] - ticks, metrics['rpc']['requests'] - ticks
+
+
+def measure_route(session, base_url, urls):
+    session.get(base_url + urls[0], allow_redirects=False)
+    calls_before, requests_before = node_usage(session.get(base_url + '/metrics').json())
+    times = []
+    errors = 0
+    cache_hits = 0
+    for url in urls[1:]:
+        started = time.perf_counter()
+        response = session.get(base_url + url, allow_redirects=False)
+        times.append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 400:
+            errors += 1
+        if response.headers.get('X-Cache') in ('HIT', 'STALE'):
+            cache_hits += 1
+    calls_after, requests_after = node_usage(session.get(base_url + '/metrics').json())
+
+    measured = max(1, len(times))
+    return {
+        'requests': len(times),
+        'errors': errors,
+        'cache_hits': cache_hits,
+        'p50_ms': percentile(times, 0.5),
+        'p95_ms': percentile(times, 0.95),
+        'p99_ms': percentile(times, 0.99),
+        'mean_ms': sum(times) / measured,
+        'max_ms': max(times, default=0),
+        'rpc_calls_per_request': (calls_after - calls_before) / measured,
+        'rpc_requests_per_request': (requests_after - requests_before) / measured,
+    }
+
+
+# Serve the explorer from a child process and time the routes through it. Routes with nothing to
+# measure are left out of the results and listed as not measured.
+def run_routes(args, directory):
+    log_path = os.path.join(directory, 'web.log')
+    port = free_port()
+    code = f'import app; app.app.run(host="127.0.0.1", port={port}, threaded=False, use_reloader=False)'
+    environment = dict(os.environ, PYTHONPATH=repo_directory)
+    with open(log_path, 'w') as log:
+        process = subprocess.Popen([sys.executable, '-c', code], cwd=directory, env=environment,
+                                   stdout=log, stderr=subprocess.STDOUT)
+    base_url = f'http://127.0.0.1:{port}'
+    session = requests.Session()
+    try:
+        wait_until_ready(lambda: session.get(base_url + '/metrics', timeout=5).raise_for_status(),
+                         process, log_path, 'The web server')
+        urls = pick_urls(directory, args.requests, random.Random(args.seed))
+        routes = {}
+        not_measured = []
+        for name, route_urls in urls.items():
+            if len(route_urls) < 2:
+                not_measured.append(name)
+                print(f"{name:>12}: not measured, the chain is too small to give it any URLs")
+                continue
+            routes[name] = measure_route(session, base_url, route_urls)
+            print(f"{name:>12}: p50 {routes[name]['p50_ms']:7.2f} ms  p95 {routes[name]['p95_ms']:7.2f} ms  "
+                  f"p99 {routes[name]['p99_ms']:7.2f} ms  {routes[name]['rpc_calls_per_request']:5.1f} RPC calls "
+                  f"per page  ({routes[name]['requests']} requests, {routes[name]['errors']} errors)")
+    finally:
+        session.close()
+        process.send_signal(signal.SIGTERM)
+        _, peak_rss, _ = reap(process)
+    return routes, not_measured, {'peak_rss_mb': peak_rss}
+
+
+def git_commit():
+    try:
+        output = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=repo_directory,
+                                capture_output=True, text=True)
+    except OSError:
+        return None
+    return output.stdout.strip() or None
+
+
+def run_benchmark(args):
+    if app.databaseLocation:
+        sys.exit("Set databaseLocation to \"\" in app.py for the benchmark, so its database is made in a "
+                 "scratch directory rather than next to the real one")
+    directory = tempfile.mkdtemp(prefix='explorer-benchmark-')
+    node = None
+    try:
+        print(f"Generating a chain of {args.blocks} blocks with {args.txs_per_block} transactions each...")
+        node = start_fake_node(args, os.path.join(directory, 'fakenode.log'))
+
+        print("Indexing...")
+        indexer = run_indexer(args, directory)
+        print(f"Indexed {indexer['blocks']} blocks in {indexer['seconds']:.1f} seconds: "
+              f"{indexer['blocks_per_sec']:.1f} blocks/sec, {indexer['rows_per_sec']:.0f} rows/sec, "
+              f"peak RSS {indexer['peak_rss_mb']:.0f} MB")
+
+        print("Requesting pages...")
+        routes, not_measured, web = run_routes(args, directory)
+        print(f"Web server peak RSS {web['peak_rss_mb']:.0f} MB")
+    finally:
+        if node is not None:
+            node.terminate()
+            node.wait()
+        if args.keep:
+            print(f"Kept the database and logs in {directory}")
+        else:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    results = {
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'settings': {
+            'blocks': args.blocks,
+            'txs_per_block': args.txs_per_block,
+            'inputs': args.inputs,
+            'outputs': args.outputs,
+            'seed': args.seed,
+            'latency_ms': args.latency,
+            'requests': args.requests,
+            'indexer_mode': app.indexerMode,
+            'indexer_threads': app.indexerThreads,
+        },
+        'indexer': indexer,
+        'routes': routes,
+        'not_measured': not_measured,
+        'web': web,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        return compare(baseline, results, args.tolerance, args.min_ms)
+    return 0
+
+
+# (name, value, higher is better, kind) for every number compare() looks at. Timings and memory
+# vary from run to run; counts ('count') come out the same every time for the same code.
+def comparable_metrics(results):
+    indexer = results['indexer']
+    yield 'indexer blocks/sec', indexer['blocks_per_sec'], True, 'rate'
+    yield 'indexer rows/sec', indexer['rows_per_sec'], True, 'rate'
+    yield 'indexer peak RSS MB', indexer['peak_rss_mb'], False, 'memory'
+    for name, route in results['routes'].items():
+        for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+            yield f'{name} {key[:3]} ms', route[key], False, 'ms'
+        yield f'{name} RPC calls/page', route['rpc_calls_per_request'], False, 'count'
+        yield f'{name} RPC requests/page', route['rpc_requests_per_request'], False, 'count'
+        yield f'{name} errors', route['errors'], False, 'count'
+    yield 'web peak RSS MB', results['web']['peak_rss_mb'], False, 'memory'
+
+
+# Print each metric next to its baseline and return 1 if any got worse: counts by any amount, the
+# rest by more than tolerance percent. Latencies also have to be at least min_ms worse, so
+# sub-millisecond jitter doesn't count.
+def compare(baseline, current, tolerance, min_ms):
+    if baseline['settings'] != current['settings']:
+        print("Warning: the two runs used different settings, so they aren't directly comparable:")
+        for key in sorted(set(baseline['settings']) | set(current['settings'])):
+            if baseline['settings'].get(key) != current['settings'].get(key):
+                print(f"  {key}: {baseline['settings'].get(key)} -> {current['settings'].get(key)}")
+
+    print(f"Baseline {baseline.get('commit')} ({baseline['created']}), current {current.get('commit')} "
+          f"({current['created']}), tolerance {tolerance}%")
+    old_metrics = {name: value for name, value, _, _ in comparable_metrics(baseline)}
+    regressions = []
+    for name, value, higher_is_better, kind in comparable_metrics(current):
+        old = old_metrics.get(name)
+        if old is None:
+            print(f"{name:<32} {'':>10} {value:10.2f}  (new)")
+            continue
+        change = (value - old) / old * 100 if old else (0 if value == old else float('inf'))
+        worse = -change if higher_is_better else change
+        if kind == 'count':
+            regressed = worse > 0
+        else:
+            regressed = worse > tolerance and not (kind == 'ms' and abs(value - old) < min_ms)
+        if regressed:
+            regressions.append(name)
+        mark = 'REGRESSION' if regressed else ('better' if -worse > tolerance else '')
+        print(f"{name:<32} {old:10.2f} {value:10.2f} {change:+8.1f}%  {mark}")
+    current_names = {name for name, _, _, _ in comparable_metrics(current)}
+    for name, old in old_metrics.items():
+        if name not in current_names:
+            print(f"{name:<32} {old:10.2f} {'':>10}  (not measured)")
+
+    if regressions:
+        print(f"{len(regressions)} regressions: {', '.join(regressions)}")
+        return 1
+    print("No regressions")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the indexer and pages against a fake node')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='run the benchmark and write the results as JSON')
+    run.add_argument('--output', default='benchmark.json')
+    run.add_argument('--baseline', help='results to compare with afterwards')
+    run.add_argument('--blocks', type=int, default=1000)
+    run.add_argument('--txs-per-block', type=int, default=20)
+    run.add_argument('--inputs', type=int, default=2)
+    run.add_argument('--outputs', type=int, default=2)
+    run.add_argument('--seed', type=int, default=1)
+    run.add_argument('--latency', type=float, default=0, help='milliseconds the fake node adds to every request')
+    run.add_argument('--requests', type=int, default=100, help='requests per route')
+    run.add_argument('--keep', action='store_true', help='keep the scratch database and logs')
+
+    compare_command = commands.add_parser('compare', help='compare results with a baseline')
+    compare_command.add_argument('baseline')
+    compare_command.add_argument('current')
+
+    for command in (run, compare_command):
+        command.add_argument('--tolerance', type=float, default=25,
+                             help='percent a timing or memory figure may get worse by')
+        command.add_argument('--min-ms', type=float, default=1,
+                             help='latencies must also get this many milliseconds worse to count')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        sys.exit(run_benchmark(args))
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    sys.exit(compare(baseline, current, args.tolerance, args.min_ms))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+import glob
+import mmap
+import os
+import struct
+
+from bitcoin.core import Hash, b2lx
+
+NULL_HASH = b'\x00' * 32
+
+
+# Where one block lives in the blk*.dat files
+class BlockRecord:
+    __slots__ = ('file_index', 'offset', 'size')
+
+    def __init__(self, file_index, offset, size):
+        self.file_index = file_index
+        self.offset = offset
+        self.size = size
+
+
+# Read-only view of a node's blocks directory. Each blk*.dat file is memory-mapped and made of
+# records of <network magic> <4-byte little-endian size> <serialized block>, in the order the node
+# received the blocks, which isn't necessarily height order.
+class BlockFiles:
+    def __init__(self, blocks_dir, magic):
+        self.magic = bytes.fromhex(magic)
+        self.files = []
+        self.maps = []
+        self.views = []
+
+        # Newer Bitcoin Core versions XOR the block files with a key from xor.dat
+        xor_path = os.path.join(blocks_dir, 'xor.dat')
+        if os.path.exists(xor_path):
+            with open(xor_path, 'rb') as f:
+                if any(f.read()):
+                    raise ValueError(f"{blocks_dir} is obfuscated (xor.dat), restart the node with -blocksxor=0")
+
+        for path in sorted(glob.glob(os.path.join(blocks_dir, 'blk[0-9]*.dat'))):
+            if os.path.getsize(path) == 0:
+                continue
+            f = open(path, 'rb')
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.files.append(f)
+            self.maps.append(data)
+            self.views.append(memoryview(data))
+        if not self.maps:
+            raise ValueError(f"no blk*.dat files found in {blocks_dir}")
+
+    # Every complete block record, in file order. Zero padding (files are preallocated) and
+    # anything else that doesn't start with the magic is skipped; a truncated record ends the file.
+    def records(self):
+        magic = self.magic
+        for file_index, data in enumerate(self.maps):
+            pos = 0
+            end = len(data)
+            while pos + 8 <= end:
+                if data[pos:pos + 4] != magic:
+                    pos = data.find(magic, pos + 1)
+                    if pos == -1:
+                        break
+                    continue
+                size = struct.unpack_from('<I', data, pos + 4)[0]
+                start = pos + 8
+                if size < 80 or start + size > end:
+                    break
+                yield BlockRecord(file_index, start, size)
+                pos = start + size
+
+    # The serialized block, as a view into the mapped file rather than a copy
+    def block(self, record):
+        return self.views[record.file_index][record.offset:record.offset + record.size]
+
+    def header(self, record):
+        return self.views[record.file_index][record.offset:record.offset + 80]
+
+    def block_hash(self, record):
+        return b2lx(Hash(self.header(record)))
+
+    def block_time(self, record):
+        return struct.unpack_from('<I', self.header(record), 68)[0]
+
+    # Records of the longest chain in the files, indexed by height. Blocks are linked through their
+    # previous block hash, so stale blocks and blocks whose parent isn't in the files are left out.
+    def best_chain(self):
+        index = {}  # block hash -> (previous block hash, record)
+        for record in self.records():
+            header = self.header(record)
+            index[Hash(header)] = (bytes(header[4:36]), record)
+
+        heights = {NULL_HASH: -1}
+        best_hash = None
+        best_height = -1
+        for block_hash in index:
+            # Walk back to a block whose height is already known, then number the path forwards
+            path = []
+            current = block_hash
+            while current not in heights and current in index:
+                path.append(current)
+                current = index[current][0]
+            height = heights.get(current)
+            for ancestor in reversed(path):
+                height = height + 1 if height is not None else None
+                heights[ancestor] = height
+            if height is not None and height > best_height:
+                best_hash, best_height = block_hash, height
+
+        chain = [None] * (best_height + 1)
+        current = best_hash
+        for height in range(best_height, -1, -1):
+            previous, chain[height] = index[current]
+            current = previous
+        return chain
+
+    def close(self):
+        for view in self.views:
+            view.release()
+        for data in self.maps:
+            data.close()
+        for f in self.files:
+            f.close()
+        self.views, self.maps, self.files = [], [], []
@@ -0,0 +1,354 @@
+import copy
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+
+# Last good result of recent calls, answered with while the node can't be reached
+stale_max_entries = 1000
+stale_max_bytes = 32 * 1024 * 1024
+
+
+# Rough number of bytes an RPC result takes in memory, used to bound the cache by size
+def approx_size(value):
+    if isinstance(value, dict):
+        return 64 + sum(approx_size(k) + approx_size(v) for k, v in value.items())
+    if isinstance(value, list):
+        return 56 + sum(approx_size(item) for item in value)
+    if isinstance(value, str):
+        return 49 + len(value)
+    return 32
+
+
+# Thread-safe LRU cache bounded by both entry count and approximate size in bytes.
+# Entries stored as volatile (data close to the chain tip) are dropped by drop_volatile().
+class LRUCache:
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (value, size, volatile)
+        self.volatile_keys = set()
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size, volatile=False):
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            self._remove(key)
+            self.entries[key] = (value, size, volatile)
+            self.bytes += size
+            if volatile:
+                self.volatile_keys.add(key)
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    # Forget everything that may change when the tip moves
+    def drop_volatile(self):
+        with self.lock:
+            for key in list(self.volatile_keys):
+                self._remove(key)
+                self.invalidations += 1
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+            self.volatile_keys.discard(key)
+
+    def get_stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.bytes,
+                'volatile_entries': len(self.volatile_keys),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+# Wraps an RPCClient and answers getblock, getblockhash and verbose getrawtransaction calls from
+# an LRU cache. Blocks and transactions with at least stable_confirmations confirmations are kept
+# until evicted; anything closer to the tip is dropped as soon as the tip changes. When the node
+# is down, calls are answered with their last known result if there is one.
+class CachedRPCClient:
+    def __init__(self, client, max_entries, max_bytes, stable_confirmations):
+        self.client = client
+        self.cache = LRUCache(max_entries, max_bytes)
+        self.stale = LRUCache(stale_max_entries, stale_max_bytes)
+        self.stale_served = 0
+        self.stable_confirmations = stable_confirmations
+        self.tip_height = None
+        self.tip_hash = None
+        self.tip_lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return lambda *params: self.call(name, *params)
+
+    def call(self, method, *params):
+        return self.batch([(method, params)])[0]
+
+    def batch_call(self, method, params_list):
+        return self.batch([(method, params) for params in params_list])
+
+    # Answer what we can from the cache and send everything else to the node in one batch
+    def batch(self, calls):
+        results = [None] * len(calls)
+        misses = []
+        for i, (method, params) in enumerate(calls):
+            key = self.cache_key(method, params)
+            cached = self.cache.get(key) if key else None
+            if cached is None:
+                misses.append(i)
+            else:
+                results[i] = self.from_cache(method, cached)
+
+        try:
+            fetched = self.client.batch([calls[i] for i in misses])
+        except requests.exceptions.RequestException:
+            return self.answer_stale(calls, misses, results)
+
+        for i, result in zip(misses, fetched):
+            method, params = calls[i]
+            self.stale.put(self.stale_key(method, params), result, approx_size(result))
+            if method == 'getblockcount':
+                self.note_tip(result)
+            key = self.cache_key(method, params)
+            if key:
+                self.store(key, method, params, result)
+            results[i] = result
+        return results
+
+    # The node couldn't be reached: fill in the misses with stale results, or re-raise if any
+    # of them has never been seen
+    def answer_stale(self, calls, misses, results):
+        stale = [self.stale.get(self.stale_key(*calls[i])) for i in misses]
+        if any(result is None for result in stale):
+            raise
+        for i, result in zip(misses, stale):
+            results[i] = copy.deepcopy(result)
+        self.stale_served += len(misses)
+        return results
+
+    def stale_key(self, method, params):
+        return (method, json.dumps(params, default=str))
+
+    # Record the current tip; near-tip entries are dropped whenever it changes. Returns whether it did.
+    def note_tip(self, height, block_hash=None):
+        with self.tip_lock:
+            changed = height != self.tip_height or (block_hash is not None and block_hash != self.tip_hash)
+            self.tip_height = height
+            if block_hash is not None:
+                self.tip_hash = block_hash
+            elif changed:
+                self.tip_hash = None
+        if changed:
+            self.cache.drop_volatile()
+        return changed
+
+    # A new block was announced; drop near-tip entries straight away, before its height is known
+    def note_block(self, block_hash):
+        with self.tip_lock:
+            changed = block_hash != self.tip_hash
+        if changed:
+            self.cache.drop_volatile()
+
+    def cache_key(self, method, params):
+        if method == 'getblock' and (len(params) < 2 or params[1]):
+            return ('getblock', params[0])
+        if method == 'getrawtransaction' and len(params) > 1 and params[1]:
+            return ('getrawtransaction', params[0])
+        if method == 'getblockhash':
+            return ('getblockhash', params[0])
+        return None
+
+    def store(self, key, method, params, result):
+        tip_height = self.tip_height
+        if method == 'getblockhash':
+            height = params[0]
+            volatile = tip_height is None or height > tip_height - self.stable_confirmations
+            self.cache.put(key, (result, height), approx_size(result), volatile)
+            return
+
+        confirmations = result.get('confirmations')
+        if not confirmations or confirmations < 0:
+            return  # Mempool transactions and stale blocks (-1 confirmations) aren't cached
+        if method == 'getblock':
+            height = result['height']
+        elif tip_height is not None:
+            height = tip_height - confirmations + 1
+        else:
+            height = None
+        volatile = confirmations < self.stable_confirmations or height is None
+        self.cache.put(key, (result, height), approx_size(result), volatile)
+
+    # Hand out a copy with the confirmation count brought up to date, since callers
+    # annotate the dicts they get back
+    def from_cache(self, method, cached):
+        result, height = cached
+        if method == 'getblockhash':
+            return result
+        result = copy.deepcopy(result)
+        if height is not None and self.tip_height is not None:
+            result['confirmations'] = self.tip_height - height + 1
+        return result
+
+    def get_stats(self):
+        stats = self.client.get_stats()
+        stats['cache'] = self.cache.get_stats()
+        stats['stale_served'] = self.stale_served
+        return stats
+
+
+# Coalesces concurrent calls for the same key: the first caller does the work and the others wait
+# for its result
+class SingleFlight:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}  # key -> [done event, result, exception]
+        self.coalesced = 0
+        self.coalesced_wait_seconds = 0.0
+
+    def do(self, key, work):
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = [threading.Event(), None, None]
+        if leader:
+            try:
+                flight[1] = work()
+            except Exception as e:
+                flight[2] = e
+            finally:
+                with self.lock:
+                    del self.flights[key]
+                flight[0].set()
+        else:
+            started = time.monotonic()
+            flight[0].wait()
+            with self.lock:
+                self.coalesced += 1
+                self.coalesced_wait_seconds += time.monotonic() - started
+        if flight[2] is not None:
+            raise flight[2]
+        return flight[1]
+
+    def running(self, key):
+        with self.lock:
+            return key in self.flights
+
+
+# Rendered pages keyed by route and arguments. An entry is fresh while the chain tip it was
+# rendered at is still the tip and it is younger than max_age seconds. Misses on the same key are
+# rendered once. Pages are dropped as soon as the tip changes, except stale_while_revalidate ones,
+# which keep being served while a background thread renders the new version.
+class PageCache:
+    def __init__(self, max_entries, max_bytes, max_age):
+        self.cache = LRUCache(max_entries, max_bytes)
+        self.max_age = max_age
+        self.single_flight = SingleFlight()
+        self.tip = None
+        self.lock = threading.Lock()
+        self.revalidating = set()  # Background render threads still running
+        self.stats = {'hits': 0, 'misses': 0, 'stale_served': 0, 'renders': 0, 'revalidations': 0,
+                      'uncacheable': 0, 'tip_changes': 0}
+
+    # render() returns (page, size, cacheable); the page itself is opaque to the cache.
+    # Returns (page, how) where how is 'hit', 'stale' or 'miss'.
+    def get(self, key, tip, render, stale_while_revalidate=False, render_in_background=None):
+        self.note_tip(tip)
+        entry = self.cache.get(key)
+        if entry is not None:
+            page, entry_tip, created = entry
+            if entry_tip == tip and time.monotonic() - created < self.max_age:
+                self.count('hits')
+                return page, 'hit'
+            if stale_while_revalidate:
+                self.count('stale_served')
+                self.revalidate(key, tip, render_in_background or render, stale_while_revalidate)
+                return page, 'stale'
+        self.count('misses')
+        return self.single_flight.do((key, tip), lambda: self.render(key, tip, render, stale_while_revalidate)), 'miss'
+
+    # A new block arrived: forget the pages rendered at the old tip
+    def note_tip(self, tip):
+        with self.lock:
+            if tip == self.tip:
+                return
+            self.tip = tip
+            self.stats['tip_changes'] += 1
+        self.cache.drop_volatile()
+
+    def render(self, key, tip, render, keep_when_stale):
+        self.count('renders')
+        page, size, cacheable = render()
+        if cacheable and tip == self.tip:
+            self.cache.put(key, (page, tip, time.monotonic()), size, volatile=not keep_when_stale)
+        elif not cacheable:
+            self.count('uncacheable')
+        return page
+
+    def revalidate(self, key, tip, render, keep_when_stale):
+        if self.single_flight.running((key, tip)):
+            return
+        self.count('revalidations')
+
+        def run():
+            try:
+                self.single_flight.do((key, tip), lambda: self.render(key, tip, render, keep_when_stale))
+            except Exception as e:
+                print(f"Error revalidating cached page: {e}")
+            finally:
+                with self.lock:
+                    self.revalidating.discard(thread)
+        thread = threading.Thread(target=run, daemon=True)
+        with self.lock:
+            self.revalidating.add(thread)
+        thread.start()
+
+    # Wait for the background renders started so far to finish
+    def join(self, timeout=None):
+        with self.lock:
+            threads = list(self.revalidating)
+        for thread in threads:
+            thread.join(timeout)
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+        lookups = stats['hits'] + stats['stale_served'] + stats['misses']
+        stats['hit_ratio'] = (stats['hits'] + stats['stale_served']) / lookups if lookups else 0
+        stats['coalesced_waits'] = self.single_flight.coalesced
+        stats['coalesced_wait_seconds'] = self.single_flight.coalesced_wait_seconds
+        storage = self.cache.get_stats()
+        for name in ('entries', 'bytes', 'evictions', 'invalidations'):
+            stats[name] = storage[name]
+        return stats
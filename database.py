@@ -0,0 +1,413 @@
+import time
+
+# Values of address_transactions.type
+RECEIVED = 0
+SENT = 1
+TYPE_NAMES = {RECEIVED: 'received', SENT: 'sent'}
+
+
+# Version 1: the original text-based schema plus the outputs table
+def migrate_to_v1(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS address_transactions (
+        address TEXT,
+        txid TEXT,
+        value REAL,
+        type TEXT,  -- 'received' or 'sent'
+        block_height INTEGER
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS outputs (
+        txid TEXT,
+        vout INTEGER,
+        value INTEGER,  -- satoshis
+        address TEXT,  -- NULL for outputs without an address
+        block_height INTEGER,
+        spent_by TEXT,  -- txid of the spending transaction, NULL while unspent
+        spent_height INTEGER
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS outputs_outpoint ON outputs (txid, vout)')
+
+
+# Version 2: compact schema. Addresses are interned into the addresses table, txids are
+# stored as 32-byte blobs, values as integer satoshis and types as integers.
+def migrate_to_v2(cursor):
+    cursor.execute('''
+    CREATE TABLE addresses (
+        id INTEGER PRIMARY KEY,
+        address TEXT NOT NULL UNIQUE
+    )
+    ''')
+    cursor.execute('''
+    INSERT INTO addresses (address)
+    SELECT address FROM address_transactions
+    UNION
+    SELECT address FROM outputs WHERE address IS NOT NULL
+    ''')
+
+    cursor.execute('ALTER TABLE address_transactions RENAME TO address_transactions_v1')
+    cursor.execute('''
+    CREATE TABLE address_transactions (
+        address_id INTEGER NOT NULL,
+        txid BLOB NOT NULL,
+        value INTEGER NOT NULL,  -- satoshis
+        type INTEGER NOT NULL,  -- RECEIVED or SENT
+        block_height INTEGER NOT NULL
+    )
+    ''')
+    cursor.execute('''
+    INSERT INTO address_transactions (address_id, txid, value, type, block_height)
+    SELECT addresses.id, unhex(old.txid), CAST(ROUND(old.value * 100000000) AS INTEGER),
+           CASE old.type WHEN 'received' THEN ? ELSE ? END, old.block_height
+    FROM address_transactions_v1 AS old JOIN addresses ON addresses.address = old.address
+    ''', (RECEIVED, SENT))
+    cursor.execute('DROP TABLE address_transactions_v1')
+
+    cursor.execute('ALTER TABLE outputs RENAME TO outputs_v1')
+    cursor.execute('DROP INDEX IF EXISTS outputs_outpoint')
+    cursor.execute('''
+    CREATE TABLE outputs (
+        txid BLOB NOT NULL,
+        vout INTEGER NOT NULL,
+        value INTEGER NOT NULL,  -- satoshis
+        address_id INTEGER,  -- NULL for outputs without an address
+        block_height INTEGER NOT NULL,
+        spent_by BLOB,  -- txid of the spending transaction, NULL while unspent
+        spent_height INTEGER
+    )
+    ''')
+    cursor.execute('''
+    INSERT INTO outputs (txid, vout, value, address_id, block_height, spent_by, spent_height)
+    SELECT unhex(old.txid), old.vout, old.value, addresses.id, old.block_height, unhex(old.spent_by), old.spent_height
+    FROM outputs_v1 AS old LEFT JOIN addresses ON addresses.address = old.address
+    ''')
+    cursor.execute('DROP TABLE outputs_v1')
+
+    # Indexes are built after loading so the copy above doesn't maintain them row by row.
+    # (address_id, block_height, txid, type, value) covers the whole /address page.
+    cursor.execute('''
+    CREATE INDEX address_transactions_address
+    ON address_transactions (address_id, block_height, txid, type, value)
+    ''')
+    cursor.execute('CREATE INDEX address_transactions_height ON address_transactions (block_height)')
+    cursor.execute('CREATE INDEX outputs_outpoint ON outputs (txid, vout)')
+
+
+# Version 3: per-address totals kept up to date by the indexer, so /address reads one row
+def migrate_to_v3(cursor):
+    cursor.execute('''
+    CREATE TABLE address_summary (
+        address_id INTEGER PRIMARY KEY,
+        received INTEGER NOT NULL,  -- satoshis
+        sent INTEGER NOT NULL,  -- satoshis
+        balance INTEGER NOT NULL,  -- satoshis
+        tx_count INTEGER NOT NULL,
+        first_seen_height INTEGER NOT NULL,
+        last_seen_height INTEGER NOT NULL
+    )
+    ''')
+    cursor.execute('''
+    INSERT INTO address_summary
+    SELECT address_id, received, sent, received - sent, tx_count, first_seen_height, last_seen_height
+    FROM (
+        SELECT address_id,
+               COALESCE(SUM(CASE WHEN type = ? THEN value END), 0) AS received,
+               COALESCE(SUM(CASE WHEN type = ? THEN value END), 0) AS sent,
+               COUNT(DISTINCT txid) AS tx_count,
+               MIN(block_height) AS first_seen_height,
+               MAX(block_height) AS last_seen_height
+        FROM address_transactions
+        GROUP BY address_id
+    )
+    ''', (RECEIVED, SENT))
+
+
+# Version 4: per-block and per-transaction summaries written by the indexer, so the homepage
+# and block pages don't need the node for blocks that are already indexed
+def migrate_to_v4(cursor):
+    cursor.execute('''
+    CREATE TABLE block_summary (
+        height INTEGER PRIMARY KEY,
+        hash BLOB NOT NULL,
+        merkle_root BLOB NOT NULL,
+        time INTEGER NOT NULL,
+        difficulty REAL NOT NULL,
+        size INTEGER NOT NULL,
+        tx_count INTEGER NOT NULL,
+        total_out INTEGER NOT NULL,  -- satoshis
+        total_fees INTEGER NOT NULL,  -- satoshis
+        time_to_mine INTEGER NOT NULL  -- seconds since the previous block
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE tx_summary (
+        txid BLOB PRIMARY KEY,
+        block_height INTEGER NOT NULL,
+        position INTEGER NOT NULL,  -- index in the block, 0 is the coinbase
+        size INTEGER NOT NULL,
+        total_out INTEGER NOT NULL,  -- satoshis
+        fee INTEGER NOT NULL,  -- satoshis, 0 for the coinbase
+        inputs INTEGER NOT NULL,
+        outputs INTEGER NOT NULL
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX tx_summary_block ON tx_summary (block_height, position)')
+
+
+# Version 5: look blocks up by hash, for search and autocomplete
+def migrate_to_v5(cursor):
+    cursor.execute('CREATE INDEX block_summary_hash ON block_summary (hash)')
+
+
+# Version 6: find the outputs spent in a block, so a reorg can mark them unspent again
+def migrate_to_v6(cursor):
+    cursor.execute('CREATE INDEX outputs_spent_height ON outputs (spent_height)')
+
+
+# Version 7: the indexer's progress in a single row, written in the same transaction as each batch
+# of blocks, so a restart knows exactly where it stopped without looking at the data
+def migrate_to_v7(cursor):
+    cursor.execute('''
+    CREATE TABLE indexer_state (
+        id INTEGER PRIMARY KEY CHECK (id = 0),
+        height INTEGER NOT NULL,  -- last indexed block
+        hash BLOB,  -- its hash, NULL if it was indexed before block summaries were kept
+        schema_version INTEGER NOT NULL,  -- schema the rows were last written with
+        updated_time INTEGER NOT NULL
+    )
+    ''')
+    # Carry on from what earlier versions inferred from the data
+    cursor.execute('SELECT MAX(block_height) FROM address_transactions')
+    height = cursor.fetchone()[0] or 0
+    cursor.execute('SELECT hash FROM block_summary WHERE height = ?', (height,))
+    row = cursor.fetchone()
+    cursor.execute('INSERT INTO indexer_state VALUES (0, ?, ?, 7, ?)',
+                   (height, row[0] if row else None, int(time.time())))
+
+
+# Ordered list of migrations; the database's PRAGMA user_version is the number already applied
+migrations = [migrate_to_v1, migrate_to_v2, migrate_to_v3, migrate_to_v4, migrate_to_v5, migrate_to_v6,
+              migrate_to_v7]
+schema_version = len(migrations)
+
+
+def unhex(value):
+    return bytes.fromhex(value) if value is not None else None
+
+
+# Bring the database up to the latest schema version
+def migrate(conn):
+    conn.create_function('unhex', 1, unhex, deterministic=True)
+    cursor = conn.cursor()
+    version = cursor.execute('PRAGMA user_version').fetchone()[0]
+
+    # Each migration runs in its own transaction, so an interrupted upgrade can simply be restarted
+    for number, migration in enumerate(migrations[version:], start=version + 1):
+        print(f"Migrating database to schema version {number}...")
+        started = time.monotonic()
+        cursor.execute('BEGIN')
+        migration(cursor)
+        cursor.execute(f'PRAGMA user_version = {number}')
+        conn.commit()
+        print(f"Migrated database to schema version {number} in {time.monotonic() - started:.1f} seconds")
+
+    # Give the space freed by rewritten tables back to the filesystem
+    if version < schema_version:
+        cursor.execute('VACUUM')
+
+
+# Return the id of an address, adding it to the addresses table if it's new
+def intern_address(cursor, address):
+    cursor.execute('SELECT id FROM addresses WHERE address = ?', (address,))
+    row = cursor.fetchone()
+    if row:
+        return row[0]
+    cursor.execute('INSERT INTO addresses (address) VALUES (?)', (address,))
+    return cursor.lastrowid
+
+
+# Return the id of an address, or None if it has never been seen
+def lookup_address_id(cursor, address):
+    cursor.execute('SELECT id FROM addresses WHERE address = ?', (address,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+# Add one block's changes to the address summaries. summaries maps address_id to
+# [received, sent, set of txids] for that block.
+def update_address_summaries(cursor, height, summaries):
+    cursor.executemany('''
+        INSERT INTO address_summary
+            (address_id, received, sent, balance, tx_count, first_seen_height, last_seen_height)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (address_id) DO UPDATE SET
+            received = received + excluded.received,
+            sent = sent + excluded.sent,
+            balance = balance + excluded.balance,
+            tx_count = tx_count + excluded.tx_count,
+            first_seen_height = MIN(first_seen_height, excluded.first_seen_height),
+            last_seen_height = MAX(last_seen_height, excluded.last_seen_height)
+    ''', [(address_id, received, sent, received - sent, len(txids), height, height)
+          for address_id, (received, sent, txids) in summaries.items()])
+
+
+# Undo every block above fork_height after a reorg: their rows are deleted, the outputs they
+# spent become unspent again and their part of the address summaries is taken back off. Only the
+# rows of those blocks are touched, found through the height indexes. Addresses first seen in
+# them stay in the addresses table until they turn up again.
+def rollback_blocks(cursor, fork_height):
+    cursor.execute('''
+        SELECT address_id,
+               COALESCE(SUM(CASE WHEN type = ? THEN value END), 0),
+               COALESCE(SUM(CASE WHEN type = ? THEN value END), 0),
+               COUNT(DISTINCT txid)
+        FROM address_transactions WHERE block_height > ?
+        GROUP BY address_id
+    ''', (RECEIVED, SENT, fork_height))
+    summaries = cursor.fetchall()
+
+    cursor.execute('UPDATE outputs SET spent_by = NULL, spent_height = NULL WHERE spent_height > ?', (fork_height,))
+    cursor.execute('''
+        DELETE FROM outputs WHERE txid IN (SELECT txid FROM tx_summary WHERE block_height > ?)
+    ''', (fork_height,))
+    cursor.execute('DELETE FROM address_transactions WHERE block_height > ?', (fork_height,))
+
+    cursor.executemany('''
+        UPDATE address_summary SET
+            received = received - ?,
+            sent = sent - ?,
+            balance = balance - ?,
+            tx_count = tx_count - ?,
+            last_seen_height = COALESCE((SELECT MAX(block_height) FROM address_transactions
+                                         WHERE address_transactions.address_id = address_summary.address_id), 0)
+        WHERE address_id = ?
+    ''', [(received, sent, received - sent, tx_count, address_id)
+          for address_id, received, sent, tx_count in summaries])
+    # Addresses that only appeared in the undone blocks
+    cursor.execute('DELETE FROM address_summary WHERE first_seen_height > ?', (fork_height,))
+
+    cursor.execute('DELETE FROM tx_summary WHERE block_height > ?', (fork_height,))
+    cursor.execute('DELETE FROM block_summary WHERE height > ?', (fork_height,))
+
+
+# Move the checkpoint; called in the transaction that writes (or undoes) the blocks up to height
+def set_indexer_state(cursor, height, block_hash):
+    cursor.execute('''
+        UPDATE indexer_state SET height = ?, hash = ?, schema_version = ?, updated_time = ? WHERE id = 0
+    ''', (height, unhex(block_hash), schema_version, int(time.time())))
+
+
+# The indexer's checkpoint: height and hash (hex, or None) of the last indexed block, the schema
+# version it was written with and when
+def get_indexer_state(cursor):
+    cursor.execute('SELECT height, hash, schema_version, updated_time FROM indexer_state WHERE id = 0')
+    height, block_hash, version, updated_time = cursor.fetchone()
+    return {'height': height, 'hash': block_hash.hex() if block_hash is not None else None,
+            'schema_version': version, 'updated_time': updated_time}
+
+
+# Hashes of the indexed blocks from start_height to end_height, keyed by height
+def get_block_hashes(cursor, start_height, end_height):
+    cursor.execute('SELECT height, hash FROM block_summary WHERE height BETWEEN ? AND ?', (start_height, end_height))
+    return {height: block_hash.hex() for height, block_hash in cursor.fetchall()}
+
+
+block_summary_columns = ['height', 'hash', 'merkle_root', 'time', 'difficulty', 'size', 'tx_count',
+                         'total_out', 'total_fees', 'time_to_mine']
+tx_summary_columns = ['txid', 'block_height', 'position', 'size', 'total_out', 'fee', 'inputs', 'outputs']
+
+
+# Store the summary of a block and of each of its transactions
+def write_block_summary(cursor, block_summary, tx_summaries):
+    cursor.execute(f'''
+        INSERT OR REPLACE INTO block_summary ({', '.join(block_summary_columns)})
+        VALUES ({', '.join('?' * len(block_summary_columns))})
+    ''', [block_summary[column] for column in block_summary_columns])
+    cursor.executemany(f'''
+        INSERT OR REPLACE INTO tx_summary ({', '.join(tx_summary_columns)})
+        VALUES ({', '.join('?' * len(tx_summary_columns))})
+    ''', [[tx_summary[column] for column in tx_summary_columns] for tx_summary in tx_summaries])
+
+
+# Read the block summaries for the given heights, keyed by height
+def get_block_summaries(cursor, heights):
+    heights = list(heights)
+    cursor.execute(f'''
+        SELECT {', '.join(block_summary_columns)} FROM block_summary
+        WHERE height IN ({', '.join('?' * len(heights))})
+    ''', heights)
+    return {row[0]: dict(zip(block_summary_columns, row)) for row in cursor.fetchall()}
+
+
+# Read the transaction summaries of the blocks at the given heights, in block order
+def get_tx_summaries(cursor, heights):
+    heights = list(heights)
+    cursor.execute(f'''
+        SELECT {', '.join(tx_summary_columns)} FROM tx_summary
+        WHERE block_height IN ({', '.join('?' * len(heights))})
+        ORDER BY block_height, position
+    ''', heights)
+    return [dict(zip(tx_summary_columns, row)) for row in cursor.fetchall()]
+
+
+# The transaction summaries of one block in block order, starting at position `start`. Rows are
+# read as the caller iterates, so a page can be sent while it's still being read.
+def iter_tx_summaries(cursor, height, start, limit):
+    cursor.execute(f'''
+        SELECT {', '.join(tx_summary_columns)} FROM tx_summary
+        WHERE block_height = ? AND position >= ?
+        ORDER BY position
+        LIMIT ?
+    ''', (height, start, limit))
+    for row in cursor:
+        yield dict(zip(tx_summary_columns, row))
+
+
+# Height of the highest block with a summary, or -1 if nothing has been indexed
+def get_indexed_height(cursor):
+    cursor.execute('SELECT MAX(height) FROM block_summary')
+    height = cursor.fetchone()[0]
+    return height if height is not None else -1
+
+
+# Height of the indexed block with this hash (hex), or None
+def find_block_height(cursor, block_hash):
+    cursor.execute('SELECT height FROM block_summary WHERE hash = ?', (bytes.fromhex(block_hash),))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+# Height of the block holding this indexed transaction (hex txid), or None
+def find_transaction_height(cursor, txid):
+    cursor.execute('SELECT block_height FROM tx_summary WHERE txid = ?', (bytes.fromhex(txid),))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+# Smallest and largest 32-byte hash starting with a hex prefix, for range scans on the hash indexes
+def hex_prefix_range(prefix):
+    return bytes.fromhex(prefix.ljust(64, '0')), bytes.fromhex(prefix.ljust(64, 'f'))
+
+
+# (height, hash) of indexed blocks whose hash starts with a hex prefix
+def find_blocks_by_prefix(cursor, prefix, limit):
+    cursor.execute('SELECT height, hash FROM block_summary WHERE hash BETWEEN ? AND ? ORDER BY hash LIMIT ?',
+                   (*hex_prefix_range(prefix), limit))
+    return [(height, block_hash.hex()) for height, block_hash in cursor.fetchall()]
+
+
+# (txid, block height) of indexed transactions whose txid starts with a hex prefix
+def find_transactions_by_prefix(cursor, prefix, limit):
+    cursor.execute('SELECT txid, block_height FROM tx_summary WHERE txid BETWEEN ? AND ? ORDER BY txid LIMIT ?',
+                   (*hex_prefix_range(prefix), limit))
+    return [(txid.hex(), height) for txid, height in cursor.fetchall()]
+
+
+# Known addresses starting with a prefix, using the addresses table's unique index
+def find_addresses_by_prefix(cursor, prefix, limit):
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    cursor.execute('SELECT address FROM addresses WHERE address >= ? AND address < ? ORDER BY address LIMIT ?',
+                   (prefix, upper, limit))
+    return [row[0] for row in cursor.fetchall()]
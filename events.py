@@ -0,0 +1,81 @@
+import threading
+from collections import deque
+
+
+# One client of the event stream. Events wait in a bounded queue; a client that lets it fill up
+# is dropped rather than letting its backlog grow.
+class Subscriber:
+    def __init__(self, max_queued):
+        self.events = deque()
+        self.max_queued = max_queued
+        self.condition = threading.Condition()
+        self.dropped = False
+
+    def push(self, event):
+        with self.condition:
+            if len(self.events) >= self.max_queued:
+                self.dropped = True
+                self.events.clear()
+            else:
+                self.events.append(event)
+            self.condition.notify()
+
+    # The next event, or None if none arrived within timeout seconds or the subscriber was dropped
+    def next(self, timeout):
+        with self.condition:
+            if not self.events and not self.dropped:
+                self.condition.wait(timeout)
+            if self.dropped or not self.events:
+                return None
+            return self.events.popleft()
+
+
+# Fans events out to any number of subscribers. Each event is encoded once, in the Server-Sent
+# Events format, and the same bytes are queued for everyone. The producer, which finds the events,
+# runs on a single background thread started by the first subscriber.
+class EventBroadcaster:
+    def __init__(self, producer, max_queued=100):
+        self.producer = producer
+        self.max_queued = max_queued
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.started = False
+        self.stats = {'events': 0, 'subscribed': 0, 'dropped': 0, 'max_subscribers': 0}
+
+    def subscribe(self):
+        subscriber = Subscriber(self.max_queued)
+        with self.lock:
+            if not self.started:
+                threading.Thread(target=self.producer, daemon=True).start()
+                self.started = True
+            self.subscribers.add(subscriber)
+            self.stats['subscribed'] += 1
+            self.stats['max_subscribers'] = max(self.stats['max_subscribers'], len(self.subscribers))
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    # Send an event to every subscriber. build() returns the event's JSON data as bytes and is
+    # only called if someone is listening.
+    def publish(self, name, build):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        if not subscribers:
+            return
+        event = b'event: ' + name.encode() + b'\ndata: ' + build() + b'\n\n'
+        for subscriber in subscribers:
+            subscriber.push(event)
+            if subscriber.dropped:
+                self.unsubscribe(subscriber)
+                with self.lock:
+                    self.stats['dropped'] += 1
+        with self.lock:
+            self.stats['events'] += 1
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['subscribers'] = len(self.subscribers)
+        return stats
@@ -0,0 +1,120 @@
+import argparse
+import json
+import resource
+import selectors
+import socket
+import time
+from urllib.parse import urlparse
+from urllib.request import urlopen
+
+# Opens many idle /events connections to a running explorer and reports how the events reached
+# them and how much the explorer asked the node meanwhile, to check that the node's load doesn't
+# depend on how many pages are open. All connections are handled on one thread.
+#
+# Usage: python events_load_test.py --url http://127.0.0.1:5000 --subscribers 2000 --seconds 120
+#
+# With several web workers each one has its own producer and /metrics only reports the worker
+# that answered it, so run the explorer with a single worker for this test.
+
+
+def get_metrics(url):
+    with urlopen(url + '/metrics', timeout=30) as response:
+        return json.load(response)
+
+
+class Connection:
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = b''
+        self.events = 0
+        self.closed = False
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Hold many /events connections open and measure them')
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--subscribers', type=int, default=1000)
+    parser.add_argument('--seconds', type=int, default=60)
+    parser.add_argument('--connect-rate', type=int, default=500, help='new connections per second')
+    args = parser.parse_args()
+
+    # Every connection is a file descriptor
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < args.subscribers + 100:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, args.subscribers + 100), hard))
+
+    url = urlparse(args.url)
+    request = f'GET /events HTTP/1.1\r\nHost: {url.netloc}\r\nAccept: text/event-stream\r\n\r\n'.encode()
+    before = get_metrics(args.url)
+
+    selector = selectors.DefaultSelector()
+    connections = []
+    failed = 0
+    arrivals = {}  # event bytes -> times it reached each subscriber
+    started = time.monotonic()
+    deadline = started + args.seconds
+
+    while time.monotonic() < deadline:
+        # Open connections gradually, like visitors arriving
+        wanted = min(args.subscribers, int((time.monotonic() - started) * args.connect_rate) + 1)
+        while len(connections) + failed < wanted:
+            try:
+                sock = socket.create_connection((url.hostname, url.port or 80), timeout=10)
+                sock.sendall(request)
+                sock.setblocking(False)
+            except OSError:
+                failed += 1
+                continue
+            connection = Connection(sock)
+            connections.append(connection)
+            selector.register(sock, selectors.EVENT_READ, connection)
+
+        for key, _ in selector.select(timeout=0.1):
+            connection = key.data
+            try:
+                data = connection.sock.recv(65536)
+            except OSError:
+                data = b''
+            if not data:
+                selector.unregister(connection.sock)
+                connection.sock.close()
+                connection.closed = True
+                continue
+            connection.buffer += data
+            now = time.monotonic()
+            while b'\n\n' in connection.buffer:
+                message, connection.buffer = connection.buffer.split(b'\n\n', 1)
+                start = message.find(b'event: ')
+                if start != -1:
+                    connection.events += 1
+                    arrivals.setdefault(message[start:], []).append(now)
+
+    after = get_metrics(args.url)
+    elapsed = time.monotonic() - started
+    for connection in connections:
+        if not connection.closed:
+            connection.sock.close()
+
+    open_connections = sum(1 for connection in connections if not connection.closed)
+    received = [connection.events for connection in connections]
+    spreads = [max(times) - min(times) for times in arrivals.values()]
+    rpc_requests = after['rpc']['requests'] - before['rpc']['requests']
+    rpc_calls = after['rpc']['calls'] - before['rpc']['calls']
+    print(f"{len(connections)} connected, {failed} failed to connect, {open_connections} still open at the end")
+    print(f"{len(arrivals)} distinct events, {sum(received)} delivered; per subscriber "
+          f"min {min(received, default=0)} max {max(received, default=0)}")
+    print(f"time from first to last subscriber per event: p50 {percentile(spreads, 0.5) * 1000:.0f} ms, "
+          f"p99 {percentile(spreads, 0.99) * 1000:.0f} ms, max {max(spreads, default=0) * 1000:.0f} ms")
+    print(f"node: {rpc_requests} requests, {rpc_calls} calls in {elapsed:.0f}s "
+          f"({rpc_requests / elapsed * 60:.1f} requests/minute)")
+    print(f"explorer: {after['events']['subscribers']} subscribers, {after['events']['dropped']} dropped "
+          f"as too slow, {after['events']['events'] - before['events']['events']} events published")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,477 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import struct
+import threading
+import time
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bitcoin.core import (COIN, COutPoint, CBlock, CBlockHeader, CMutableTransaction, CMutableTxIn, CMutableTxOut,
+                          CTransaction, Hash, Hash160, b2lx, b2x, lx)
+from bitcoin.core.serialize import VarIntSerializer
+from bitcoin.core.script import CScript, OP_CHECKSIG, OP_DUP, OP_EQUAL, OP_EQUALVERIFY, OP_HASH160
+
+import rawblocks
+from app import rpc_port, pubkeyAddressVersion, scriptAddressVersion, bech32Prefix, blockFileMagic
+
+# A stand-in for the coin's node, to try the explorer or measure it without one. It serves a
+# made-up chain over JSON-RPC with the calls the explorer and indexer make (getblockcount,
+# getblockhash, getblock, getrawtransaction, getrawmempool), singly or in batches. The same options
+# always give the same chain, so runs can be compared. Any RPC username and password are accepted,
+# and addresses use the version bytes set in app.py.
+#
+# Usage: python fakenode.py --blocks 2000 --txs-per-block 50 --latency 2
+#
+# With --blocks-directory it also writes the chain to blk*.dat files, to try the bulk import.
+#
+# The whole chain is kept in memory, about 2 KB per transaction.
+
+block_bits = 0x1e0ffff0
+block_reward = 50 * COIN
+
+
+# An error reply, with the same codes as the node
+class RPCError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+BASE58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+
+
+# Base58check address of a version byte and hash. Written out here rather than taken from
+# python-bitcoinlib, so the addresses the fake node reports don't come from the code the indexer
+# uses to work them out in raw mode.
+def base58check(version, payload):
+    data = bytes([version]) + payload
+    data += hashlib.sha256(hashlib.sha256(data).digest()).digest()[:4]
+    number = int.from_bytes(data, 'big')
+    encoded = ''
+    while number:
+        number, remainder = divmod(number, 58)
+        encoded = BASE58_ALPHABET[remainder] + encoded
+    return '1' * (len(data) - len(data.lstrip(b'\0'))) + encoded
+
+
+# Script in the node's asm notation, e.g. "OP_DUP OP_HASH160 <hex> OP_EQUALVERIFY OP_CHECKSIG"
+def script_asm(script):
+    return ' '.join(b2x(op) if isinstance(op, bytes) else str(op) for op in script)
+
+
+# The chain, built block by block from a seeded random generator. Transactions spend randomly
+# chosen unspent outputs and pay randomly chosen addresses, except that hot_share of the outputs
+# go to the first address, so there's one address with a long history.
+class SyntheticChain:
+    def __init__(self, blocks=1000, txs_per_block=20, inputs=2, outputs=2, addresses=10000, hot_share=0.02,
+                 mempool_size=0, seed=1, params=None):
+        self.rng = random.Random(seed)
+        self.params = params or rawblocks.AddressParams(pubkeyAddressVersion, scriptAddressVersion, bech32Prefix)
+        self.txs_per_block = txs_per_block
+        self.inputs = inputs
+        self.outputs = outputs
+        self.hot_share = hot_share
+        self.mempool_size = mempool_size
+        # One in ten addresses is a P2SH address. The type and address the node reports for each
+        # script are worked out from the hash it was built with, not from the script.
+        self.scripts = []
+        self.script_types = {}  # script -> (scriptPubKey type, address)
+        for n in range(addresses):
+            key_hash = Hash160(f'{seed}:{n}'.encode())
+            if n % 10 == 9:
+                script = CScript([OP_HASH160, key_hash, OP_EQUAL])
+                self.script_types[script] = ('scripthash', base58check(self.params.script_version, key_hash))
+            else:
+                script = CScript([OP_DUP, OP_HASH160, key_hash, OP_EQUALVERIFY, OP_CHECKSIG])
+                self.script_types[script] = ('pubkeyhash', base58check(self.params.pubkey_version, key_hash))
+            self.scripts.append(script)
+
+        self.blocks = []  # (header, txids) by height
+        self.hashes = []  # block hash by height
+        self.heights = {}  # block hash -> height
+        self.stale_blocks = {}  # block hash -> (height, raw block) of blocks replaced by reorg()
+        self.txs = {}  # txid -> (CTransaction, raw bytes, height, or None in the mempool)
+        self.unspent = []  # (txid, vout, value) that new transactions can spend
+        self.mempool = []  # (txid, fee) in arrival order
+        self.time = 1600000000
+        self.lock = threading.Lock()
+
+        for _ in range(blocks + 1):
+            self.mine([self.make_tx() for _ in range(txs_per_block if self.blocks else 0)])
+        self.fill_mempool()
+
+    def tip(self):
+        return len(self.blocks) - 1
+
+    def take_unspent(self):
+        n = self.rng.randrange(len(self.unspent))
+        self.unspent[n], self.unspent[-1] = self.unspent[-1], self.unspent[n]
+        return self.unspent.pop()
+
+    def pick_script(self):
+        if self.rng.random() < self.hot_share:
+            return self.scripts[0]
+        return self.rng.choice(self.scripts)
+
+    # A new transaction and its fee, or None if there's nothing left to spend
+    def make_tx(self):
+        count = min(self.inputs, len(self.unspent))
+        if count == 0:
+            return None
+        spent = [self.take_unspent() for _ in range(count)]
+        total = sum(value for _, _, value in spent)
+        fee = min(self.rng.randint(1, 100) * 100 * count, total // 2)
+        num_outputs = max(1, min(self.outputs, total - fee))
+        vin = [CMutableTxIn(COutPoint(bytes.fromhex(txid)[::-1], vout), CScript([bytes(72), bytes(33)]))
+               for txid, vout, _ in spent]
+        vout = []
+        remaining = total - fee
+        for n in range(num_outputs):
+            value = remaining // (num_outputs - n)
+            remaining -= value
+            vout.append(CMutableTxOut(value, self.pick_script()))
+        return CTransaction.from_tx(CMutableTransaction(vin, vout)), fee
+
+    def add_tx(self, tx, height):
+        raw = tx.serialize()
+        txid = b2lx(Hash(raw))
+        self.txs[txid] = (tx, raw, height)
+        return txid
+
+    # Add a block with the given (tx, fee) pairs after a coinbase paying the reward and the fees
+    def mine(self, txs):
+        txs = [tx for tx in txs if tx is not None]
+        height = len(self.blocks)
+        coinbase = CMutableTransaction(
+            [CMutableTxIn(COutPoint(), CScript([height, b'/fakenode/']))],
+            [CMutableTxOut(block_reward + sum(fee for _, fee in txs), self.scripts[height % len(self.scripts)])])
+        vtx = [CTransaction.from_tx(coinbase)] + [tx for tx, _ in txs]
+        txids = [self.add_tx(tx, height) for tx in vtx]
+        # As on a real chain, the genesis block's coinbase can't be spent
+        if height > 0:
+            for txid, tx in zip(txids, vtx):
+                self.unspent.extend((txid, vout, txout.nValue) for vout, txout in enumerate(tx.vout))
+
+        self.time += self.rng.randint(1, 120)
+        merkle_root = CBlock.build_merkle_tree_from_txids([lx(txid) for txid in txids])[-1]
+        header = CBlockHeader(nVersion=1, hashPrevBlock=lx(self.hashes[-1]) if self.hashes else b'\x00' * 32,
+                              hashMerkleRoot=merkle_root, nTime=self.time, nBits=block_bits, nNonce=height)
+        block_hash = b2lx(header.GetHash())
+        self.blocks.append((header, txids))
+        self.hashes.append(block_hash)
+        self.heights[block_hash] = height
+
+    # The block as the node stores it: the header, then the transactions
+    def raw_block(self, height):
+        header, txids = self.blocks[height]
+        return header.serialize() + VarIntSerializer.serialize(len(txids)) + b''.join(
+            self.txs[txid][1] for txid in txids)
+
+    # Top the mempool up to mempool_size transactions. Their outputs can't be spent until they're mined.
+    def fill_mempool(self):
+        while len(self.mempool) < self.mempool_size:
+            made = self.make_tx()
+            if made is None:
+                break
+            tx, fee = made
+            self.mempool.append((self.add_tx(tx, None), fee))
+
+    # Mine the mempool into a new block and fill it again
+    def mine_mempool(self):
+        with self.lock:
+            txs = [(self.txs[txid][0], fee) for txid, fee in self.mempool]
+            self.mempool = []
+            self.mine(txs)
+            self.fill_mempool()
+
+    # Replace the top `depth` blocks with `new_length` new ones, as a reorganization would. The
+    # transactions of the replaced blocks and the mempool are forgotten, and the new blocks spend
+    # whatever the remaining chain left unspent. The new blocks always get later times, so their
+    # hashes differ from the ones they replace. Like a node, getblock still knows the old blocks.
+    def reorg(self, depth, new_length):
+        with self.lock:
+            fork_height = self.tip() - depth
+            for height in range(fork_height + 1, self.tip() + 1):
+                self.stale_blocks[self.hashes[height]] = (height, self.raw_block(height))
+            for _, txids in self.blocks[fork_height + 1:]:
+                for txid in txids:
+                    del self.txs[txid]
+            for block_hash in self.hashes[fork_height + 1:]:
+                del self.heights[block_hash]
+            del self.blocks[fork_height + 1:]
+            del self.hashes[fork_height + 1:]
+            for txid, _ in self.mempool:
+                del self.txs[txid]
+            self.mempool = []
+
+            spent = set()
+            outputs = []
+            for height, (_, txids) in enumerate(self.blocks):
+                for txid in txids:
+                    tx = self.txs[txid][0]
+                    spent.update((b2lx(txin.prevout.hash), txin.prevout.n) for txin in tx.vin
+                                 if not txin.prevout.is_null())
+                    if height > 0:
+                        outputs.extend((txid, vout, txout.nValue) for vout, txout in enumerate(tx.vout))
+            self.unspent = [output for output in outputs if output[:2] not in spent]
+
+            for _ in range(new_length):
+                self.mine([self.make_tx() for _ in range(self.txs_per_block)])
+            self.fill_mempool()
+
+    def block_json(self, height):
+        header, txids = self.blocks[height]
+        result = {
+            'hash': self.hashes[height],
+            'confirmations': self.tip() - height + 1,
+            'size': len(self.raw_block(height)),
+            'height': height,
+            'version': header.nVersion,
+            'merkleroot': b2lx(header.hashMerkleRoot),
+            'tx': list(txids),
+            'time': header.nTime,
+            'nonce': header.nNonce,
+            'bits': '%08x' % header.nBits,
+            'difficulty': rawblocks.difficulty_from_bits(header.nBits),
+        }
+        if height > 0:
+            result['previousblockhash'] = self.hashes[height - 1]
+        if height < self.tip():
+            result['nextblockhash'] = self.hashes[height + 1]
+        return result
+
+    # A block no longer on the chain, as the node describes it: with -1 confirmations and no next block
+    def stale_block_json(self, block_hash):
+        height, raw = self.stale_blocks[block_hash]
+        block = CBlock.deserialize(raw)
+        return {
+            'hash': block_hash,
+            'confirmations': -1,
+            'size': len(raw),
+            'height': height,
+            'version': block.nVersion,
+            'merkleroot': b2lx(block.hashMerkleRoot),
+            'tx': [b2lx(tx.GetTxid()) for tx in block.vtx],
+            'time': block.nTime,
+            'nonce': block.nNonce,
+            'bits': '%08x' % block.nBits,
+            'difficulty': rawblocks.difficulty_from_bits(block.nBits),
+            'previousblockhash': b2lx(block.hashPrevBlock),
+        }
+
+    def tx_json(self, txid):
+        tx, raw, height = self.txs[txid]
+        vin = []
+        for txin in tx.vin:
+            if txin.prevout.is_null():
+                vin.append({'coinbase': b2x(txin.scriptSig), 'sequence': txin.nSequence})
+            else:
+                vin.append({'txid': b2lx(txin.prevout.hash), 'vout': txin.prevout.n,
+                            'scriptSig': {'asm': script_asm(txin.scriptSig), 'hex': b2x(txin.scriptSig)},
+                            'sequence': txin.nSequence})
+        vout = []
+        for n, txout in enumerate(tx.vout):
+            script = txout.scriptPubKey
+            script_type, address = self.script_types[script]
+            vout.append({'value': Decimal(txout.nValue).scaleb(-8), 'n': n,
+                         'scriptPubKey': {'asm': script_asm(script), 'hex': b2x(script), 'reqSigs': 1,
+                                          'type': script_type, 'addresses': [address]}})
+        result = {'hex': b2x(raw), 'txid': txid, 'size': len(raw), 'version': tx.nVersion,
+                  'locktime': tx.nLockTime, 'vin': vin, 'vout': vout}
+        if height is not None:
+            block_time = self.blocks[height][0].nTime
+            result.update({'blockhash': self.hashes[height], 'confirmations': self.tip() - height + 1,
+                           'time': block_time, 'blocktime': block_time})
+        return result
+
+    def getblockcount(self):
+        return self.tip()
+
+    def getbestblockhash(self):
+        return self.hashes[-1]
+
+    def getblockhash(self, height):
+        if not isinstance(height, int) or not 0 <= height <= self.tip():
+            raise RPCError(-8, 'Block height out of range')
+        return self.hashes[height]
+
+    def getblock(self, block_hash, verbose=True):
+        height = self.heights.get(block_hash)
+        if height is None and block_hash in self.stale_blocks:
+            return self.stale_block_json(block_hash) if verbose else b2x(self.stale_blocks[block_hash][1])
+        if height is None:
+            raise RPCError(-5, 'Block not found')
+        if not verbose:
+            return b2x(self.raw_block(height))
+        return self.block_json(height)
+
+    def getrawtransaction(self, txid, verbose=False):
+        if txid not in self.txs:
+            raise RPCError(-5, 'No such mempool or blockchain transaction')
+        if not verbose:
+            return b2x(self.txs[txid][1])
+        return self.tx_json(txid)
+
+    def getrawmempool(self):
+        return [txid for txid, _ in self.mempool]
+
+    methods = ['getblockcount', 'getbestblockhash', 'getblockhash', 'getblock', 'getrawtransaction', 'getrawmempool']
+
+    def call(self, method, params):
+        if method not in self.methods:
+            raise RPCError(-32601, 'Method not found')
+        with self.lock:
+            try:
+                return getattr(self, method)(*params)
+            except TypeError:
+                raise RPCError(-1, f'Wrong parameters for {method}') from None
+
+
+# Write raw blocks to blk*.dat files in directory, the way the node stores them: records of
+# <magic> <4-byte little-endian size> <block>, blocks_per_file to a file, each file followed by
+# padding zero bytes like the node's preallocated files
+def write_block_files(directory, raw_blocks, magic=blockFileMagic, blocks_per_file=100, padding=0):
+    os.makedirs(directory, exist_ok=True)
+    for number, start in enumerate(range(0, len(raw_blocks), blocks_per_file)):
+        with open(os.path.join(directory, f'blk{number:05d}.dat'), 'wb') as f:
+            for raw in raw_blocks[start:start + blocks_per_file]:
+                f.write(bytes.fromhex(magic) + struct.pack('<I', len(raw)) + raw)
+            f.write(bytes(padding))
+
+
+amount_placeholder = re.compile(r'"amount:(-?[0-9.]+)"')
+
+
+# JSON with amounts written out as exact decimals, like the node does, rather than as floats
+def dumps_json(value):
+    return amount_placeholder.sub(r'\1', json.dumps(value, default=lambda amount: f'amount:{amount:.8f}'))
+
+
+# Serves a chain over JSON-RPC. latency is added to every request and call_latency to every call
+# in it, in seconds, to act like a node that's further away or busier.
+class FakeNode:
+    def __init__(self, chain, latency=0, call_latency=0):
+        self.chain = chain
+        self.latency = latency
+        self.call_latency = call_latency
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'calls': 0, 'errors': 0}
+
+    # Reply to a decoded request body; returns (HTTP status, reply)
+    def handle(self, body):
+        single = isinstance(body, dict)
+        calls = [body] if single else body
+        with self.lock:
+            self.stats['requests'] += 1
+            self.stats['calls'] += len(calls)
+        delay = self.latency + self.call_latency * len(calls)
+        if delay:
+            time.sleep(delay)
+
+        replies = []
+        for call in calls:
+            try:
+                replies.append({'result': self.chain.call(call.get('method'), call.get('params', [])),
+                                'error': None, 'id': call.get('id')})
+            except RPCError as e:
+                with self.lock:
+                    self.stats['errors'] += 1
+                replies.append({'result': None, 'error': {'code': e.code, 'message': e.message},
+                                'id': call.get('id')})
+        if not single:
+            return 200, replies
+        # Like the node, a single call that fails gets an error status too
+        error = replies[0]['error']
+        if error is None:
+            return 200, replies[0]
+        return (404 if error['code'] == -32601 else 500), replies[0]
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats)
+
+    # Start answering on host:port in a background thread; returns the server, to shut it down
+    def start(self, host='127.0.0.1', port=rpc_port):
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                try:
+                    body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                    status, reply = node.handle(body)
+                except (ValueError, AttributeError):
+                    status, reply = 500, {'result': None, 'error': {'code': -32700, 'message': 'Parse error'},
+                                          'id': None}
+                data = dumps_json(reply).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a made-up chain over JSON-RPC, in place of a node')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=rpc_port)
+    parser.add_argument('--blocks', type=int, default=1000, help='height of the tip')
+    parser.add_argument('--txs-per-block', type=int, default=20, help='transactions besides the coinbase')
+    parser.add_argument('--inputs', type=int, default=2, help='inputs per transaction')
+    parser.add_argument('--outputs', type=int, default=2, help='outputs per transaction')
+    parser.add_argument('--addresses', type=int, default=10000, help='addresses the outputs are spread over')
+    parser.add_argument('--hot-share', type=float, default=0.02,
+                        help='share of the outputs paid to the first address, to give it a long history')
+    parser.add_argument('--mempool', type=int, default=0, help='unconfirmed transactions to keep in the mempool')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--latency', type=float, default=0, help='milliseconds added to every request')
+    parser.add_argument('--call-latency', type=float, default=0, help='milliseconds added per call in a request')
+    parser.add_argument('--block-seconds', type=float, default=0,
+                        help='mine the mempool into a new block this often (0 to never)')
+    parser.add_argument('--blocks-directory', help='also write the chain to blk*.dat files here')
+    args = parser.parse_args()
+
+    started = time.monotonic()
+    chain = SyntheticChain(args.blocks, args.txs_per_block, args.inputs, args.outputs, args.addresses,
+                           args.hot_share, args.mempool, args.seed)
+    print(f"Generated {chain.tip() + 1} blocks with {len(chain.txs)} transactions in "
+          f"{time.monotonic() - started:.1f} seconds; the busiest address is "
+          f"{chain.script_types[chain.scripts[0]][1]}")
+
+    if args.blocks_directory:
+        write_block_files(args.blocks_directory, [chain.raw_block(height) for height in range(chain.tip() + 1)])
+        print(f"Wrote the blocks to {args.blocks_directory}")
+
+    node = FakeNode(chain, args.latency / 1000, args.call_latency / 1000)
+    node.start(args.host, args.port)
+    print(f"Serving on http://{args.host}:{args.port}")
+    try:
+        while True:
+            if args.block_seconds:
+                time.sleep(args.block_seconds)
+                chain.mine_mempool()
+                print(f"Mined block {chain.tip()} ({chain.hashes[-1]})")
+            else:
+                time.sleep(3600)
+    except KeyboardInterrupt:
+        stats = node.get_stats()
+        print(f"\n{stats['requests']} requests, {stats['calls']} calls, {stats['errors']} errors")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+import threading
+from array import array
+
+
+# Hash, time and difficulty of every indexed block, kept in memory in flat buffers: 32 bytes of
+# hash per height in one bytearray, times and difficulties in arrays, starting from the lowest
+# indexed height (the indexer starts after the genesis block). About 44 bytes a block, so
+# a million blocks fit in 44 MB, and height -> hash and time to mine are plain index lookups.
+class HeaderIndex:
+    def __init__(self):
+        self.hashes = bytearray()
+        self.times = array('I')
+        self.difficulties = array('d')
+        self.base_height = 0
+        self.tip_height = -1
+        self.lock = threading.Lock()
+        self.stats = {'refreshes': 0, 'blocks_added': 0, 'reloads': 0}
+
+    # Catch up with the blocks the indexer has added since the last call. The first call loads
+    # everything; later ones read only the rows from the tip on, which is usually just the tip. If
+    # the block at our tip has changed the chain was reorganized, and the index is loaded again from
+    # scratch. Once loaded, a refresh is skipped if another thread is already doing one.
+    def refresh(self, cursor):
+        if not self.lock.acquire(blocking=not self.times):
+            return
+        try:
+            self.stats['refreshes'] += 1
+            cursor.execute('SELECT height, hash, time, difficulty FROM block_summary WHERE height >= ? ORDER BY height',
+                           (self.tip_height,))
+            if self.times:
+                tip = cursor.fetchone()
+                if tip is None or tip[0] != self.tip_height or tip[1] != self.hash_bytes(self.tip_height):
+                    self.stats['reloads'] += 1
+                    self.reset()
+                    cursor.execute('SELECT height, hash, time, difficulty FROM block_summary ORDER BY height')
+            # Rows are read as they're added, so a full load never holds them all at once
+            self.extend(cursor)
+        finally:
+            self.lock.release()
+
+    def extend(self, rows):
+        for height, block_hash, block_time, difficulty in rows:
+            if not self.times:
+                self.base_height = height
+                self.tip_height = height - 1
+            if height != self.tip_height + 1:
+                break  # Heights should be contiguous; try again from here next time
+            self.hashes += block_hash
+            self.times.append(block_time)
+            self.difficulties.append(difficulty)
+            # Readers only look up to tip_height, so it's moved last
+            self.tip_height = height
+            self.stats['blocks_added'] += 1
+
+    def reset(self):
+        # New buffers rather than clearing the old ones, which readers may still be slicing
+        self.tip_height = -1
+        self.hashes = bytearray()
+        self.times = array('I')
+        self.difficulties = array('d')
+
+    def __contains__(self, height):
+        return self.base_height <= height <= self.tip_height
+
+    def hash_bytes(self, height):
+        position = (height - self.base_height) * 32
+        return bytes(self.hashes[position:position + 32])
+
+    # Hash of the block at a height, in hex, or None if it isn't indexed
+    def block_hash(self, height):
+        if height not in self:
+            return None
+        block_hash = self.hash_bytes(height)
+        return block_hash.hex() if len(block_hash) == 32 else None  # None if reset under us
+
+    def tip_hash(self):
+        return self.block_hash(self.tip_height)
+
+    def block_time(self, height):
+        return self.times[height - self.base_height] if height in self else None
+
+    # Seconds between a block and the one before it
+    def time_to_mine(self, height):
+        if height not in self or height - 1 not in self:
+            return 0
+        return self.block_time(height) - self.block_time(height - 1)
+
+    def get_stats(self):
+        return {'height': self.tip_height, 'bytes': len(self.hashes) + self.times.itemsize * len(self.times)
+                + self.difficulties.itemsize * len(self.difficulties), **self.stats}
@@ -0,0 +1,563 @@
+# The indexer: reads blocks from the node (or its block files) and writes them to the explorer
+# database. It runs as its own process, separately from the web workers, which only read:
+#
+#   python indexer.py          keep indexing new blocks as they're announced
+#   python indexer.py --once   index up to the current tip and exit
+#   python indexer.py --from 1000 --to 2000   index blocks 1000 to 2000 again and exit
+#   python indexer.py --processes 32   catch up on 32 processes in parallel, then carry on as usual
+import argparse
+import multiprocessing
+import os
+import shutil
+import socket
+import time
+import traceback
+from datetime import timedelta
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from requests.exceptions import ConnectionError
+
+import blkfiles
+import database
+import notify
+import rawblocks
+import shards
+from rpc import RPCClient
+from app import (rpc_user, rpc_password, rpc_host, rpc_port, coinName,
+                 indexerThreads, indexerPrefetch, indexerCommitBlocks, indexerMode, indexerRpcTimeout,
+                 pubkeyAddressVersion, scriptAddressVersion, bech32Prefix, blocksDirectory, blockFileMagic,
+                 zmqAddress, notifySocket, pollMinSeconds, pollMaxSeconds,
+                 connect_database, initialize_database, database_path, get_blocks_by_height, get_transactions,
+                 get_prevouts, summarize_block, to_satoshis)
+
+# The indexer has its own connections to the node, so it never makes pages wait
+indexer_client = RPCClient(f'http://{rpc_user}:{rpc_password}@{rpc_host}:{rpc_port}', indexerRpcTimeout,
+                           indexerThreads + 2)
+
+# New blocks announced by ZMQ, -blocknotify or polling wake the indexer
+tip_notifier = notify.TipNotifier()
+
+# Fetch a block and its transactions for the indexer (runs on the fetch threads)
+def fetch_block(height):
+    rpc = indexer_client
+    if indexerMode == 'raw':
+        # One raw block instead of a verbose transaction per txid; decoded here on the fetch thread
+        raw_block = rpc.getblock(rpc.getblockhash(height), False)
+        address_params = rawblocks.AddressParams(pubkeyAddressVersion, scriptAddressVersion, bech32Prefix)
+        return rawblocks.decode_block(bytes.fromhex(raw_block), address_params)
+    block = get_blocks_by_height([height], rpc)[height]
+    return block, get_transactions(block['tx'], rpc)
+
+# Write the rows for one block. address_ids caches address -> id lookups across blocks.
+def index_block(cursor, rpc, height, block, block_txs, prev_time, address_ids):
+    def get_address_id(address):
+        if address not in address_ids:
+            address_ids[address] = database.intern_address(cursor, address)
+        return address_ids[address]
+
+    # Per-address [received, sent, txids] for this block, added to address_summary below
+    summaries = {}
+    address_rows = []
+    output_rows = []
+    spent_rows = []
+
+    for txid, tx in zip(block['tx'], block_txs):
+        # Received values and the outputs themselves
+        txid_bytes = bytes.fromhex(txid)
+        for vout in tx['vout']:
+            value = to_satoshis(vout['value'])
+            ids = [get_address_id(address) for address in vout['scriptPubKey'].get('addresses', [])]
+            for address_id in ids:
+                address_rows.append((address_id, txid_bytes, value, database.RECEIVED, height))
+                summary = summaries.setdefault(address_id, [0, 0, set()])
+                summary[0] += value
+                summary[2].add(txid_bytes)
+            for address_id in ids or [None]:
+                output_rows.append((txid_bytes, vout['n'], value, address_id, height))
+
+    cursor.executemany('''
+        INSERT INTO outputs (txid, vout, value, address_id, block_height)
+        VALUES (?, ?, ?, ?, ?)
+    ''', output_rows)
+
+    # Resolve every input from the outputs table (this block's outputs included)
+    prevouts = get_prevouts(block_txs, cursor, rpc)
+
+    for txid, tx in zip(block['tx'], block_txs):
+        # Sent values (inputs), and the outputs they spend
+        txid_bytes = bytes.fromhex(txid)
+        for vin in tx['vin']:
+            if 'txid' in vin:
+                prev_vout = prevouts[(vin['txid'], vin['vout'])]
+                value = to_satoshis(prev_vout['value'])
+                for address in prev_vout['addresses']:
+                    address_id = get_address_id(address)
+                    address_rows.append((address_id, txid_bytes, value, database.SENT, height))
+                    summary = summaries.setdefault(address_id, [0, 0, set()])
+                    summary[1] += value
+                    summary[2].add(txid_bytes)
+                spent_rows.append((txid_bytes, height, bytes.fromhex(vin['txid']), vin['vout']))
+
+    cursor.executemany('''
+        INSERT INTO address_transactions (address_id, txid, value, type, block_height)
+        VALUES (?, ?, ?, ?, ?)
+    ''', address_rows)
+    cursor.executemany('''
+        UPDATE outputs SET spent_by = ?, spent_height = ? WHERE txid = ? AND vout = ?
+    ''', spent_rows)
+
+    # Written in the same transaction as the block's rows, so the summaries never drift from them
+    database.update_address_summaries(cursor, height, summaries)
+    block_summary, tx_summaries = summarize_block(height, block, block_txs, prevouts, prev_time)
+    database.write_block_summary(cursor, block_summary, tx_summaries)
+
+# Raised when the node's chain is reorganized while blocks are being indexed
+class ChainChanged(Exception):
+    pass
+
+# Throughput of the last indexer run
+indexer_stats = {}
+
+# Fetch the given heights on the indexer threads, up to indexerPrefetch blocks ahead, and yield
+# (height, block, block_txs) in height order
+def fetch_blocks(executor, heights):
+    pending = {}
+    next_fetch = iter(heights)
+    for height in heights:
+        while len(pending) < indexerPrefetch:
+            fetch_height = next(next_fetch, None)
+            if fetch_height is None:
+                break
+            pending[fetch_height] = executor.submit(fetch_block, fetch_height)
+        block, block_txs = pending.pop(height).result()
+        yield height, block, block_txs
+
+# Write (height, block, block_txs) in height order, committing every indexerCommitBlocks blocks
+# and after the last one. Each commit moves the indexer_state checkpoint along with the blocks.
+# prev_time and prev_hash are the time and hash of the block before the first; a block that
+# doesn't follow on from the one before it means the chain changed under us.
+def write_blocks(conn, rpc, blocks, prev_time, prev_hash, last_parsed_height, last_height):
+    cursor = conn.cursor()
+    address_ids = {}
+    batch_start = time.monotonic()
+    batch_blocks = 0
+    run_start = batch_start
+
+    for height, block, block_txs in blocks:
+        if prev_hash is not None and block.get('previousblockhash') != prev_hash:
+            raise ChainChanged(f"Block {height} ({block['hash']}) doesn't follow the block before it")
+        index_block(cursor, rpc, height, block, block_txs, prev_time, address_ids)
+        prev_time = block['time']
+        block_hash = prev_hash = block['hash']
+        batch_blocks += 1
+
+        if batch_blocks == indexerCommitBlocks or height == last_height:
+            database.set_indexer_state(cursor, height, block_hash)
+            conn.commit()
+            now = time.monotonic()
+            rate = batch_blocks / (now - batch_start) if now > batch_start else 0
+            # The ETA uses the rate over the whole run, which jumps around less than a batch's
+            run_blocks = height - last_parsed_height
+            run_rate = run_blocks / (now - run_start) if now > run_start else 0
+            eta_seconds = (last_height - height) / run_rate if run_rate else 0
+            progress = run_blocks / (last_height - last_parsed_height) * 100
+            print(f"processed blocks up to {height} ({block_hash}), {rate:.1f} blocks/sec, "
+                  f"{progress:.1f}% of {last_parsed_height + 1} to {last_height}, "
+                  f"ETA {timedelta(seconds=round(eta_seconds))}")
+            indexer_stats.update({
+                'height': height,
+                'blocks_per_second': rate,
+                'run_blocks': run_blocks,
+                'run_seconds': now - run_start,
+                'eta_seconds': eta_seconds,
+            })
+            batch_start = now
+            batch_blocks = 0
+            if len(address_ids) > 200000:
+                address_ids.clear()
+
+# Height of the last indexed block that's still on the node's chain. Walks back from
+# last_parsed_height comparing the stored block hashes with the node's, in batches that start
+# small (reorgs are almost always a block or two deep) and double as the walk goes on. Heights
+# without a stored hash can't be checked and are taken to be on the chain.
+def find_fork_height(cursor, rpc, last_parsed_height, latest_block_height):
+    height = min(last_parsed_height, latest_block_height)
+    batch_size = 8
+    while height > 0:
+        start = max(1, height - batch_size + 1)
+        stored_hashes = database.get_block_hashes(cursor, start, height)
+        heights = [h for h in range(height, start - 1, -1) if h in stored_hashes]
+        node_hashes = dict(zip(heights, rpc.batch_call('getblockhash', [(h,) for h in heights])))
+        for h in range(height, start - 1, -1):
+            if h not in stored_hashes or stored_hashes[h] == node_hashes[h]:
+                return h
+        height = start - 1
+        batch_size = min(batch_size * 2, 1000)
+    return 0
+
+# Index from the last parsed height up to the node's tip (or to_height), first undoing any blocks
+# that are no longer on the node's chain, or from from_height on to index them again. The undo is
+# committed together with the first blocks indexed after it, so pages never see the chain
+# without them.
+def index_to_tip(conn, rpc, executor, from_height=None, to_height=None):
+    cursor = conn.cursor()
+    problem = reindex_range_error(cursor, from_height, to_height)
+    if problem:
+        print(f"Not reindexing: {problem}")
+        return
+    latest_block_height = rpc.getblockcount()
+    last_height = latest_block_height if to_height is None else min(latest_block_height, to_height)
+
+    # The checkpoint written with the last committed batch
+    last_parsed_height = database.get_indexer_state(cursor)['height']
+    print("last process height: " + str(last_parsed_height))
+
+    fork_height = find_fork_height(cursor, rpc, last_parsed_height, latest_block_height)
+    if fork_height < last_parsed_height:
+        print(f"Chain reorganized: undoing blocks {fork_height + 1} to {last_parsed_height}")
+    if from_height is not None:
+        if from_height > last_parsed_height + 1:
+            print(f"Blocks are only indexed up to {last_parsed_height}, carrying on from there")
+        elif from_height - 1 < fork_height:
+            print(f"Undoing blocks {from_height} to {last_parsed_height} to index them again")
+            fork_height = from_height - 1
+    if fork_height < last_parsed_height:
+        database.rollback_blocks(cursor, fork_height)
+        fork_hash = database.get_block_hashes(cursor, fork_height, fork_height).get(fork_height)
+        database.set_indexer_state(cursor, fork_height, fork_hash)
+        last_parsed_height = fork_height
+
+    # Time and hash of the last parsed block, for the next block's time to mine and to check
+    # that it follows on from it
+    cursor.execute('SELECT time, hash FROM block_summary WHERE height = ?', (last_parsed_height,))
+    row = cursor.fetchone()
+    if row:
+        prev_time, prev_hash = row[0], row[1].hex()
+    else:
+        prev_time, prev_hash = get_blocks_by_height([last_parsed_height], rpc)[last_parsed_height]['time'], None
+
+    # Parse new blocks since the last parsed height
+    heights = range(last_parsed_height + 1, last_height + 1)
+    write_blocks(conn, rpc, fetch_blocks(executor, heights), prev_time, prev_hash, last_parsed_height, last_height)
+    conn.commit()  # A rollback to the node's tip with no new blocks after it
+
+# --from undoes every indexed block from that height on, so a --to below the checkpoint would leave
+# the database cut short at --to. Returns why the range can't be reindexed, or None if it can.
+def reindex_range_error(cursor, from_height, to_height):
+    last_parsed_height = database.get_indexer_state(cursor)['height']
+    if from_height is None or to_height is None or from_height > last_parsed_height or to_height >= last_parsed_height:
+        return None
+    return (f"--to {to_height} is below the last indexed block {last_parsed_height}, so blocks {to_height + 1} to "
+            f"{last_parsed_height} would be lost; leave out --to or give at least {last_parsed_height}")
+
+# How many times a run starts over when the chain changes under it, before leaving it to the next run
+chain_change_retries = 3
+
+# Function to parse blocks and update the database. Blocks are fetched by a pool of threads up to
+# indexerPrefetch heights ahead, while this thread writes them in height order and commits every
+# indexerCommitBlocks blocks. If the chain is reorganized part way, it starts over from the fork.
+# from_height and to_height limit the run to a range of blocks, see index_to_tip().
+def parse_blocks(from_height=None, to_height=None):
+    conn = None
+    executor = None
+    try:
+        conn = connect_database()
+        rpc = indexer_client
+        for attempt in range(chain_change_retries, -1, -1):
+            executor = ThreadPoolExecutor(max_workers=indexerThreads)
+            try:
+                index_to_tip(conn, rpc, executor, from_height, to_height)
+                break
+            except ChainChanged as e:
+                if not attempt:
+                    raise
+                print(f"{e}, looking for the fork again")
+                conn.rollback()
+                executor.shutdown(wait=False, cancel_futures=True)
+
+        conn.close()
+
+    except (ConnectionError, socket.error, socket.timeout) as e:
+        # The client has already retried; the next wake-up tries again
+        print(f"Error parsing blocks: {e}. Will retry on the next block or in {pollMaxSeconds} seconds")
+
+    except Exception as e:
+        # Something unexpected, such as a block that couldn't be decoded: the traceback says where
+        print(f"Error parsing blocks: {e}. Will retry from the last checkpoint in {pollMaxSeconds} seconds")
+        traceback.print_exc()
+
+    finally:
+        # Anything not yet committed is rolled back and parsed again on the next run
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        if conn is not None:
+            conn.close()
+
+# The last blocks in the files may still be replaced by a reorg, so they're left to the RPC indexer
+bulk_import_keep_back = 6
+
+# Index blocks straight from the node's blk*.dat files, without going through RPC. Stops a few
+# blocks short of the end of the files; parse_blocks() carries on from there.
+def import_block_files():
+    block_files = None
+    conn = None
+    try:
+        print(f"Reading block files in {blocksDirectory}...")
+        block_files = blkfiles.BlockFiles(blocksDirectory, blockFileMagic)
+        chain = block_files.best_chain()
+        conn = connect_database()
+        cursor = conn.cursor()
+        last_parsed_height = database.get_indexer_state(cursor)['height']
+        last_height = len(chain) - 1 - bulk_import_keep_back
+        if last_height <= last_parsed_height:
+            print(f"Block files end at height {len(chain) - 1}, nothing to import")
+            return
+
+        # Only carry on from the database if it's on the same chain as the files
+        cursor.execute('SELECT hash FROM block_summary WHERE height = ?', (last_parsed_height,))
+        row = cursor.fetchone()
+        if row and row[0] != bytes.fromhex(block_files.block_hash(chain[last_parsed_height])):
+            print(f"Block files don't match the database at height {last_parsed_height}, skipping bulk import")
+            return
+
+        print(f"Importing blocks {last_parsed_height + 1} to {last_height} from block files")
+        address_params = rawblocks.AddressParams(pubkeyAddressVersion, scriptAddressVersion, bech32Prefix)
+        blocks = ((height, *rawblocks.decode_block(block_files.block(chain[height]), address_params))
+                  for height in range(last_parsed_height + 1, last_height + 1))
+        prev_time = block_files.block_time(chain[last_parsed_height])
+        prev_hash = block_files.block_hash(chain[last_parsed_height])
+        # Inputs are resolved from the outputs already imported; any the files don't have (the
+        # genesis coinbase, or blocks indexed before the outputs table) come from the node with the
+        # indexer's own client, not the web pages' cached one
+        write_blocks(conn, indexer_client, blocks, prev_time, prev_hash, last_parsed_height, last_height)
+
+    except Exception as e:
+        print(f"Error importing block files: {e}")
+
+    finally:
+        # Anything not yet committed is rolled back and indexed over RPC instead
+        if conn is not None:
+            conn.close()
+        if block_files is not None:
+            block_files.close()
+
+# Shards per worker process. The heights are split into more shards than processes, so a process
+# that drew a run of small blocks picks up another shard instead of waiting for the others.
+shards_per_process = 4
+
+# Blocks written so far by each shard, shared with the worker processes for the progress report
+shard_progress = None
+
+# Worker processes start from a fresh import of this module, so they're told which node the main
+# process indexes from rather than connecting to the one in the settings
+def init_shard_worker(progress, node_url):
+    global shard_progress, indexer_client
+    shard_progress = progress
+    indexer_client = RPCClient(node_url, indexerRpcTimeout, indexerThreads + 2)
+
+# Write the rows of one block to a shard: everything index_block() stores that doesn't depend on
+# other blocks. Input values, fees and sent amounts are worked out when the shards are merged.
+def index_shard_block(cursor, height, block, block_txs, prev_time):
+    tx_rows = []
+    output_rows = []
+    spend_rows = []
+    block_total_out = 0
+    for position, (txid, tx) in enumerate(zip(block['tx'], block_txs)):
+        txid_bytes = bytes.fromhex(txid)
+        total_out = 0
+        for vout in tx['vout']:
+            value = to_satoshis(vout['value'])
+            total_out += value
+            for address in vout['scriptPubKey'].get('addresses', []) or [None]:
+                output_rows.append((txid_bytes, vout['n'], value, address, height))
+        for vin in tx['vin']:
+            if 'txid' in vin:
+                spend_rows.append((txid_bytes, height, bytes.fromhex(vin['txid']), vin['vout']))
+        coinbase = 'coinbase' in tx['vin'][0]
+        tx_rows.append((txid_bytes, height, position, tx['size'], total_out, len(tx['vin']), len(tx['vout']), coinbase))
+        block_total_out += total_out
+
+    previous_hash = block.get('previousblockhash')
+    block_row = (height, bytes.fromhex(block['hash']), bytes.fromhex(previous_hash) if previous_hash else None,
+                 bytes.fromhex(block['merkleroot']), block['time'], float(block['difficulty']), block['size'],
+                 len(block_txs), block_total_out, block['time'] - prev_time)
+    shards.write_block(cursor, block_row, tx_rows, output_rows, spend_rows)
+
+# Look up outputs from the node, for merging shards: {(txid, vout): (satoshis, addresses)}
+def fetch_outputs(outpoints):
+    txids = list(dict.fromkeys(txid for txid, _ in outpoints))
+    txs = dict(zip(txids, get_transactions(txids, indexer_client)))
+    outputs = {}
+    for txid, n in outpoints:
+        vout = txs[txid]['vout'][n]
+        outputs[(txid, n)] = (to_satoshis(vout['value']), vout['scriptPubKey'].get('addresses', []))
+    return outputs
+
+# Index one shard's heights into the file at path (runs in a worker process, with its own
+# connections to the node and fetch threads)
+def index_shard(number, start_height, end_height, path):
+    try:
+        conn = shards.create_shard(path)
+        cursor = conn.cursor()
+        prev_time = get_blocks_by_height([start_height - 1], indexer_client)[start_height - 1]['time']
+        prev_hash = None
+        with ThreadPoolExecutor(max_workers=indexerThreads) as executor:
+            for height, block, block_txs in fetch_blocks(executor, range(start_height, end_height + 1)):
+                if prev_hash is not None and block.get('previousblockhash') != prev_hash:
+                    raise ChainChanged(f"Block {height} ({block['hash']}) doesn't follow the block before it")
+                index_shard_block(cursor, height, block, block_txs, prev_time)
+                prev_time, prev_hash = block['time'], block['hash']
+                shard_progress[number] += 1
+                if shard_progress[number] % indexerCommitBlocks == 0:
+                    conn.commit()
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        # Errors from the node can't be pickled back to the main process, so only the message is sent
+        raise RuntimeError(f"shard {number} (blocks {start_height} to {end_height}): {e!r}") from None
+
+# Catch up by indexing the blocks after the last checkpoint (or from from_height, undoing the
+# blocks from there on first) on a pool of processes. Each indexes a shard of the heights into a
+# file of its own; the shards are then merged into the database in a single transaction, which
+# also moves the checkpoint. Stops a few blocks short of the tip, like the bulk import.
+def reindex_in_shards(processes, from_height=None, to_height=None):
+    conn = None
+    directory = database_path() + '.shards'
+    try:
+        conn = connect_database()
+        cursor = conn.cursor()
+        problem = reindex_range_error(cursor, from_height, to_height)
+        if problem:
+            print(f"Not reindexing: {problem}")
+            return
+        rpc = indexer_client
+        latest_block_height = rpc.getblockcount()
+        last_parsed_height = database.get_indexer_state(cursor)['height']
+        fork_height = find_fork_height(cursor, rpc, last_parsed_height, latest_block_height)
+        if from_height is not None:
+            fork_height = min(fork_height, from_height - 1)
+        last_height = latest_block_height - bulk_import_keep_back
+        if to_height is not None:
+            last_height = min(last_height, to_height)
+        if last_height <= fork_height:
+            print(f"Nothing to reindex up to height {last_height}")
+            return
+
+        # Contiguous shards of (almost) equal numbers of heights
+        num_blocks = last_height - fork_height
+        num_shards = min(processes * shards_per_process, num_blocks)
+        bounds = [fork_height + 1 + num_blocks * number // num_shards for number in range(num_shards + 1)]
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+        paths = [os.path.join(directory, f'shard-{number:04}.db') for number in range(num_shards)]
+
+        print(f"Reindexing blocks {fork_height + 1} to {last_height} in {num_shards} shards on {processes} processes")
+        started = time.monotonic()
+        context = multiprocessing.get_context('spawn')
+        progress = context.Array('q', num_shards, lock=False)
+        with ProcessPoolExecutor(processes, mp_context=context, initializer=init_shard_worker,
+                                 initargs=(progress, indexer_client.url)) as pool:
+            futures = [pool.submit(index_shard, number, bounds[number], bounds[number + 1] - 1, paths[number])
+                       for number in range(num_shards)]
+            while True:
+                done, pending = wait(futures, timeout=10)
+                for future in done:
+                    future.result()  # Stops at the first shard that failed
+                blocks_done = sum(progress)
+                elapsed = time.monotonic() - started
+                rate = blocks_done / elapsed
+                eta_seconds = (num_blocks - blocks_done) / rate if rate else 0
+                print(f"reindexed {blocks_done} of {num_blocks} blocks ({blocks_done / num_blocks * 100:.1f}%), "
+                      f"{rate:.1f} blocks/sec, {len(done)} of {num_shards} shards done, "
+                      f"ETA {timedelta(seconds=round(eta_seconds))}")
+                if not pending:
+                    break
+
+        print("Merging the shards into the database...")
+        merge_started = time.monotonic()
+        combined_path = os.path.join(directory, 'combined.db')
+        shards.combine(paths, combined_path)
+        prev_hash = database.get_block_hashes(cursor, fork_height, fork_height).get(fork_height)
+        broken_height = shards.find_broken_link(cursor, combined_path, prev_hash)
+        if broken_height is not None:
+            raise ChainChanged(f"Block {broken_height} doesn't follow the block before it, the chain changed "
+                               f"while reindexing")
+
+        cursor.execute('BEGIN')
+        if fork_height < last_parsed_height:
+            print(f"Undoing blocks {fork_height + 1} to {last_parsed_height}")
+            database.rollback_blocks(cursor, fork_height)
+        height, block_hash = shards.merge(cursor, combined_path, fork_height == 0, fetch_outputs)
+        database.set_indexer_state(cursor, height, block_hash)
+        conn.commit()
+        print(f"Merged in {time.monotonic() - merge_started:.1f} seconds; reindexed {num_blocks} blocks in "
+              f"{time.monotonic() - started:.1f} seconds ({num_blocks / (time.monotonic() - started):.1f} blocks/sec)")
+
+    except Exception as e:
+        # Nothing is merged unless every shard was; the next run starts over from the checkpoint
+        print(f"Error reindexing: {e}")
+        traceback.print_exc()
+
+    finally:
+        if conn is not None:
+            conn.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+def start_notification_sources():
+    push = False
+    if zmqAddress:
+        try:
+            notify.ZMQSource(tip_notifier, zmqAddress).start()
+            push = True
+        except RuntimeError as e:
+            print(f"{e}, falling back to polling")
+    if notifySocket:
+        notify.UnixSocketSource(tip_notifier, notifySocket).start()
+        push = True
+
+    # With ZMQ or -blocknotify the polling is only a safety net, so it can stay slow
+    min_interval = pollMaxSeconds if push else pollMinSeconds
+    notify.PollingSource(tip_notifier, indexer_client.getbestblockhash, min_interval, pollMaxSeconds).start()
+
+# Function to parse blocks whenever a new block is announced
+def run_periodic_block_parsing():
+    while True:
+        parse_blocks()
+        # Also wake up now and then, so a run that failed part way is retried
+        tip_notifier.wait_for_block(pollMaxSeconds)
+
+def main():
+    parser = argparse.ArgumentParser(description=f"Index the {coinName} blockchain into the explorer database")
+    parser.add_argument('--once', action='store_true', help="index up to the current tip and exit")
+    parser.add_argument('--from', dest='from_height', type=int, metavar='HEIGHT',
+                        help="undo the indexed blocks from this height on and index them again")
+    parser.add_argument('--to', dest='to_height', type=int, metavar='HEIGHT',
+                        help="stop at this height instead of the tip, and exit (with --from, no lower than the last indexed block)")
+    parser.add_argument('--processes', type=int, metavar='N',
+                        help="catch up (or reindex the --from/--to range) on N processes in parallel")
+    args = parser.parse_args()
+    if args.from_height is not None and args.from_height < 1:
+        parser.error("--from must be at least 1")
+
+    initialize_database()
+    conn = connect_database()
+    problem = reindex_range_error(conn.cursor(), args.from_height, args.to_height)
+    conn.close()
+    if problem:
+        parser.error(problem)
+    if args.processes:
+        reindex_in_shards(args.processes, args.from_height, args.to_height)
+        args.from_height = None  # Already undone and reindexed
+    # Block files are only read for a normal catch-up, not when a range was asked for
+    elif blocksDirectory and args.from_height is None and args.to_height is None:
+        import_block_files()
+    if args.once or args.to_height is not None:
+        parse_blocks(args.from_height, args.to_height)
+        return
+    if args.from_height is not None:
+        parse_blocks(args.from_height)
+    start_notification_sources()
+    run_periodic_block_parsing()
+
+if __name__ == '__main__':
+    main()
+
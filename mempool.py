@@ -0,0 +1,187 @@
+import threading
+import time
+from bisect import bisect_right
+
+# Upper bounds of the fee rate histogram buckets, in satoshis per byte (the last bucket is open-ended)
+fee_rate_buckets = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+
+# Upper bounds of the transaction size histogram buckets, in bytes
+size_buckets = [250, 500, 1000, 2000, 5000, 10000, 50000]
+
+
+# One mempool transaction, with its fee worked out once when it was first seen
+class MempoolEntry:
+    __slots__ = ('txid', 'size', 'fee', 'value', 'fee_rate', 'first_seen')
+
+    def __init__(self, txid, size, fee, value, first_seen):
+        self.txid = txid
+        self.size = size
+        self.fee = fee  # satoshis
+        self.value = value  # satoshis, total of the outputs
+        self.fee_rate = fee / size if size else 0  # satoshis per byte
+        self.first_seen = first_seen
+
+    def sort_key(self):
+        return (-self.fee_rate, self.txid)
+
+
+# What the mempool looked like after a tick. Never changed once published, so readers don't need
+# a lock; entries are ordered by fee rate, highest first.
+class MempoolSnapshot:
+    def __init__(self, entries, updated):
+        self.entries = entries
+        self.by_txid = {entry.txid: entry for entry in entries}
+        self.updated = updated
+        self.total_size = sum(entry.size for entry in entries)
+        self.total_fees = sum(entry.fee for entry in entries)
+        self.fee_histogram = histogram(fee_rate_buckets, ((entry.fee_rate, entry.size) for entry in entries))
+        self.size_histogram = histogram(size_buckets, ((entry.size, entry.size) for entry in entries))
+
+    def page(self, offset, limit):
+        return self.entries[offset:offset + limit]
+
+    def __len__(self):
+        return len(self.entries)
+
+
+# Count of transactions and their total size per bucket, for (value, size) pairs
+def histogram(bounds, items):
+    counts = [0] * (len(bounds) + 1)
+    sizes = [0] * (len(bounds) + 1)
+    for value, size in items:
+        bucket = bisect_right(bounds, value)
+        counts[bucket] += 1
+        sizes[bucket] += size
+    buckets = []
+    for i in range(len(bounds) + 1):
+        buckets.append({
+            'min': bounds[i - 1] if i > 0 else 0,
+            'max': bounds[i] if i < len(bounds) else None,
+            'count': counts[i],
+            'size': sizes[i],
+        })
+    return buckets
+
+
+# Keeps an in-memory copy of the node's mempool up to date. Each tick asks the node for the
+# mempool txids, drops the ones that have gone and only looks up the new ones, using
+# describe_transactions(txids), which returns {txid: (size, fee, value)} for the transactions
+# it could resolve.
+class MempoolTracker:
+    def __init__(self, get_mempool, describe_transactions, interval=5, min_interval=1, batch_size=500):
+        self.get_mempool = get_mempool
+        self.describe_transactions = describe_transactions
+        self.interval = interval
+        self.min_interval = min_interval
+        self.batch_size = batch_size
+        self.snapshot = MempoolSnapshot([], None)
+        self.wake_event = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.started = False
+        self.start_lock = threading.Lock()
+        self.listeners = []
+        self.stats = {'ticks': 0, 'added': 0, 'removed': 0, 'failed': 0, 'last_tick_seconds': 0.0}
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self.thread
+
+    # Stop the background thread, waiting for a tick in progress to finish
+    def stop(self, timeout=None):
+        self.stop_event.set()
+        self.wake_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    # The latest snapshot. The first call fills it in and starts the background thread, so
+    # nothing talks to the node before a page needs the mempool.
+    def get_snapshot(self):
+        if not self.started:
+            with self.start_lock:
+                if not self.started:
+                    try:
+                        self.tick()
+                    except Exception as e:
+                        print(f"Error updating mempool: {e}")
+                    self.start()
+                    self.started = True
+        return self.snapshot
+
+    # callback(snapshot, new_entries, removed_count) is called on the tracker's thread after every
+    # tick that changed the mempool
+    def subscribe(self, callback):
+        self.listeners.append(callback)
+
+    # Ask for a tick soon, e.g. when a new block has been indexed
+    def wake(self):
+        self.wake_event.set()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            started = time.monotonic()
+            self.wake_event.wait(self.interval)
+            self.wake_event.clear()
+            # Bursts of announcements are handled in one tick
+            if self.stop_event.wait(max(0, self.min_interval - (time.monotonic() - started))):
+                break
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"Error updating mempool: {e}")
+
+    def tick(self):
+        started = time.monotonic()
+        txids = self.get_mempool()
+        current = set(txids)
+        old = self.snapshot
+        kept = [entry for entry in old.entries if entry.txid in current]
+        new_txids = [txid for txid in txids if txid not in old.by_txid]
+
+        now = time.time()
+        new_entries = []
+        for start in range(0, len(new_txids), self.batch_size):
+            for txid, (size, fee, value) in self.describe(new_txids[start:start + self.batch_size]).items():
+                new_entries.append(MempoolEntry(txid, size, fee, value, now))
+
+        # kept is already in order, so this sort is mostly a merge
+        entries = kept + new_entries
+        entries.sort(key=MempoolEntry.sort_key)
+        self.snapshot = MempoolSnapshot(entries, now)
+
+        stats = self.stats
+        stats['ticks'] += 1
+        stats['added'] += len(new_entries)
+        stats['removed'] += len(old.entries) - len(kept)
+        stats['failed'] += len(new_txids) - len(new_entries)
+        stats['last_tick_seconds'] = time.monotonic() - started
+
+        removed = len(old.entries) - len(kept)
+        if new_entries or removed:
+            for callback in self.listeners:
+                try:
+                    callback(self.snapshot, new_entries, removed)
+                except Exception as e:
+                    print(f"Error handling mempool update: {e}")
+
+    # Transactions can leave the mempool between listing and fetching them, which fails the whole
+    # batch; in that case look them up one by one and skip the missing ones (they're retried next
+    # tick if they're still there)
+    def describe(self, txids):
+        try:
+            return self.describe_transactions(txids)
+        except Exception:
+            described = {}
+            for txid in txids:
+                try:
+                    described.update(self.describe_transactions([txid]))
+                except Exception:
+                    pass
+            return described
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats['transactions'] = len(self.snapshot)
+        stats['size'] = self.snapshot.total_size
+        return stats
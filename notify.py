@@ -0,0 +1,170 @@
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+try:
+    import zmq
+except ImportError:
+    zmq = None
+
+
+# Passes new block announcements from any source to whoever subscribed, and wakes the indexer
+# when a block arrives. Topics follow the node's ZMQ names: 'hashblock' with the block hash in hex.
+# Only the indexer listens; the web workers see the new block once it's in the database.
+class TipNotifier:
+    def __init__(self):
+        self.block_event = threading.Event()
+        self.listeners = []
+        self.stats = {'hashblock': 0, 'last_block_hash': None, 'last_block_time': None}
+
+    # callback(topic, body) is called on the source's thread, so it should be quick
+    def subscribe(self, callback):
+        self.listeners.append(callback)
+
+    def publish(self, topic, body=None):
+        self.stats[topic] = self.stats.get(topic, 0) + 1
+        if topic == 'hashblock':
+            self.stats['last_block_hash'] = body
+            self.stats['last_block_time'] = time.time()
+        for callback in self.listeners:
+            try:
+                callback(topic, body)
+            except Exception as e:
+                print(f"Error handling {topic} notification: {e}")
+        if topic == 'hashblock':
+            self.block_event.set()
+
+    # Block until a new block is announced (or the timeout passes), returning True if one was
+    def wait_for_block(self, timeout=None):
+        announced = self.block_event.wait(timeout)
+        self.block_event.clear()
+        return announced
+
+    def get_stats(self):
+        return dict(self.stats)
+
+
+def start_thread(target):
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    return thread
+
+
+# Asks the node for its best block hash, quickly at first and less and less often while nothing
+# changes: the interval doubles after every unchanged poll, up to max_interval, and drops back
+# to min_interval as soon as a new block turns up.
+class PollingSource:
+    def __init__(self, notifier, get_best_block_hash, min_interval=1, max_interval=30):
+        self.notifier = notifier
+        self.get_best_block_hash = get_best_block_hash
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.last_hash = None
+
+    def start(self):
+        return start_thread(self.run)
+
+    def poll(self):
+        block_hash = self.get_best_block_hash()
+        if block_hash != self.last_hash:
+            self.last_hash = block_hash
+            self.interval = self.min_interval
+            self.notifier.publish('hashblock', block_hash)
+        else:
+            self.interval = min(self.interval * 2, self.max_interval)
+
+    # Poll once and return how long to wait before the next poll
+    def step(self):
+        try:
+            self.poll()
+        except Exception as e:
+            # Node unreachable; keep backing off rather than hammering it
+            self.interval = min(self.interval * 2, self.max_interval)
+            print(f"Error polling for new blocks: {e}")
+        return self.interval
+
+    def run(self):
+        while True:
+            time.sleep(self.step())
+
+
+# Subscribes to the node's ZMQ block notifications (-zmqpubhashblock). Needs pyzmq.
+class ZMQSource:
+    def __init__(self, notifier, address, topics=('hashblock',)):
+        if zmq is None:
+            raise RuntimeError("ZMQ notifications need pyzmq (pip install pyzmq)")
+        self.notifier = notifier
+        self.address = address
+        self.topics = topics
+        self.sequence = {}
+
+    def start(self):
+        return start_thread(self.run)
+
+    def run(self):
+        context = zmq.Context.instance()
+        subscriber = context.socket(zmq.SUB)
+        subscriber.setsockopt(zmq.RCVHWM, 0)
+        for topic in self.topics:
+            subscriber.setsockopt_string(zmq.SUBSCRIBE, topic)
+        subscriber.connect(self.address)
+        while True:
+            try:
+                topic, body, *rest = subscriber.recv_multipart()
+                topic = topic.decode()
+                self.check_sequence(topic, rest)
+                if topic == 'hashblock':
+                    body = body.hex()
+                self.notifier.publish(topic, body)
+            except Exception as e:
+                print(f"Error reading ZMQ notification: {e}")
+
+    # Every message ends with a 4-byte little-endian sequence number per topic; a gap means
+    # messages were dropped (the indexer still catches up on the next block)
+    def check_sequence(self, topic, rest):
+        if not rest or len(rest[0]) != 4:
+            return
+        sequence = struct.unpack('<I', rest[0])[0]
+        expected = self.sequence.get(topic)
+        if expected is not None and sequence != expected:
+            print(f"Missed {(sequence - expected) & 0xffffffff} ZMQ {topic} notifications")
+        self.sequence[topic] = (sequence + 1) & 0xffffffff
+
+
+# Listens on a Unix socket for lines written by the node's -blocknotify command, e.g.
+#   -blocknotify="sh -c 'echo %s | nc -U /tmp/explorer.sock'"
+# Each line is a block hash, optionally preceded by a topic ("hashblock <hash>").
+class UnixSocketSource:
+    def __init__(self, notifier, path):
+        self.notifier = notifier
+        self.path = path
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # Left behind by a previous run
+        notifier = self.notifier
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    parts = line.decode(errors='replace').split()
+                    if len(parts) == 1:
+                        notifier.publish('hashblock', parts[0])
+                    elif len(parts) == 2:
+                        notifier.publish(parts[0], parts[1])
+
+        server = socketserver.ThreadingUnixStreamServer(self.path, Handler)
+        server.daemon_threads = True
+        return start_thread(server.serve_forever)
+
+
+# Send one line to a UnixSocketSource, e.g. to pass on a block announced to a web worker
+def send_to_socket(path, line):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(5)
+        sock.connect(path)
+        sock.sendall(line.encode() + b'\n')
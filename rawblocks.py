@@ -0,0 +1,118 @@
+from decimal import Decimal
+from io import BytesIO
+
+from bitcoin.base58 import CBase58Data
+from bitcoin.core import CBlockHeader, CTransaction, Hash, Hash160, b2lx
+from bitcoin.core.serialize import VarIntSerializer
+from bitcoin import segwit_addr
+
+OP_DUP = 0x76
+OP_HASH160 = 0xa9
+OP_EQUAL = 0x87
+OP_EQUALVERIFY = 0x88
+OP_CHECKSIG = 0xac
+OP_CHECKMULTISIG = 0xae
+
+
+# Address version bytes of the coin being decoded (see base58Prefixes in the coin's chainparams.cpp)
+class AddressParams:
+    def __init__(self, pubkey_version, script_version, bech32_hrp=None):
+        self.pubkey_version = pubkey_version
+        self.script_version = script_version
+        self.bech32_hrp = bech32_hrp
+
+
+# Proof-of-work difficulty from a block's compact target, computed the same way as the node
+def difficulty_from_bits(bits):
+    shift = (bits >> 24) & 0xff
+    difficulty = 0x0000ffff / (bits & 0x00ffffff)
+    while shift < 29:
+        difficulty *= 256
+        shift += 1
+    while shift > 29:
+        difficulty /= 256
+        shift -= 1
+    return difficulty
+
+
+# Addresses paid by an output script, following what older nodes list under
+# scriptPubKey.addresses: P2PK and bare multisig outputs list the P2PKH address of each key
+def script_addresses(script, params):
+    length = len(script)
+    if length == 25 and script[0] == OP_DUP and script[1] == OP_HASH160 and script[2] == 20 \
+            and script[23] == OP_EQUALVERIFY and script[24] == OP_CHECKSIG:
+        return [str(CBase58Data.from_bytes(script[3:23], params.pubkey_version))]
+    if length == 23 and script[0] == OP_HASH160 and script[1] == 20 and script[22] == OP_EQUAL:
+        return [str(CBase58Data.from_bytes(script[2:22], params.script_version))]
+    if length in (35, 67) and script[0] == length - 2 and script[-1] == OP_CHECKSIG:
+        return [str(CBase58Data.from_bytes(Hash160(script[1:-1]), params.pubkey_version))]
+    if params.bech32_hrp and length in (22, 34) and script[0] == 0 and script[1] == length - 2:
+        # Witness v0 only; python-bitcoinlib has no bech32m encoder for later versions
+        address = segwit_addr.encode(params.bech32_hrp, 0, script[2:])
+        return [address] if address else []
+    if length >= 37 and script[-1] == OP_CHECKMULTISIG and 0x51 <= script[0] <= 0x60:
+        return multisig_addresses(script, params)
+    return []
+
+
+def multisig_addresses(script, params):
+    addresses = []
+    pos = 1
+    while pos < len(script) - 2:
+        size = script[pos]
+        if size not in (33, 65) or pos + 1 + size > len(script) - 2:
+            return []
+        addresses.append(str(CBase58Data.from_bytes(Hash160(script[pos + 1:pos + 1 + size]), params.pubkey_version)))
+        pos += 1 + size
+    return addresses
+
+
+# Turn a decoded transaction into the same shape as verbose getrawtransaction output, limited to
+# the fields the indexer uses
+def transaction_to_dict(tx, txid, size, params):
+    vin = []
+    for txin in tx.vin:
+        if txin.prevout.is_null():
+            vin.append({'coinbase': txin.scriptSig.hex(), 'sequence': txin.nSequence})
+        else:
+            vin.append({'txid': b2lx(txin.prevout.hash), 'vout': txin.prevout.n, 'sequence': txin.nSequence})
+    vout = [{'value': Decimal(txout.nValue).scaleb(-8),
+             'n': n,
+             'scriptPubKey': {'addresses': script_addresses(txout.scriptPubKey, params)}}
+            for n, txout in enumerate(tx.vout)]
+    return {'txid': txid, 'size': size, 'vin': vin, 'vout': vout}
+
+
+# Decode a raw block (as returned by `getblock <hash> false`) into a verbose-getblock-like dict
+# and a list of transaction dicts, without asking the node for each transaction
+def decode_block(raw, params):
+    f = BytesIO(raw)
+    header = CBlockHeader.stream_deserialize(f)
+    tx_count = VarIntSerializer.stream_deserialize(f)
+
+    txids = []
+    txs = []
+    for _ in range(tx_count):
+        start = f.tell()
+        tx = CTransaction.stream_deserialize(f)
+        end = f.tell()
+        # Without witness data the txid is the hash of the bytes we just read
+        if tx.has_witness():
+            txid = b2lx(tx.GetTxid())
+        else:
+            txid = b2lx(Hash(raw[start:end]))
+        txids.append(txid)
+        txs.append(transaction_to_dict(tx, txid, end - start, params))
+
+    block = {
+        'hash': b2lx(Hash(raw[:80])),
+        'merkleroot': b2lx(header.hashMerkleRoot),
+        'previousblockhash': b2lx(header.hashPrevBlock),
+        'time': header.nTime,
+        'bits': '%08x' % header.nBits,
+        'difficulty': difficulty_from_bits(header.nBits),
+        'size': len(raw),
+        'tx': txids,
+    }
+    return block, txs
+
@@ -0,0 +1,255 @@
+import copy
+import json
+import queue
+import threading
+import time
+from decimal import Decimal
+
+import requests
+from bitcoin.rpc import JSONRPCError
+
+# Largest number of calls sent in a single JSON-RPC batch request
+max_batch_size = 500
+
+# Batches slower than this (in seconds) are logged
+slow_batch_seconds = 2
+
+# Requests that fail to reach the node are retried this many times, waiting
+# retry_backoff_seconds, then twice as long each time, up to retry_backoff_max_seconds
+retry_attempts = 3
+retry_backoff_seconds = 0.5
+retry_backoff_max_seconds = 8
+
+# After this many failed requests in a row calls fail straight away, until a trial request
+# is let through breaker_reset_seconds later
+breaker_failures = 5
+breaker_reset_seconds = 30
+
+
+# Raised instead of contacting the node while the circuit breaker is open
+class NodeUnavailableError(requests.exceptions.ConnectionError):
+    pass
+
+
+# Errors worth retrying: the request never got an answer, or the node was too busy to give one
+class RetryableError(Exception):
+    pass
+
+
+# Stops hammering a node that is down. Closed: requests go through. Open: they fail at once.
+# Half-open (reset_seconds after opening): one trial request goes through, and its result
+# closes or reopens the breaker.
+class CircuitBreaker:
+    def __init__(self, failures=breaker_failures, reset_seconds=breaker_reset_seconds):
+        self.max_failures = failures
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+        self.times_opened = 0
+        self.fast_failures = 0
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if not self.trial_running and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.trial_running = True
+                return True
+            self.fast_failures += 1
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_running or (self.opened_at is None and self.failures >= self.max_failures):
+                if self.opened_at is None:
+                    print(f"RPC node unreachable after {self.failures} failed requests, failing fast")
+                self.times_opened += 1
+                self.opened_at = time.monotonic()
+            self.trial_running = False
+
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half-open' if self.trial_running else 'open'
+
+
+# JSON-RPC client that can send many calls to the node in one HTTP request. Up to pool_size
+# requests run at once, each on its own keep-alive session; callers beyond that wait for a free one.
+class RPCClient:
+    def __init__(self, url, timeout=60, pool_size=4):
+        self.url = url
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.sessions = queue.LifoQueue()
+        for _ in range(pool_size):
+            self.sessions.put(None)  # Sessions are created the first time they're used
+        self.breaker = CircuitBreaker()
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.stats = {
+            'requests': 0,
+            'calls': 0,
+            'total_seconds': 0.0,
+            'last_batch_size': 0,
+            'last_batch_seconds': 0.0,
+            'max_batch_seconds': 0.0,
+            'retries': 0,
+            'failures': 0,
+            'pool_waits': 0,
+            'pool_wait_seconds': 0.0,
+            'max_pool_wait_seconds': 0.0,
+            'max_in_flight': 0,
+        }
+
+    # A client sharing this one's connections, breaker and stats but with a different timeout,
+    # e.g. a long one for the indexer and a short one for web requests
+    def with_timeout(self, timeout):
+        client = copy.copy(self)
+        client.timeout = timeout
+        return client
+
+    # Allow rpc.getblockcount() style calls, like RawProxy
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return lambda *params: self.call(name, *params)
+
+    # Make a single RPC call
+    def call(self, method, *params):
+        return self.batch([(method, params)])[0]
+
+    # Call the same method once for each set of params, in as few requests as possible
+    def batch_call(self, method, params_list):
+        return self.batch([(method, params) for params in params_list])
+
+    # Send a list of (method, params) calls and return their results in the same order
+    def batch(self, calls):
+        results = []
+        for start in range(0, len(calls), max_batch_size):
+            results.extend(self._send(calls[start:start + max_batch_size]))
+        return results
+
+    def _send(self, calls):
+        if not calls:
+            return []
+
+        payload = json.dumps([{'jsonrpc': '1.0', 'id': i, 'method': method, 'params': list(params)}
+                              for i, (method, params) in enumerate(calls)])
+
+        delay = retry_backoff_seconds
+        for attempt in range(retry_attempts + 1):
+            if not self.breaker.allow():
+                raise NodeUnavailableError(f"RPC node at {self.url.split('@')[-1]} is unavailable")
+            try:
+                replies = self._post(payload, len(calls))
+            except RetryableError as e:
+                self.breaker.record_failure()
+                self._count('failures')
+                if attempt == retry_attempts:
+                    raise NodeUnavailableError(str(e))
+                self._count('retries')
+                time.sleep(delay)
+                delay = min(delay * 2, retry_backoff_max_seconds)
+                continue
+            except Exception:
+                self.breaker.record_success()  # The node answered, even if it was an error
+                raise
+            self.breaker.record_success()
+            break
+
+        replies_by_id = {reply.get('id'): reply for reply in replies}
+        results = []
+        for i, (method, params) in enumerate(calls):
+            reply = replies_by_id.get(i)
+            if reply is None:
+                raise JSONRPCError({'code': -343, 'message': f'missing JSON-RPC result for {method}'})
+            err = reply.get('error')
+            if err is not None:
+                if isinstance(err, dict):
+                    raise JSONRPCError({'code': err.get('code', -345),
+                                        'message': err.get('message', 'error message not specified')})
+                raise JSONRPCError({'code': -344, 'message': str(err)})
+            results.append(reply.get('result'))
+        return results
+
+    # POST one request on a pooled session and return the decoded replies
+    def _post(self, payload, num_calls):
+        wait_started = time.monotonic()
+        session = self.sessions.get()
+        self._record_wait(time.monotonic() - wait_started)
+        if session is None:
+            session = requests.Session()
+            session.headers['Content-Type'] = 'application/json'
+
+        started = time.monotonic()
+        try:
+            response = session.post(self.url, data=payload, timeout=self.timeout)
+            # The node answers a batch with HTTP 200 even if individual calls fail
+            try:
+                replies = response.json(parse_float=Decimal)
+            except ValueError:
+                if response.status_code >= 500:
+                    # e.g. 503 when the node's RPC work queue is full
+                    raise RetryableError(f"HTTP {response.status_code} from the node")
+                response.raise_for_status()
+                raise JSONRPCError({'code': -342, 'message': 'non-JSON HTTP response with %d' % response.status_code})
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            # The connection may be half-used, so start a fresh session next time
+            session.close()
+            session = None
+            raise RetryableError(str(e))
+        finally:
+            self.sessions.put(session)
+            self._record(num_calls, time.monotonic() - started)
+
+        if isinstance(replies, dict):
+            # Whole-request errors (bad auth, parse errors) come back as a single object
+            replies = [replies]
+        return replies
+
+    def _count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def _record_wait(self, waited):
+        with self.lock:
+            stats = self.stats
+            stats['pool_waits'] += 1
+            stats['pool_wait_seconds'] += waited
+            stats['max_pool_wait_seconds'] = max(stats['max_pool_wait_seconds'], waited)
+            self.in_flight += 1
+            stats['max_in_flight'] = max(stats['max_in_flight'], self.in_flight)
+
+    def _record(self, num_calls, elapsed):
+        with self.lock:
+            self.in_flight -= 1
+            stats = self.stats
+            stats['requests'] += 1
+            stats['calls'] += num_calls
+            stats['total_seconds'] += elapsed
+            stats['last_batch_size'] = num_calls
+            stats['last_batch_seconds'] = elapsed
+            stats['max_batch_seconds'] = max(stats['max_batch_seconds'], elapsed)
+        if elapsed > slow_batch_seconds:
+            print(f"Slow RPC batch: {num_calls} calls took {elapsed:.2f} seconds")
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['in_flight'] = self.in_flight
+        stats['pool_size'] = self.pool_size
+        stats['avg_batch_seconds'] = stats['total_seconds'] / stats['requests'] if stats['requests'] else 0
+        stats['avg_pool_wait_seconds'] = stats['pool_wait_seconds'] / stats['pool_waits'] if stats['pool_waits'] else 0
+        stats['breaker'] = self.breaker.state()
+        stats['breaker_opened'] = self.breaker.times_opened
+        stats['fast_failures'] = self.breaker.fast_failures
+        return stats
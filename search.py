@@ -0,0 +1,88 @@
+from bitcoin import segwit_addr
+from bitcoin.base58 import Base58Error, CBase58Data
+from bitcoin.rpc import JSONRPCError
+from requests.exceptions import RequestException
+
+import database
+
+HEX_DIGITS = set('0123456789abcdefABCDEF')
+
+
+def is_hex(value):
+    return bool(value) and all(c in HEX_DIGITS for c in value)
+
+
+# str.isdigit() is also true for characters like '²' that int() won't take
+def is_height(value):
+    return value.isascii() and value.isdigit()
+
+
+# Whether a string is an address of this coin: one of its prefixes, and a base58check address
+# with one of its version bytes or a witness v0 bech32 address with its human-readable part
+def is_address(query, params, prefixes):
+    if not any(query.startswith(prefix) for prefix in prefixes):
+        return False
+    if params.bech32_hrp and query.lower().startswith(params.bech32_hrp + '1'):
+        return segwit_addr.decode(params.bech32_hrp, query)[0] is not None
+    try:
+        return CBase58Data(query).nVersion in (params.pubkey_version, params.script_version)
+    except (Base58Error, ValueError):
+        return False
+
+
+# Work out what a search query refers to from its shape: ('block', height), ('transaction', txid),
+# ('address', address) or (None, None). Heights and hashes are looked up in the local index; the
+# node is only asked about 64-character hex strings the index doesn't have yet (recent blocks
+# and mempool transactions).
+def classify(query, cursor, rpc, params, prefixes):
+    if is_height(query) and len(query) < 64:
+        height = int(query)
+        if height <= database.get_indexed_height(cursor):
+            return 'block', height
+        try:
+            rpc.getblockhash(height)
+            return 'block', height
+        except (JSONRPCError, RequestException):
+            return None, None
+
+    if len(query) == 64 and is_hex(query):
+        query = query.lower()
+        height = database.find_block_height(cursor, query)
+        if height is not None:
+            return 'block', height
+        if database.find_transaction_height(cursor, query) is not None:
+            return 'transaction', query
+        try:
+            block = rpc.getblock(query)
+            # A block that was reorganized away has -1 confirmations, and is no longer at its height
+            if block['confirmations'] >= 0:
+                return 'block', block['height']
+            return None, None
+        except (JSONRPCError, RequestException):
+            pass
+        try:
+            rpc.getrawtransaction(query, True)
+            return 'transaction', query
+        except (JSONRPCError, RequestException):
+            return None, None
+
+    if is_address(query, params, prefixes):
+        return 'address', query
+
+    return None, None
+
+
+# Blocks, transactions and known addresses starting with a prefix, for search-as-you-type. Hex
+# prefixes need at least min_hex_length characters so short ones don't match half the chain.
+def autocomplete(prefix, cursor, prefixes, limit=10, min_hex_length=4):
+    suggestions = []
+    if is_hex(prefix) and min_hex_length <= len(prefix) <= 64:
+        prefix_lower = prefix.lower()
+        for height, block_hash in database.find_blocks_by_prefix(cursor, prefix_lower, limit):
+            suggestions.append({'type': 'block', 'id': height, 'hash': block_hash})
+        for txid, height in database.find_transactions_by_prefix(cursor, prefix_lower, limit - len(suggestions)):
+            suggestions.append({'type': 'transaction', 'id': txid, 'block_height': height})
+    if len(suggestions) < limit and prefix and any(prefix.startswith(p) or p.startswith(prefix) for p in prefixes):
+        for address in database.find_addresses_by_prefix(cursor, prefix, limit - len(suggestions)):
+            suggestions.append({'type': 'address', 'id': address})
+    return suggestions
@@ -0,0 +1,240 @@
+import sqlite3
+
+import database
+
+# A shard is a scratch SQLite file written by one reindex worker for a range of heights. It holds
+# what can be read from the blocks alone: addresses as text, and inputs as the outpoints they
+# spend, since the outputs may be in another shard. Once every shard is written, combine() copies
+# them into one file and merge() builds the explorer's tables from it.
+shard_schema = '''
+CREATE TABLE blocks (
+    height INTEGER NOT NULL,
+    hash BLOB NOT NULL,
+    previous_hash BLOB,
+    merkle_root BLOB NOT NULL,
+    time INTEGER NOT NULL,
+    difficulty REAL NOT NULL,
+    size INTEGER NOT NULL,
+    tx_count INTEGER NOT NULL,
+    total_out INTEGER NOT NULL,
+    time_to_mine INTEGER NOT NULL
+);
+CREATE TABLE txs (
+    txid BLOB NOT NULL,
+    block_height INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    total_out INTEGER NOT NULL,
+    inputs INTEGER NOT NULL,
+    outputs INTEGER NOT NULL,
+    coinbase INTEGER NOT NULL
+);
+-- One row per address of each output, like the outputs table, or one with a NULL address
+CREATE TABLE outs (
+    txid BLOB NOT NULL,
+    vout INTEGER NOT NULL,
+    value INTEGER NOT NULL,
+    address TEXT,
+    block_height INTEGER NOT NULL
+);
+CREATE TABLE spends (
+    txid BLOB NOT NULL,  -- the spending transaction
+    block_height INTEGER NOT NULL,
+    prev_txid BLOB NOT NULL,
+    prev_vout INTEGER NOT NULL
+);
+'''
+
+shard_tables = ['blocks', 'txs', 'outs', 'spends']
+
+# Tables whose indexes a reindex into an empty database builds after loading, not row by row
+indexed_tables = ['outputs', 'address_transactions', 'tx_summary', 'block_summary']
+
+
+# Create an empty shard file. It's only scratch space, rewritten if anything goes wrong, so it
+# doesn't need a journal.
+def create_shard(path):
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode = OFF')
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.executescript(shard_schema)
+    return conn
+
+
+# Store one block's rows in a shard
+def write_block(cursor, block_row, tx_rows, output_rows, spend_rows):
+    cursor.execute('INSERT INTO blocks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', block_row)
+    cursor.executemany('INSERT INTO txs VALUES (?, ?, ?, ?, ?, ?, ?, ?)', tx_rows)
+    cursor.executemany('INSERT INTO outs VALUES (?, ?, ?, ?, ?)', output_rows)
+    cursor.executemany('INSERT INTO spends VALUES (?, ?, ?, ?)', spend_rows)
+
+
+# Copy the shards, in height order, into a single file at path. SQLite can only attach a few
+# files at once and can't detach them before the transaction ends, so merge() reads this one.
+def combine(shard_paths, path):
+    conn = create_shard(path)
+    for shard_path in shard_paths:
+        conn.execute('ATTACH ? AS shard', (shard_path,))
+        for table in shard_tables:
+            conn.execute(f'INSERT INTO main.{table} SELECT * FROM shard.{table}')
+        conn.commit()
+        conn.execute('DETACH shard')
+    conn.execute('CREATE INDEX blocks_height ON blocks (height)')
+    conn.close()
+
+
+# Height of the first combined block that doesn't follow on from the block before it (prev_hash,
+# in hex, is the hash of the block before the first), or None if they form one chain
+def find_broken_link(cursor, path, prev_hash):
+    cursor.execute('ATTACH ? AS reindex', (path,))
+    try:
+        cursor.execute('SELECT height, previous_hash FROM reindex.blocks ORDER BY height LIMIT 1')
+        first_height, previous_hash = cursor.fetchone()
+        if prev_hash is not None and previous_hash != bytes.fromhex(prev_hash):
+            return first_height
+        cursor.execute('''
+            SELECT MIN(block.height) FROM reindex.blocks AS block
+            JOIN reindex.blocks AS previous ON previous.height = block.height - 1
+            WHERE block.previous_hash != previous.hash
+        ''')
+        return cursor.fetchone()[0]
+    finally:
+        cursor.execute('DETACH reindex')
+
+
+# Build the explorer's rows for the combined shards at path, on top of the blocks already in the
+# database. Runs in the caller's transaction, so the whole range lands at once or not at all.
+# Outputs are loaded first, so every input can then be matched with the output it spends
+# wherever it is, and the fees and sent values are worked out from those. Outputs the database
+# doesn't have (like the genesis block's) are looked up with fetch_outputs(outpoints), which
+# returns {(txid, vout): (satoshis, addresses)}. Into an empty database the indexes are dropped
+# first and built again after loading, which is much quicker.
+def merge(cursor, path, empty, fetch_outputs):
+    cursor.execute('ATTACH ? AS reindex', (path,))
+
+    indexes = []
+    if empty:
+        cursor.execute(f'''
+            SELECT name, sql FROM sqlite_master
+            WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN ({', '.join('?' * len(indexed_tables))})
+        ''', indexed_tables)
+        indexes = cursor.fetchall()
+        for name, _ in indexes:
+            cursor.execute(f'DROP INDEX {name}')
+
+    cursor.execute('''
+        INSERT OR IGNORE INTO addresses (address)
+        SELECT address FROM reindex.outs WHERE address IS NOT NULL
+    ''')
+    cursor.execute('''
+        INSERT INTO outputs (txid, vout, value, address_id, block_height)
+        SELECT outs.txid, outs.vout, outs.value, addresses.id, outs.block_height
+        FROM reindex.outs LEFT JOIN addresses ON addresses.address = outs.address
+        ORDER BY outs.rowid
+    ''')
+    # Inputs are matched with outputs through the outpoint index, so it's needed from here on
+    for name, sql in indexes:
+        if name == 'outputs_outpoint':
+            cursor.execute(sql)
+
+    cursor.execute('''
+        CREATE TEMP TABLE reindex_prevouts (txid BLOB, vout INTEGER, value INTEGER, address_id INTEGER)
+    ''')
+    cursor.execute('''
+        SELECT DISTINCT prev_txid, prev_vout FROM reindex.spends
+        WHERE NOT EXISTS (SELECT 1 FROM outputs WHERE txid = spends.prev_txid AND vout = spends.prev_vout)
+    ''')
+    missing = [(txid.hex(), vout) for txid, vout in cursor.fetchall()]
+    if missing:
+        rows = []
+        for (txid, vout), (value, addresses) in fetch_outputs(missing).items():
+            for address in addresses or [None]:
+                address_id = database.intern_address(cursor, address) if address is not None else None
+                rows.append((bytes.fromhex(txid), vout, value, address_id))
+        cursor.executemany('INSERT INTO reindex_prevouts VALUES (?, ?, ?, ?)', rows)
+    cursor.execute('CREATE INDEX reindex_prevouts_outpoint ON reindex_prevouts (txid, vout)')
+    cursor.execute('''
+        UPDATE outputs SET spent_by = spends.txid, spent_height = spends.block_height
+        FROM reindex.spends
+        WHERE outputs.txid = spends.prev_txid AND outputs.vout = spends.prev_vout
+    ''')
+
+    cursor.execute('''
+        INSERT INTO address_transactions (address_id, txid, value, type, block_height)
+        SELECT addresses.id, outs.txid, outs.value, ?, outs.block_height
+        FROM reindex.outs JOIN addresses ON addresses.address = outs.address
+    ''', (database.RECEIVED,))
+    for outputs_table in ['outputs', 'reindex_prevouts']:
+        cursor.execute(f'''
+            INSERT INTO address_transactions (address_id, txid, value, type, block_height)
+            SELECT prevout.address_id, spends.txid, prevout.value, ?, spends.block_height
+            FROM reindex.spends JOIN {outputs_table} AS prevout
+                ON prevout.txid = spends.prev_txid AND prevout.vout = spends.prev_vout
+            WHERE prevout.address_id IS NOT NULL
+        ''', (database.SENT,))
+
+    # Value of each transaction's inputs; outputs with several addresses have a row per address,
+    # so each input takes the value of one of them
+    cursor.execute('''
+        CREATE TEMP TABLE reindex_inputs (txid BLOB PRIMARY KEY, total_in INTEGER NOT NULL) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        INSERT INTO reindex_inputs
+        SELECT txid, SUM(COALESCE(
+            (SELECT value FROM outputs WHERE txid = spends.prev_txid AND vout = spends.prev_vout LIMIT 1),
+            (SELECT value FROM reindex_prevouts WHERE txid = spends.prev_txid AND vout = spends.prev_vout LIMIT 1)))
+        FROM reindex.spends GROUP BY txid
+    ''')
+    fee = 'CASE WHEN txs.coinbase THEN 0 ELSE COALESCE(reindex_inputs.total_in, 0) - txs.total_out END'
+    cursor.execute(f'''
+        INSERT OR REPLACE INTO tx_summary ({', '.join(database.tx_summary_columns)})
+        SELECT txs.txid, txs.block_height, txs.position, txs.size, txs.total_out, {fee}, txs.inputs, txs.outputs
+        FROM reindex.txs LEFT JOIN reindex_inputs ON reindex_inputs.txid = txs.txid
+    ''')
+    cursor.execute(f'''
+        INSERT OR REPLACE INTO block_summary ({', '.join(database.block_summary_columns)})
+        SELECT blocks.height, blocks.hash, blocks.merkle_root, blocks.time, blocks.difficulty, blocks.size,
+               blocks.tx_count, blocks.total_out, COALESCE(fees.total_fees, 0), blocks.time_to_mine
+        FROM reindex.blocks LEFT JOIN (
+            SELECT txs.block_height, SUM({fee}) AS total_fees
+            FROM reindex.txs LEFT JOIN reindex_inputs ON reindex_inputs.txid = txs.txid
+            GROUP BY txs.block_height
+        ) AS fees ON fees.block_height = blocks.height
+    ''')
+    cursor.execute('DROP TABLE reindex_inputs')
+    cursor.execute('DROP TABLE reindex_prevouts')
+
+    for name, sql in indexes:
+        if name != 'outputs_outpoint':
+            cursor.execute(sql)
+
+    # Each address's share of the new blocks, added to its summary like update_address_summaries()
+    cursor.execute('SELECT MIN(height) FROM reindex.blocks')
+    first_height = cursor.fetchone()[0]
+    cursor.execute('''
+        INSERT INTO address_summary
+            (address_id, received, sent, balance, tx_count, first_seen_height, last_seen_height)
+        SELECT address_id, received, sent, received - sent, tx_count, first_seen_height, last_seen_height
+        FROM (
+            SELECT address_id,
+                   COALESCE(SUM(CASE WHEN type = ? THEN value END), 0) AS received,
+                   COALESCE(SUM(CASE WHEN type = ? THEN value END), 0) AS sent,
+                   COUNT(DISTINCT txid) AS tx_count,
+                   MIN(block_height) AS first_seen_height,
+                   MAX(block_height) AS last_seen_height
+            FROM address_transactions
+            WHERE block_height >= ?
+            GROUP BY address_id
+        ) WHERE true
+        ON CONFLICT (address_id) DO UPDATE SET
+            received = received + excluded.received,
+            sent = sent + excluded.sent,
+            balance = balance + excluded.balance,
+            tx_count = tx_count + excluded.tx_count,
+            first_seen_height = MIN(first_seen_height, excluded.first_seen_height),
+            last_seen_height = MAX(last_seen_height, excluded.last_seen_height)
+    ''', (database.RECEIVED, database.SENT, first_height))
+
+    cursor.execute('SELECT height, hash FROM reindex.blocks ORDER BY height DESC LIMIT 1')
+    last_height, last_hash = cursor.fetchone()
+    return last_height, last_hash.hex()
@@ -0,0 +1,28 @@
+import fakenode
+import indexer
+import rawblocks
+from tests.helpers import IndexerTestCase
+
+
+class FakeNodeTest(IndexerTestCase):
+    def test_base58check(self):
+        # The example in "Technical background of version 1 Bitcoin addresses" on the Bitcoin wiki
+        self.assertEqual(fakenode.base58check(0, bytes.fromhex('010966776006953d5567439e5e39f86a0d273bee')),
+                         '16UwLL9Risc3QfPqBUvKofHmBQ7wMtjvM')
+        self.assertEqual(fakenode.base58check(0, bytes(20)), '1111111111111111111114oLvT2')
+
+    def test_raw_decoding_gives_the_addresses_the_node_reports(self):
+        chain = fakenode.SyntheticChain(blocks=1, addresses=100)
+        for script in chain.scripts:
+            script_type, address = chain.script_types[script]
+            self.assertEqual(rawblocks.script_addresses(script, chain.params), [address])
+            self.assertEqual(script_type, 'scripthash' if script.is_p2sh() else 'pubkeyhash')
+
+    def test_raw_mode_matches_json_mode(self):
+        self.start_node(fakenode.FakeNode(fakenode.SyntheticChain(blocks=40, txs_per_block=6, addresses=100)))
+        self.addCleanup(setattr, indexer, 'indexerMode', indexer.indexerMode)
+        indexer.indexerMode = 'json'
+        self.index('json')
+        indexer.indexerMode = 'raw'
+        self.index('raw')
+        self.assertEqual(self.dump('raw'), self.dump('json'))
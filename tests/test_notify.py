@@ -0,0 +1,119 @@
+import os
+import struct
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import notify
+
+try:
+    import zmq
+except ImportError:
+    zmq = None
+
+BLOCK_HASH = '00' * 31 + 'ab'
+
+
+# Records what a TipNotifier passes on, so a test can wait for it
+class Recorder:
+    def __init__(self, notifier):
+        self.received = []
+        self.condition = threading.Condition()
+        notifier.subscribe(self.callback)
+
+    def callback(self, topic, body):
+        with self.condition:
+            self.received.append((topic, body))
+            self.condition.notify_all()
+
+    def wait_for(self, count, timeout=5):
+        with self.condition:
+            self.condition.wait_for(lambda: len(self.received) >= count, timeout)
+            return list(self.received)
+
+
+class TipNotifierTest(unittest.TestCase):
+    def test_publish_wakes_the_block_waiter(self):
+        notifier = notify.TipNotifier()
+        recorder = Recorder(notifier)
+        self.assertFalse(notifier.wait_for_block(0))
+        notifier.publish('hashblock', BLOCK_HASH)
+        self.assertTrue(notifier.wait_for_block(0))
+        self.assertFalse(notifier.wait_for_block(0))
+        self.assertEqual(recorder.received, [('hashblock', BLOCK_HASH)])
+        self.assertEqual(notifier.get_stats()['last_block_hash'], BLOCK_HASH)
+
+    def test_failing_listener_does_not_stop_the_others(self):
+        notifier = notify.TipNotifier()
+        notifier.subscribe(lambda topic, body: 1 / 0)
+        recorder = Recorder(notifier)
+        with mock.patch('builtins.print'):
+            notifier.publish('hashblock', BLOCK_HASH)
+        self.assertEqual(recorder.received, [('hashblock', BLOCK_HASH)])
+        self.assertTrue(notifier.wait_for_block(0))
+
+    def test_unix_socket_source(self):
+        path = os.path.join(tempfile.mkdtemp(prefix='explorer-test-'), 'notify.sock')
+        self.addCleanup(os.rmdir, os.path.dirname(path))
+        self.addCleanup(os.unlink, path)
+        notifier = notify.TipNotifier()
+        recorder = Recorder(notifier)
+        notify.UnixSocketSource(notifier, path).start()
+        notify.send_to_socket(path, BLOCK_HASH)
+        notify.send_to_socket(path, f'hashblock {BLOCK_HASH.upper()}')
+        self.assertEqual(recorder.wait_for(2), [('hashblock', BLOCK_HASH), ('hashblock', BLOCK_HASH.upper())])
+        self.assertTrue(notifier.wait_for_block(0))
+
+    @unittest.skipIf(zmq is None, "needs pyzmq")
+    def test_zmq_source(self):
+        # A local publisher sending what the node sends for -zmqpubhashblock: topic, hash, sequence
+        publisher = zmq.Context.instance().socket(zmq.PUB)
+        self.addCleanup(publisher.close, 0)
+        port = publisher.bind_to_random_port('tcp://127.0.0.1')
+        notifier = notify.TipNotifier()
+        recorder = Recorder(notifier)
+        notify.ZMQSource(notifier, f'tcp://127.0.0.1:{port}').start()
+
+        # Subscriptions take a moment to reach the publisher, and messages sent before then are lost
+        deadline = time.monotonic() + 5
+        sequence = 0
+        while not recorder.wait_for(1, 0.05) and time.monotonic() < deadline:
+            publisher.send_multipart([b'rawtx', b'\x01\x02', struct.pack('<I', 0)])
+            publisher.send_multipart([b'hashblock', bytes.fromhex(BLOCK_HASH), struct.pack('<I', sequence)])
+            sequence += 1
+        self.assertEqual(recorder.wait_for(1)[0], ('hashblock', BLOCK_HASH))
+        self.assertNotIn('rawtx', [topic for topic, _ in recorder.received])
+
+
+class PollingSourceTest(unittest.TestCase):
+    def setUp(self):
+        self.hashes = []
+        self.notifier = notify.TipNotifier()
+        self.recorder = Recorder(self.notifier)
+        self.source = notify.PollingSource(self.notifier, self.best_block_hash, min_interval=1, max_interval=8)
+
+    def best_block_hash(self):
+        answer = self.hashes.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    def steps(self, *answers):
+        self.hashes.extend(answers)
+        with mock.patch('builtins.print'):
+            return [self.source.step() for _ in answers]
+
+    def test_backs_off_while_nothing_changes(self):
+        self.assertEqual(self.steps('a', 'a', 'a', 'a', 'a', 'a'), [1, 2, 4, 8, 8, 8])
+        self.assertEqual(self.recorder.received, [('hashblock', 'a')])
+
+    def test_new_block_resets_the_interval(self):
+        self.assertEqual(self.steps('a', 'a', 'a', 'b', 'b'), [1, 2, 4, 1, 2])
+        self.assertEqual(self.recorder.received, [('hashblock', 'a'), ('hashblock', 'b')])
+
+    def test_backs_off_while_the_node_fails(self):
+        error = ConnectionError('node down')
+        self.assertEqual(self.steps('a', error, error, error, error, 'a', 'b'), [1, 2, 4, 8, 8, 8, 1])
+        self.assertEqual(self.recorder.received, [('hashblock', 'a'), ('hashblock', 'b')])
@@ -0,0 +1,107 @@
+import sqlite3
+import time
+from unittest import mock
+
+import app
+import database
+import fakenode
+import indexer
+from tests.helpers import WebTestCase
+
+
+class PagesTest(WebTestCase):
+    def setUp(self):
+        super().setUp()
+        self.chain = fakenode.SyntheticChain(blocks=30, txs_per_block=4, addresses=50)
+        self.client = self.serve(fakenode.FakeNode(self.chain))
+
+    def test_bad_page_numbers_show_the_first_page(self):
+        first = self.client.get('/').get_data()
+        for page in ('abc', '0', '-5'):
+            response = self.client.get(f'/?page={page}')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_data(), first)
+
+    def test_stale_homepage_is_rendered_again_after_the_request(self):
+        self.assertEqual(self.client.get('/').headers['X-Cache'], 'MISS')
+        with self.chain.lock:
+            self.chain.mine([self.chain.make_tx()])
+        self.quietly(indexer.parse_blocks, None, None)
+
+        # The page from the old tip is served while a new one is rendered in the background
+        response = self.client.get('/')
+        self.assertEqual(response.headers['X-Cache'], 'STALE')
+        self.assertNotIn(f'/block?height={self.chain.tip()}"', response.get_data(as_text=True))
+        deadline = time.monotonic() + 10
+        while response.headers['X-Cache'] == 'STALE' and time.monotonic() < deadline:
+            time.sleep(0.01)
+            response = self.client.get('/')
+        self.assertEqual(response.headers['X-Cache'], 'HIT')
+        self.assertIn(f'/block?height={self.chain.tip()}"', response.get_data(as_text=True))
+
+    def test_block_errors(self):
+        self.assertEqual(self.client.get('/block').status_code, 400)
+        self.assertEqual(self.client.get('/block?height=abc').status_code, 400)
+        self.assertEqual(self.client.get(f'/block?height={self.chain.tip() + 1}').status_code, 404)
+
+    def test_block_page_failing_part_way_is_ended(self):
+        def failing_rows(*args):
+            yield from rows(*args)
+            raise sqlite3.OperationalError('disk I/O error')
+
+        rows = database.iter_tx_summaries
+        with mock.patch.object(database, 'iter_tx_summaries', failing_rows):
+            page, output = self.quietly(lambda: self.client.get('/block?height=1').get_data(as_text=True))
+        self.assertIn('disk I/O error', output)
+        self.assertIn(self.chain.hashes[1], page)
+        self.assertTrue(page.endswith('could not be loaded.</p></body></html>'))
+
+    def test_search_and_api_take_only_ascii_digits_as_heights(self):
+        self.assertEqual(self.client.get('/search?query=5').headers['Location'], '/block?height=5')
+        self.assertEqual(self.client.get('/search?query=²').status_code, 200)
+        self.assertEqual(self.client.get('/api/v1/block/²').status_code, 400)
+
+    def test_cached_transaction_confirmations_follow_the_indexed_tip(self):
+        txid = self.chain.blocks[self.chain.tip()][1][1]
+        self.assertIn('Confirmations:</strong> 1<', self.client.get(f'/transaction?txid={txid}').get_data(as_text=True))
+        with self.chain.lock:
+            for _ in range(3):
+                self.chain.mine([self.chain.make_tx()])
+        self.quietly(indexer.parse_blocks, None, None)
+        self.assertIn('Confirmations:</strong> 4<', self.client.get(f'/transaction?txid={txid}').get_data(as_text=True))
+
+    def test_new_indexed_block_wakes_the_mempool_tracker(self):
+        self.client.get('/')
+        with mock.patch.object(app.mempool_tracker, 'wake') as wake:
+            self.client.get('/')
+            wake.assert_not_called()
+            with self.chain.lock:
+                self.chain.mine([self.chain.make_tx()])
+            self.quietly(indexer.parse_blocks, None, None)
+            self.client.get('/')
+            wake.assert_called_once_with()
+
+    def test_notify_hook_needs_the_secret(self):
+        url = f'/notify/block/{self.chain.hashes[-1]}'
+        self.addCleanup(setattr, app, 'notifySecret', app.notifySecret)
+        app.notifySecret = ''
+        self.assertEqual(self.client.post(url, headers={'X-Notify-Secret': ''}).status_code, 403)
+        app.notifySecret = 'swordfish'
+        self.assertEqual(self.client.post(url).status_code, 403)
+        self.assertEqual(self.client.post(url, headers={'X-Notify-Secret': 'sword'}).status_code, 403)
+        with mock.patch.object(app.mempool_tracker, 'wake'):
+            self.assertEqual(self.client.post(url, headers={'X-Notify-Secret': 'swordfish'}).status_code, 204)
+
+    def test_reorganized_block_hashes_are_not_found(self):
+        old_hashes = list(self.chain.hashes)
+        self.chain.reorg(12, 12)
+        self.quietly(indexer.parse_blocks, None, None)
+        deep, tip = old_hashes[-12], old_hashes[-1]
+        self.assertEqual(self.client.get(f'/api/v1/block/{self.chain.hashes[-12]}').get_json()['hash'],
+                         self.chain.hashes[-12])
+        for block_hash in (deep, tip):
+            response = self.client.get(f'/api/v1/block/{block_hash}')
+            self.assertEqual(response.status_code, 404)
+            self.assertNotIn('immutable', response.headers['Cache-Control'])
+            self.assertNotIn('ETag', response.headers)
+            self.assertEqual(self.client.get(f'/search?query={block_hash}').headers.get('Location'), None)
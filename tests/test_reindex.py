@@ -0,0 +1,86 @@
+import fakenode
+import indexer
+from tests.helpers import IndexerTestCase
+
+
+class ReindexRangeTest(IndexerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.chain = fakenode.SyntheticChain(blocks=40, txs_per_block=6, addresses=100)
+        self.node = fakenode.FakeNode(self.chain)
+        self.start_node(self.node)
+        self.index('indexed')
+        self.indexed = self.dump('indexed')
+
+    def test_to_below_the_checkpoint_is_refused(self):
+        output = self.index('indexed', 10, 20)
+        self.assertIn('Not reindexing', output)
+        self.assertEqual(self.dump('indexed'), self.indexed)
+
+    def test_range_up_to_the_checkpoint_is_reindexed(self):
+        output = self.index('indexed', 10, self.chain.tip())
+        self.assertIn('Undoing blocks 10 to 40', output)
+        self.assertEqual(self.dump('indexed'), self.indexed)
+
+    def test_from_without_to_reindexes_to_the_tip(self):
+        self.index('indexed', 30)
+        self.assertEqual(self.dump('indexed'), self.indexed)
+
+    def test_to_beyond_an_earlier_checkpoint_extends_it(self):
+        self.index('partial', None, 20)
+        self.index('partial', 10, 30)
+        self.index('partial')
+        self.assertEqual(self.dump('partial'), self.indexed)
+
+    def test_error_message(self):
+        self.use_database('indexed')
+        connection = indexer.connect_database()
+        self.addCleanup(connection.close)
+        cursor = connection.cursor()
+        self.assertIsNone(indexer.reindex_range_error(cursor, 10, None))
+        self.assertIsNone(indexer.reindex_range_error(cursor, None, 20))
+        self.assertIsNone(indexer.reindex_range_error(cursor, 10, 40))
+        self.assertIsNone(indexer.reindex_range_error(cursor, 41, 50))
+        self.assertIn('blocks 21 to 40 would be lost', indexer.reindex_range_error(cursor, 10, 20))
+
+    def test_shards_refuse_a_to_below_the_checkpoint(self):
+        self.use_database('indexed')
+        calls = self.node.get_stats()['calls']
+        _, output = self.quietly(indexer.reindex_in_shards, 2, 10, 20)
+        self.assertIn('Not reindexing', output)
+        self.assertEqual(self.node.get_stats()['calls'], calls)
+        self.assertEqual(self.dump('indexed'), self.indexed)
+
+
+# Reindexing in worker processes, which fetch from the same fake node as the test
+class ShardedReindexTest(IndexerTestCase):
+    def setUp(self):
+        super().setUp()
+        # Few addresses and small blocks, so many outputs are spent several shards after they were made
+        self.chain = fakenode.SyntheticChain(blocks=60, txs_per_block=4, addresses=30)
+        self.start_node(fakenode.FakeNode(self.chain))
+        self.index('sequential')
+        self.sequential = self.dump('sequential')
+
+    def reindex(self, name, from_height=None):
+        self.use_database(name)
+        _, output = self.quietly(indexer.reindex_in_shards, 2, from_height)
+        self.assertNotIn('Error', output)
+        self.assertIn('Merged in', output)
+        # The last few blocks are left to the normal indexer
+        self.index(name)
+
+    def test_spends_cross_shard_boundaries(self):
+        shard_blocks = self.chain.tip() // (2 * indexer.shards_per_process)
+        self.assertTrue(any(spent_height - height > shard_blocks
+                            for _, _, _, _, height, _, spent_height in self.sequential['outputs']
+                            if spent_height is not None))
+
+    def test_into_an_empty_database(self):
+        self.reindex('sharded')
+        self.assertEqual(self.dump('sharded'), self.sequential)
+
+    def test_from_height(self):
+        self.index('sharded')
+        self.reindex('sharded', 25)
+        self.assertEqual(self.dump('sharded'), self.sequential)
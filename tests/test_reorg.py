@@ -0,0 +1,25 @@
+import fakenode
+from tests.helpers import IndexerTestCase
+
+
+class ReorgTest(IndexerTestCase):
+    # (blocks replaced, blocks in the new branch): a longer, an equal and a shorter branch
+    cases = [(1, 1), (3, 5), (6, 2), (10, 10)]
+
+    def test_rolled_back_database_matches_a_fresh_index(self):
+        for depth, new_length in self.cases:
+            with self.subTest(depth=depth, new_length=new_length):
+                chain = fakenode.SyntheticChain(blocks=40, txs_per_block=6, addresses=100, mempool_size=5)
+                self.start_node(fakenode.FakeNode(chain))
+                name = f'reorg-{depth}-{new_length}'
+                self.index(name)
+                old_hashes = list(chain.hashes)
+
+                chain.reorg(depth, new_length)
+                self.assertEqual(chain.hashes[:-new_length], old_hashes[:-depth])
+                self.assertFalse(set(chain.hashes[-new_length:]) & set(old_hashes))
+                self.index(name)
+
+                self.index(f'fresh-{depth}-{new_length}')
+                self.assertEqual(self.dump(name), self.dump(f'fresh-{depth}-{new_length}'))
+                self.assertEqual(self.dump(name)['indexer_state'], [(chain.tip(), bytes.fromhex(chain.hashes[-1]))])